@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks.synthetic import synthetic_aggregators, always_open
+from src import db_session
+from src.backtest import backtest
+from src.condition_parser import parse_condition
+from src.evaluation import load_terms
+from src.fetch_planner import FetchPlanner, moex_now, MOEX_TIMEZONE
+from src.store_keeper import StoreKeeper
+
+CONDITIONS = ("#BENCH.mean[C] > 100", "#BENCH.mean[60T].mean() > #BENCH.mean[1440T].mean()",
+              "#BENCH.high[30T].max() - #BENCH.low[30T].min() > 2 and #BENCH.vol[15T:-1].sum() > 7000",
+              "#BENCH.mean[3H].max() < #BENCH.mean[C]")
+
+
+# Seconds per moment of evaluating the condition candle by candle as the notification tick does
+async def loop_seconds(store_keeper: StoreKeeper, condition, moments: list[int]) -> float:
+    start = time.perf_counter()
+    for moment in moments:
+        planner = FetchPlanner(store_keeper, datetime.fromtimestamp(moment + 59, MOEX_TIMEZONE))
+        values = await load_terms(set(condition.terms()), planner)
+        condition.evaluate(values)
+    return (time.perf_counter() - start) / len(moments)
+
+
+async def run(db_file: Path, days: int, sample: int) -> list[dict]:
+    store_keeper = StoreKeeper(db_file, aggregators=synthetic_aggregators())
+    store_keeper.calendar = always_open()
+    end = moex_now()
+    start = end - timedelta(days=days)
+    results = []
+    for text in CONDITIONS:
+        condition = parse_condition(text)
+        # The first run downloads and stores the synthetic history
+        await backtest(store_keeper, condition, start, end)
+        result = await backtest(store_keeper, condition, start, end)
+        moments = result.moments[::max(1, len(result.moments) // sample)][:sample].tolist()
+        per_moment = await loop_seconds(store_keeper, condition, moments)
+        results.append({"condition": text, "candles": len(result.moments), "fired": len(result.fired),
+                        "episodes": result.episodes, "seconds": result.duration,
+                        "loop_seconds_estimate": per_moment * len(result.moments)})
+    await store_keeper.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Vectorized backtest against candle by candle evaluation")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--sample", type=int, default=200, help="moments evaluated candle by candle")
+    parser.add_argument("--output", type=Path, help="write results as json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = Path(directory) / "bench.sqlite"
+        db_session.global_init(db_file)
+        results = asyncio.run(run(db_file, args.days, args.sample))
+
+    for result in results:
+        print(f"{result['condition']}\n    {result['candles']} candles, fired at {result['fired']}, "
+              f"{result['episodes']} times: {result['seconds']:.2f}s, candle by candle "
+              f"~{result['loop_seconds_estimate']:.0f}s")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.enums import Column
+from src.iss import candles_frame, futoi_frame
+
+FUTOI_COLUMNS = ["sess_id", "seqnum", "tradedate", "tradetime", "ticker", "clgroup", "pos", "pos_long", "pos_short",
+                 "pos_long_num", "pos_short_num", "systime"]
+
+
+# Responses shaped as ISS candles.json pages (500 rows each)
+def generate_candle_pages(count: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    begin = datetime(2023, 1, 2, 10)
+    rows = []
+    for i in range(count):
+        price = 100 + float(rng.normal())
+        rows.append([(begin + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"), price, price + 0.1, price + 0.2,
+                     price - 0.2, float(rng.integers(1, 10_000))])
+    columns = ["begin", "open", "close", "high", "low", "volume"]
+    return [{"columns": columns, "data": rows[i:i + 500]} for i in range(0, count, 500)]
+
+
+# Responses shaped as ISS futoi.json for two days, records of physical and legal entities every 5 minutes
+def generate_futoi_pages(count: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    begin = datetime(2023, 1, 2, 10)
+    rows = []
+    for i in range(count):
+        moment = begin + timedelta(minutes=5 * (i // 2), seconds=int(rng.integers(0, 3)))
+        rows.append([1, i, moment.strftime("%Y-%m-%d"), moment.strftime("%H:%M:%S"), "Si", ("FIZ", "YUR")[i % 2], 0,
+                     int(rng.integers(0, 10 ** 6)), -int(rng.integers(0, 10 ** 6)), int(rng.integers(0, 10 ** 4)),
+                     int(rng.integers(0, 10 ** 4)), "2023-01-02 10:00:00"])
+    return [{"columns": FUTOI_COLUMNS, "data": rows[i:i + 1152]} for i in range(0, count, 1152)]
+
+
+# Parsing as MOEX.download_data did it before the vectorized ingestion
+def legacy_candles_frame(pages: list[dict]) -> pd.DataFrame:
+    data = [dict(zip(page["columns"], row)) for page in pages for row in page["data"]]
+    df = pd.DataFrame(data)
+    df[Column.mean.value] = df.loc[:, ['open', 'close']].mean(axis=1)
+    df = df.drop(['open', 'close'], axis=1)
+    df = df.rename({'begin': Column.index.value}, axis=1)
+
+    def formatter(date: str) -> int:
+        return int(datetime.strptime(date, "%Y-%m-%d %H:%M:%S").timestamp())
+
+    df[Column.index.value] = df[Column.index.value].apply(formatter).astype(np.int64)
+    return df.set_index(Column.index.value)
+
+
+# Parsing as MOEXAnalytical.download_data did it before the vectorized ingestion
+def legacy_futoi_frame(pages: list[dict]) -> pd.DataFrame:
+    df = pd.concat([pd.DataFrame(page["data"], columns=page["columns"]).iloc[::-1] for page in pages])
+    df = df.query("clgroup == 'YUR'")
+    formatter = lambda x: round(datetime.strptime(x, "%Y-%m-%d %H:%M:%S").timestamp() / 300) * 300
+    df[Column.index.value] = df.loc[:, ['tradedate', 'tradetime']].agg(' '.join, axis=1).apply(formatter)
+    df[Column.index.value] = df[Column.index.value].astype(float)
+    df['pos_short'] *= -1
+    df = df.drop(['tradedate', 'tradetime', 'sess_id', 'seqnum', 'systime', 'ticker', 'clgroup', 'pos'], axis=1)
+    df[Column.index.value] = pd.to_datetime(df[Column.index.value], unit='s')
+    df = df.set_index(Column.index.value)
+    df = df.resample("h").mean().dropna(how='all')
+    df = df.reset_index()
+    df[Column.index.value] = (df[Column.index.value] - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    return df.astype(float).set_index(Column.index.value)
+
+
+def rows_per_second(function, pages: list[dict], repeat: int) -> float:
+    rows = sum(len(page["data"]) for page in pages)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(pages)
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rows per second of ISS response parsing before and after "
+                                                 "vectorization")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--candles", type=Path, help="json list of recorded ISS candles blocks")
+    parser.add_argument("--futoi", type=Path, help="json list of recorded ISS futoi blocks")
+    parser.add_argument("--output", type=Path, help="write results as json")
+    args = parser.parse_args()
+
+    candle_pages = json.loads(args.candles.read_text()) if args.candles else generate_candle_pages(args.rows)
+    futoi_pages = json.loads(args.futoi.read_text()) if args.futoi else generate_futoi_pages(args.rows)
+    results = {
+        "candles": {"legacy": rows_per_second(legacy_candles_frame, candle_pages, args.repeat),
+                    "vectorized": rows_per_second(candles_frame, candle_pages, args.repeat)},
+        "futoi": {"legacy": rows_per_second(legacy_futoi_frame, futoi_pages, args.repeat),
+                  "vectorized": rows_per_second(lambda pages: futoi_frame(pages, "hour"), futoi_pages, args.repeat)},
+    }
+    for payload, result in results.items():
+        print(f"{payload:<8} legacy {result['legacy']:>12,.0f} rows/s   "
+              f"vectorized {result['vectorized']:>12,.0f} rows/s   x{result['vectorized'] / result['legacy']:.1f}")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
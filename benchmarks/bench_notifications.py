@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.synthetic import synthetic_aggregators, always_open
+from src import db_session
+from src.condition_parser import parse_condition
+from src.condition_processor import ConditionProcessor
+from src.enums import AggregatorName
+from src.store_keeper import StoreKeeper
+from src.tickers_naming import TickerNaming
+
+TEMPLATES = ("#{ticker}.mean[{window}T].mean() > {threshold}", "#{ticker}.vol[{window}T].sum() > {threshold}",
+             "#{ticker}.high[{window}T].max() > #{ticker}.low[{window}T].min() + {threshold}")
+
+
+# Statements executed by every SQLAlchemy engine of the process
+class QueryCounter:
+    def __init__(self):
+        self.queries = 0
+        event.listen(Engine, "before_cursor_execute", self.count)
+
+    def count(self, *args) -> None:
+        self.queries += 1
+
+
+QUERIES = QueryCounter()
+
+
+# Seconds, downloads and queries of one run of the coroutine, peak of traced allocations if memory is set
+async def measure(store_keeper: StoreKeeper, run, memory: bool = False) -> dict:
+    aggregator = store_keeper.aggregators[AggregatorName.moex.value]
+    downloads, queries = aggregator.downloads, QUERIES.queries
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    await run()
+    result = {"seconds": time.perf_counter() - start, "downloads": aggregator.downloads - downloads,
+              "queries": QUERIES.queries - queries}
+    if memory:
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def make_processor(db_file: Path, latency: float) -> ConditionProcessor:
+    store_keeper = StoreKeeper(db_file, aggregators=synthetic_aggregators(latency))
+    store_keeper.calendar = always_open()
+    return ConditionProcessor(None, store_keeper=store_keeper)
+
+
+# Every workload has its own tickers, so it starts with an empty series store
+async def bench_workload(db_file: Path, prefix: str, notifications: int, tickers: int, window: int, repeat: int,
+                         latency: float) -> dict:
+    namings = [TickerNaming(f"{prefix}T{i}", AggregatorName.moex, "minute") for i in range(tickers)]
+    for i in range(notifications):
+        condition = TEMPLATES[i % len(TEMPLATES)].format(ticker=namings[i % tickers].name, window=window,
+                                                         threshold=i // tickers)
+        StoreKeeper.add_notification(i, str(parse_condition(condition)), condition)
+    result = {"notifications": notifications, "tickers": tickers, "window": window}
+
+    # Series are downloaded from the aggregator
+    processor = make_processor(db_file, latency)
+    result["cold"] = await measure(processor.store_keeper, processor.get_active_notifications)
+    await processor.close()
+
+    # Series are read from the database by a new process
+    processor = make_processor(db_file, latency)
+    result["stored"] = await measure(processor.store_keeper, processor.get_active_notifications)
+    await processor.close()
+    # The first tick of a new process which warmed its series up
+    processor = make_processor(db_file, latency)
+    result["warm_up"] = await measure(processor.store_keeper, processor.warm_up)
+    result["first_tick"] = await measure(processor.store_keeper, processor.get_active_notifications)
+    await processor.close()
+    processor = make_processor(db_file, latency)
+    result["stored"]["peak_bytes"] = (await measure(processor.store_keeper, processor.get_active_notifications,
+                                                    memory=True))["peak_bytes"]
+
+    # Series are cached, conditions are evaluated again or their memoized results are reused
+    async def recompute() -> None:
+        processor.results.clear()
+        await processor.get_active_notifications()
+
+    for phase, run in (("cached", recompute), ("memoized", processor.get_active_notifications)):
+        runs = [await measure(processor.store_keeper, run) for _ in range(repeat)]
+        result[phase] = {key: statistics.median(item[key] for item in runs) for key in runs[0]}
+
+    # Windows read straight from the store keeper
+    async def get_tickers() -> None:
+        for naming in namings:
+            await processor.store_keeper.async_get_ticker(naming, -window, 0)
+
+    result["get_ticker"] = await measure(processor.store_keeper, get_tickers, memory=True)
+    result["get_ticker"]["seconds"] /= tickers
+    result["candle_cache"] = str(processor.store_keeper.candle_cache)
+
+    for id in list(processor.notifications):
+        await processor.remove_notification(id)
+    await processor.close()
+    return result
+
+
+def metadata() -> dict:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = None
+    return {"created": datetime.now(timezone.utc).isoformat(), "revision": revision or None,
+            "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+def workload_key(result: dict) -> tuple:
+    return result["notifications"], result["tickers"], result["window"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tick latency, downloads, queries and memory of notification "
+                                                 "workloads on synthetic candles")
+    parser.add_argument("--notifications", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--tickers", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--windows", type=int, nargs="+", default=[60, 1440], help="minutes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0, help="seconds per synthetic download")
+    parser.add_argument("--output", type=Path, help="write results as json")
+    parser.add_argument("--baseline", type=Path, help="json written by an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = Path(directory) / "bench.sqlite"
+        db_session.global_init(db_file)
+        for notifications in args.notifications:
+            for tickers in args.tickers:
+                for window in args.windows:
+                    results.append(asyncio.run(bench_workload(db_file, f"W{len(results)}", notifications, tickers,
+                                                              window, args.repeat, args.latency)))
+
+    baseline = dict()
+    if args.baseline:
+        baseline = {workload_key(result): result for result in json.loads(args.baseline.read_text())["results"]}
+    print(f"{'notifications':>13}{'tickers':>8}{'window':>7}{'cold, s':>9}{'stored, s':>10}{'warm-up, s':>11}"
+          f"{'first, s':>9}{'cached, ms':>11}{'memo, ms':>9}{'downloads':>10}{'queries':>8}{'peak, MiB':>10}" +
+          (f"{'vs base':>8}" if baseline else ""))
+    for result in results:
+        line = f"{result['notifications']:>13}{result['tickers']:>8}{result['window']:>7}" \
+               f"{result['cold']['seconds']:>9.2f}{result['stored']['seconds']:>10.2f}" \
+               f"{result['warm_up']['seconds']:>11.2f}{result['first_tick']['seconds']:>9.2f}" \
+               f"{result['cached']['seconds'] * 1000:>11.1f}{result['memoized']['seconds'] * 1000:>9.1f}" \
+               f"{result['cold']['downloads']:>10}{result['stored']['queries']:>8}" \
+               f"{result['stored']['peak_bytes'] / 1024 ** 2:>10.1f}"
+        # Ratio of cached tick latency to the one of the baseline
+        if workload_key(result) in baseline:
+            line += f"{result['cached']['seconds'] / baseline[workload_key(result)]['cached']['seconds']:>8.2f}"
+        print(line)
+    if args.output:
+        args.output.write_text(json.dumps({"meta": metadata() | {"arguments": vars(args) | {
+            "output": str(args.output), "baseline": str(args.baseline) if args.baseline else None}},
+            "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
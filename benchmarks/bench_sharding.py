@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.condition_parser import parse_condition
+from src.enums import AggregatorName, Column, EvaluationOutcome
+from src.evaluation import evaluate_conditions
+from src.fetch_planner import FetchPlanner, MOEX_TIMEZONE
+from src.rolling import RollingEngine
+from src.sharding import ShardedEvaluator
+from src.store_keeper import StoreKeeper
+from src.tickers_naming import TickerNaming
+
+# Hour and day windows are resampled from minute candles on every evaluation, which is the CPU-bound part
+TEMPLATES = ("#{ticker}.mean[24H].max() > 100", "#{ticker}.vol[5D].sum() > 1000", "#{ticker}.low[12H:-1].min() < 90",
+             "#{ticker}.high[3D].mean() > #{ticker}.low[3D].mean()", "#{ticker}.mean[60T].mean() > 100")
+NOW = datetime(2023, 10, 20, 12, tzinfo=MOEX_TIMEZONE)
+
+
+# Minute candles of every ticker for the days before NOW, stored and covered so nothing is downloaded
+def populate(db_file: Path, tickers: list[str], days: int, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    store_keeper = StoreKeeper(db_file)
+    end = int((NOW + timedelta(days=1)).timestamp())
+    index = np.arange(int((NOW - timedelta(days=days)).timestamp()), end, 60, dtype=np.int64)
+    for ticker in tickers:
+        mean = 100 + np.cumsum(rng.normal(0, 0.05, len(index)))
+        df = pd.DataFrame({Column.mean.value: mean, Column.vol.value: rng.integers(1, 100, len(index)).astype(float),
+                           Column.high.value: mean + 0.1, Column.low.value: mean - 0.1},
+                          index=pd.Index(index, name=Column.index.value))
+        naming = TickerNaming(ticker, AggregatorName.moex, "minute")
+        store_keeper.add_ticker_to_db(naming, df)
+        store_keeper.add_coverage(naming, float(index[0]), float(end))
+
+
+async def run(workers: int, db_file: Path, conditions: list, ticks: int) -> dict:
+    if workers:
+        evaluator = ShardedEvaluator(workers, db_file)
+        evaluate = evaluator.evaluate
+    else:
+        store_keeper = StoreKeeper(db_file)
+        rolling = RollingEngine()
+
+        async def evaluate(items: list, now: datetime) -> dict:
+            return await evaluate_conditions(items, FetchPlanner(store_keeper, now), rolling)
+
+    # Processes are spawned and series cached during the first tick
+    outcomes = await evaluate(conditions, NOW)
+    assert all(outcome in (EvaluationOutcome.fired, EvaluationOutcome.quiet) for outcome in outcomes.values())
+    start = time.perf_counter()
+    for tick in range(1, ticks + 1):
+        await evaluate(conditions, NOW + timedelta(minutes=tick))
+    duration = time.perf_counter() - start
+    if workers:
+        evaluator.close()
+    return {"workers": workers, "seconds_per_tick": duration / ticks,
+            "conditions_per_second": len(conditions) * ticks / duration}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput of condition evaluation by number of worker processes")
+    parser.add_argument("--tickers", type=int, default=32)
+    parser.add_argument("--days", type=int, default=7, help="days of minute candles, longer than the longest window")
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({0, 1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--output", type=Path, help="write results as json")
+    args = parser.parse_args()
+
+    tickers = [f"BENCH{i}" for i in range(args.tickers)]
+    conditions = [parse_condition(template.format(ticker=ticker)) for ticker in tickers for template in TEMPLATES]
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = Path(directory) / "bench.sqlite"
+        populate(db_file, tickers, args.days)
+        results = [asyncio.run(run(workers, db_file, conditions, args.ticks)) for workers in args.workers]
+
+    baseline = results[0]["conditions_per_second"]
+    for result in results:
+        result["speedup"] = result["conditions_per_second"] / baseline
+        print(f"workers {result['workers']:>3}: {result['seconds_per_tick']:.3f} s/tick, "
+              f"{result['conditions_per_second']:,.0f} conditions/s, x{result['speedup']:.2f}")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
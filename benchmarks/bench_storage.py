@@ -0,0 +1,81 @@
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src import db_session
+from src.candle_storage import CandleStorage, SQLiteStorage, ColumnarStorage
+from src.enums import Column
+
+SERIES = "moex_BENCH_T"
+
+
+def generate_candles(count: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    index = 1_600_000_000 + np.arange(count, dtype=np.int64) * 60
+    mean = 100 + np.cumsum(rng.normal(0, 0.1, count))
+    spread = rng.uniform(0, 0.5, count)
+    return pd.DataFrame({Column.mean.value: mean, Column.vol.value: rng.integers(1, 10_000, count).astype(float),
+                         Column.high.value: mean + spread, Column.low.value: mean - spread},
+                        index=pd.Index(index, name=Column.index.value))
+
+
+def bench_backend(storage: CandleStorage, df: pd.DataFrame, windows: list[int], repeat: int,
+                  chunk: int) -> dict:
+    start = time.perf_counter()
+    for offset in range(0, len(df), chunk):
+        storage.write(SERIES, df.iloc[offset:offset + chunk])
+    result = {"write_seconds": time.perf_counter() - start, "footprint_bytes": storage.footprint(SERIES),
+              "read_seconds": dict()}
+
+    rng = np.random.default_rng(1)
+    index = df.index.to_numpy()
+    for window in windows:
+        latencies = []
+        for _ in range(repeat):
+            first = int(rng.integers(0, len(index) - window))
+            start = time.perf_counter()
+            read = storage.read(SERIES, int(index[first]), int(index[first + window - 1]))
+            # Touch the data so lazily mapped pages are actually read
+            read[Column.mean.value].sum()
+            latencies.append(time.perf_counter() - start)
+            assert len(read) == window
+        result["read_seconds"][window] = statistics.median(latencies)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare range reads and disk footprint of candle storages")
+    parser.add_argument("--candles", type=int, default=500_000)
+    parser.add_argument("--windows", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--chunk", type=int, default=10_000, help="candles per write")
+    parser.add_argument("--output", type=Path, help="write results as json")
+    args = parser.parse_args()
+
+    df = generate_candles(args.candles)
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        db_session.global_init(directory / "bench.sqlite")
+        results = {"candles": args.candles,
+                   "sqlite": bench_backend(SQLiteStorage(), df, args.windows, args.repeat, args.chunk),
+                   "columnar": bench_backend(ColumnarStorage(directory / "columnar"), df, args.windows,
+                                             args.repeat, args.chunk)}
+
+    print(f"{args.candles} candles")
+    print(f"{'backend':<10}{'write, s':>10}{'disk, MiB':>11}" + "".join(f"{f'read {w}, ms':>18}" for w in args.windows))
+    for backend in ("sqlite", "columnar"):
+        result = results[backend]
+        print(f"{backend:<10}{result['write_seconds']:>10.2f}{result['footprint_bytes'] / 1024 ** 2:>11.1f}" +
+              "".join(f"{result['read_seconds'][w] * 1000:>18.3f}" for w in args.windows))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
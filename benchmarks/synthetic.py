@@ -0,0 +1,60 @@
+import asyncio
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.aggregators import Aggregator
+from src.enums import AggregatorName, Column, ToMinutes
+from src.fetch_planner import snap_to_candle, moex_now
+from src.trading_calendar import TradingCalendar
+
+
+# Candles computed from the symbol and the timestamp only, so any range is the same on every download and every run
+class SyntheticAggregator(Aggregator):
+    def __init__(self, latency: float = 0):
+        super().__init__()
+        # Seconds a download would take, spent in the event loop like network waiting
+        self.latency = latency
+        self.downloads = 0
+        self.candles = 0
+
+    async def download_data(self, symbol: str, start: datetime, end: datetime, interval: str,
+                            *args, **kwargs) -> pd.DataFrame | None:
+        self.downloads += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        # Candles of the future aren't there yet
+        end = min(end, moex_now() - self.delay)
+        step = ToMinutes[interval].value * 60
+        first = int(snap_to_candle(start, interval).timestamp())
+        index = np.arange(first + step * (first < start.timestamp()), end.timestamp() + 1, step, dtype=np.int64)
+        if not len(index):
+            return None
+        self.candles += len(index)
+        return candles(symbol, index)
+
+
+def noise(seed: int, index: np.ndarray, salt: int) -> np.ndarray:
+    hashed = (index.astype(np.uint64) * np.uint64(2654435761) + np.uint64(seed + salt * 40503)) % np.uint64(2 ** 32)
+    return hashed.astype(float) / 2 ** 32
+
+
+def candles(symbol: str, index: np.ndarray) -> pd.DataFrame:
+    seed = zlib.crc32(symbol.encode())
+    phase = seed % 1000
+    mean = 100 + 10 * np.sin(index / 86400 + phase) + np.sin(index / 3600 + phase) + noise(seed, index, 0) - 0.5
+    spread = noise(seed, index, 1)
+    return pd.DataFrame({Column.high.value: mean + spread, Column.low.value: mean - spread,
+                         Column.vol.value: np.floor(noise(seed, index, 2) * 1000),
+                         Column.mean.value: mean}, index=pd.Index(index, name=Column.index.value))
+
+
+def synthetic_aggregators(latency: float = 0) -> dict[str, Aggregator]:
+    return {AggregatorName.moex.value: SyntheticAggregator(latency)}
+
+
+# Synthetic candles are there around the clock, so no market is known to be closed
+def always_open() -> TradingCalendar:
+    return TradingCalendar(sessions=dict())
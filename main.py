@@ -4,10 +4,11 @@ from collections import defaultdict
 from typing import Callable, Coroutine
 
 from telegram import Update
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, filters
+from telegram.ext import Application, ApplicationBuilder, ContextTypes, CommandHandler, filters
 
-from src.condition_processor import ConditionProcessor
-from src.config import telegram_key, LOGGER_CONFIG
+from src.condition_processor import ConditionProcessor, TickSummary
+from src.config import telegram_key, backtest_days, LOGGER_CONFIG
+from src.delivery import DeliveryQueue
 from src.dialog_options import DialogLines
 from src.enums import Command, CommandHelpMessage
 from src.exceptions import WrongCondition, NonexistentAggregator, NonexistentNotification
@@ -78,7 +79,7 @@ async def add_condition(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 async def remove_condition(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
-        cond_processor.remove_notification(int(update.message.text.removeprefix("/remove ")))
+        await cond_processor.remove_notification(int(update.message.text.removeprefix("/remove ")))
     except ValueError | NonexistentNotification as e:
         logger.debug(f"WA", exc_info=e)
         await send_default_message(update, DialogLines.wrong_notification_id)
@@ -86,31 +87,75 @@ async def remove_condition(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     await send_default_message(update, DialogLines.removed_rule)
 
 
+async def backtest_condition(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    text = update.message.text.removeprefix(f"/{Command.backtest.value}").strip()
+    days, _, condition = text.partition(" ")
+    if not days.isdigit():
+        days, condition = backtest_days, text
+    try:
+        result = await cond_processor.backtest(condition, int(days))
+    except NameError | SyntaxError | WrongCondition as e:
+        logger.debug("WC", exc_info=e)
+        await send_default_message(update, DialogLines.wrong_condition_syntax)
+        return
+    except NonexistentAggregator as e:
+        logger.debug("NEA", exc_info=e)
+        await update.message.reply_text(e.args[0])
+        return
+    except ValueError as e:
+        logger.debug("WBP", exc_info=e)
+        await send_default_message(update, DialogLines.wrong_backtest_period)
+        return
+    except Exception as e:
+        logger.error("Something wrong with backtest", exc_info=e)
+        return
+    text = f"Over the last {days} days the condition held at {len(result.fired)} of {len(result.moments)} " \
+           f"candles and was activated {result.episodes} times"
+    if len(result.fired):
+        text += "\n\nLast activations:\n" + "\n".join(moment.strftime("%Y-%m-%d %H:%M")
+                                                     for moment in result.fired_at()[-10:])
+    await update.message.reply_text(text)
+
+
 async def notification(context: ContextTypes.DEFAULT_TYPE) -> None:
-    active_notifications = await cond_processor.get_active_notifications()
-    if not active_notifications:
+    summary: TickSummary = context.job.data
+    logger.info(f"Tick summary: {summary}")
+    if not summary.fired:
         return
 
     texts_by_chats = defaultdict(list)
-    for notification in active_notifications:
+    for notification in summary.fired:
         texts_by_chats[notification.chat_id].append(notification.origin_condition)
 
     logger.debug(f"Sending notification to the following chats: {', '.join(map(str, texts_by_chats.keys()))}")
     for chat_id, conditions in texts_by_chats.items():
         text = "Following conditions activated:\n\n"
         text += '\n\n'.join(conditions)
-        await context.bot.send_message(chat_id, text)
+        delivery_queue.submit(chat_id, text)
+    logger.info(f"Delivery: {delivery_queue}")
+
+
+async def startup(application: Application) -> None:
+    await delivery_queue.start()
+    await cond_processor.start()
+
+
+async def shutdown(application: Application) -> None:
+    await cond_processor.close()
+    await delivery_queue.close()
 
 
 if __name__ == '__main__':
-    application = ApplicationBuilder().token(telegram_key).build()
+    application = ApplicationBuilder().token(telegram_key).post_init(startup).post_shutdown(shutdown).build()
 
     cond_processor = ConditionProcessor(application.job_queue, notification)
+    delivery_queue = DeliveryQueue(application.bot)
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler(Command.help.value, help_message))
     application.add_handler(CommandHandler(Command.list.value, list_conditions))
     application.add_handler(CommandHandler(Command.add.value, add_condition))
     application.add_handler(CommandHandler(Command.remove.value, remove_condition))
+    application.add_handler(CommandHandler(Command.backtest.value, backtest_condition))
 
     logger.debug("Starting application")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
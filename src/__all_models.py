@@ -1 +1,2 @@
 import src.tickers
+import src.coverage
@@ -1,25 +1,70 @@
 import asyncio
 import logging
-# import time
+import time
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import Awaitable
 # from enum import Enum
 
 import aiohttp
-import aiomoex
-import numpy as np
 import pandas as pd
 # import yfinance
 # from polygon import StocksClient
 
-from src.config import moex_login_password, polygon_key
-from src.enums import Column, MOEXInterval, DBInterval, ToMinutes, YfinanceInterval, PolygonInterval
+from src.config import moex_login_password, polygon_key, http_pool_size, http_keepalive_timeout, dns_cache_ttl, \
+    moex_auth_ttl
+from src.enums import MOEXInterval, ToMinutes, YfinanceInterval, PolygonInterval
+from src.iss import ISS_URL, CANDLE_COLUMNS, candles_frame, futoi_frame
+from src.request_scheduler import RequestScheduler
 
 logger = logging.getLogger("submodule")
+MOEX_PASSPORT_URL = "https://passport.moex.com/authenticate"
+MOEX_PASSPORT_COOKIE = "MicexPassportCert"
 
 
 class Aggregator:
-    def __init__(self):
+    # Data newer than now - delay may be not published yet
+    delay = timedelta(0)
+
+    def __init__(self, scheduler: RequestScheduler | None = None):
         logger.debug(f"{self.__class__.__name__} init")
+        self.scheduler = scheduler or RequestScheduler()
+        self._session: aiohttp.ClientSession | None = None
+        self._session_loop: asyncio.AbstractEventLoop | None = None
+        # Closing of the session of a previous event loop
+        self._stale: asyncio.Task | None = None
+
+    # Long-lived session with keep-alive connection pool, created on first use
+    def get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            if self._session is not None and not self._session.closed and self._session.connector is not None:
+                # Connections of the session of the previous loop are dropped at once
+                closing = self._session.connector.close()
+                self._session.detach()
+                self._stale = loop.create_task(self._wait_closed(closing))
+            connector = aiohttp.TCPConnector(limit=http_pool_size, keepalive_timeout=http_keepalive_timeout,
+                                             ttl_dns_cache=dns_cache_ttl)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    # Waiting for connections of another loop fails if that loop doesn't run anymore
+    @staticmethod
+    async def _wait_closed(closing: Awaitable[None]) -> None:
+        try:
+            await closing
+        except RuntimeError:
+            pass
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self._stale is not None and self._stale.get_loop() is asyncio.get_running_loop():
+            await self._stale
+        self._session = None
+        self._session_loop = None
+        self._stale = None
 
     def download_data(self, symbol: str, start: datetime, end: datetime, interval: str,
                       *args, **kwargs) -> pd.DataFrame | None:
@@ -102,8 +147,11 @@ class Aggregator:
 
 
 class MOEX(Aggregator):
-    def __init__(self):
-        super().__init__()
+    delay = timedelta(minutes=15)
+
+    def __init__(self, scheduler: RequestScheduler | None = None, iss_url: str = ISS_URL):
+        super().__init__(scheduler)
+        self.iss_url = iss_url
 
     async def download_data(self, symbol: str, start: datetime, end: datetime, interval: str,
                             *args, **kwargs) -> pd.DataFrame | None:
@@ -113,68 +161,83 @@ class MOEX(Aggregator):
         market = kwargs["market"] if "market" in kwargs else "shares"
         engine = kwargs["engine"] if "engine" in kwargs else "stock"
 
-        async with aiohttp.ClientSession() as session:
-            data = await aiomoex.get_market_candles(session, symbol, interval.value, start.strftime("%Y-%m-%d"),
-                                                    end.strftime("%Y-%m-%d"), market=market, engine=engine)
-            df = pd.DataFrame(data)
-            if df is None or df.empty:
-                return None
-            df[Column.mean.value] = df.loc[:, ['open', 'close']].mean(axis=1)
-            df = df.drop(['open', 'close', 'end', 'value'], axis=1)
-            df = df.rename({'begin': Column.index.value}, axis=1)
-
-            def formatter(date: str) -> int:
-                return int(datetime.strptime(date, "%Y-%m-%d %H:%M:%S").timestamp())
-
-            df[Column.index.value] = df[Column.index.value].apply(formatter).astype(np.int64)
-            df = df.set_index(Column.index.value)
-        return df
+        url = f"{self.iss_url}/engines/{engine}/markets/{market}/securities/{symbol}/candles.json"
+        params = {"from": start.strftime("%Y-%m-%d %H:%M:%S"), "till": end.strftime("%Y-%m-%d %H:%M:%S"),
+                  "interval": interval.value, "iss.meta": "off", "candles.columns": ",".join(CANDLE_COLUMNS)}
+        blocks = []
+        offset = 0
+        # ISS returns candles by pages
+        while True:
+            response = await self.scheduler.get_json(self.get_session(), url, params=params | {"start": offset})
+            block = response["candles"]
+            if not block["data"]:
+                break
+            blocks.append(block)
+            offset += len(block["data"])
+        return candles_frame(blocks)
 
 
 class MOEXAnalytical(Aggregator):
-    def __init__(self):
-        super().__init__()
-
-    @staticmethod
-    async def fetch_2_day_data(session: aiohttp.ClientSession, symbol: str, start_from: datetime) -> pd.DataFrame:
-        url = f"https://iss.moex.com/iss/analyticalproducts/futoi/securities/{symbol}.json?" \
-              f"from={start_from.strftime('%Y-%m-%d')}&till={(start_from + timedelta(1)).strftime('%Y-%m-%d')}"
-        async with session.get(url) as response:
-            data = await response.json()
-            return pd.DataFrame(data['futoi']['data'], columns=data['futoi']['columns']).iloc[::-1]
+    delay = timedelta(minutes=5)
+
+    def __init__(self, scheduler: RequestScheduler | None = None, iss_url: str = ISS_URL,
+                 passport_url: str = MOEX_PASSPORT_URL):
+        super().__init__(scheduler)
+        self.iss_url = iss_url
+        self.passport_url = passport_url
+        self._auth_expires = 0.
+        self._auth_lock: asyncio.Lock | None = None
+        self._auth_session: aiohttp.ClientSession | None = None
+
+    def _passport_ttl(self, session: aiohttp.ClientSession) -> float:
+        for cookie in session.cookie_jar:
+            if cookie.key != MOEX_PASSPORT_COOKIE:
+                continue
+            if cookie["max-age"]:
+                return float(cookie["max-age"])
+            if cookie["expires"]:
+                return parsedate_to_datetime(cookie["expires"]).timestamp() - time.time()
+        return moex_auth_ttl
+
+    # Log in once and reuse the passport cookie of the session until it expires
+    async def authenticate(self, force: bool = False) -> None:
+        session = self.get_session()
+        if self._auth_session is not session:
+            self._auth_lock = asyncio.Lock()
+            self._auth_session = session
+            self._auth_expires = 0.
+        async with self._auth_lock:
+            if not force and time.monotonic() < self._auth_expires:
+                return
+            await self.scheduler.request(session, "GET", self.passport_url,
+                                         auth=aiohttp.BasicAuth(*moex_login_password))
+            self._auth_expires = time.monotonic() + self._passport_ttl(session)
+            logger.debug("Authenticated in MOEX passport")
+
+    async def fetch_2_day_data(self, symbol: str, start_from: datetime) -> dict:
+        url = f"{self.iss_url}/analyticalproducts/futoi/securities/{symbol}.json"
+        params = {"from": start_from.strftime('%Y-%m-%d'), "till": (start_from + timedelta(1)).strftime('%Y-%m-%d')}
+        try:
+            return (await self.scheduler.get_json(self.get_session(), url, params=params))['futoi']
+        except aiohttp.ClientResponseError as error:
+            if error.status not in (401, 403):
+                raise
+        # Passport expired earlier than expected
+        await self.authenticate(force=True)
+        return (await self.scheduler.get_json(self.get_session(), url, params=params))['futoi']
 
     async def download_data(self, symbol: str, start: datetime, end: datetime, interval: str,
                             *args, **kwargs) -> pd.DataFrame | None:
         super().download_data(symbol, start, end, interval, *args, **kwargs)
 
-        interval = MOEXInterval[interval]
-
-        if datetime.now() - start < timedelta(minutes=5):
+        if datetime.now(start.tzinfo) - start < timedelta(minutes=5):
             return None
 
-        async with aiohttp.ClientSession() as session:
-            await session.get("https://passport.moex.com/authenticate", auth=aiohttp.BasicAuth(*moex_login_password))
-
-            all_df = []
-            while start.date() <= end.date():
-                all_df.append(self.fetch_2_day_data(session, symbol, start))
-                start += timedelta(2)
-
-            df = pd.concat(await asyncio.gather(*all_df, return_exceptions=True))
-            df = df.query("clgroup == 'YUR'")
-            formatter = lambda x: round(datetime.strptime(x, "%Y-%m-%d %H:%M:%S").timestamp() / 300) * 300
-            df[Column.index.value] = df.loc[:, ['tradedate', 'tradetime']].agg(' '.join, axis=1).apply(formatter)
-            df[Column.index.value] = df[Column.index.value].astype(float)
-            df['pos_short'] *= -1
-
-            df = df.drop(['tradedate', 'tradetime', 'sess_id', 'seqnum', 'systime', 'ticker', 'clgroup', 'pos'], axis=1)
-            df = df.rename({'pos_long': Column.long.value, 'pos_short': Column.short.value,
-                            'pos_long_num': Column.long_numb.value, 'pos_short_num': Column.short_numb.value}, axis=1)
-            df[Column.index.value] = pd.to_datetime(df[Column.index.value], unit='s')
-            df = df.set_index(Column.index.value)
-            df = df.resample(DBInterval[interval.name].value).mean().dropna(how='all')
-            df = df.reset_index()
-            df[Column.index.value] = df[Column.index.value].values.astype(np.int64) // 10 ** 9
-            df = df.astype(float)
-            df = df.set_index(Column.index.value)
-            return df
+        await self.authenticate()
+
+        all_blocks = []
+        while start.date() <= end.date():
+            all_blocks.append(self.fetch_2_day_data(symbol, start))
+            start += timedelta(2)
+
+        return futoi_frame(await asyncio.gather(*all_blocks), interval)
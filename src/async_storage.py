@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+import pandas as pd
+
+from src.candle_storage import CandleStorage
+from src.config import db_threads, db_write_batch
+
+logger = logging.getLogger("submodule")
+T = TypeVar("T")
+# Coverage ranges to persist by storing name
+CoverageRanges = dict[str, list[tuple[float, float]]]
+
+
+# Runs blocking database work on a bounded thread pool, so the event loop keeps serving while the disk is busy.
+# Every write goes through a single writer task, which groups queued candle writes into one transaction
+class AsyncStorage:
+    def __init__(self, storage: CandleStorage, save_coverage: Callable[[CoverageRanges], None],
+                 threads: int = db_threads, batch: int = db_write_batch):
+        self.storage = storage
+        self.save_coverage = save_coverage
+        # A backend which can't read during a write gets a single thread, which orders its reads and writes
+        self.threads = threads if storage.concurrent_reads else 1
+        self.batch = batch
+        self.executor: ThreadPoolExecutor | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.queue: asyncio.Queue | None = None
+        self.writer: asyncio.Task | None = None
+        # Transactions of candles committed and writes grouped into them
+        self.transactions = 0
+        self.writes = 0
+
+    def __str__(self) -> str:
+        return f"{self.writes} writes in {self.transactions} transactions"
+
+    async def run(self, function: Callable[..., T], *args) -> T:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix="db")
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def read(self, storing_name: str, start: float, end: float) -> pd.DataFrame | None:
+        return await self.run(self.storage.read, storing_name, start, end)
+
+    # Upsert candles, done once the transaction they are grouped into commits
+    async def write(self, storing_name: str, df: pd.DataFrame) -> None:
+        await self._enqueue("candles", (storing_name, df))
+
+    # Persist the whole coverage of a series. Only the latest ranges of a series in a batch are written
+    async def cover(self, storing_name: str, ranges: list[tuple[float, float]]) -> None:
+        await self._enqueue("coverage", (storing_name, list(ranges)))
+
+    # Other writes run on the writer in their order, so they never compete with candle transactions for the lock
+    async def execute(self, function: Callable[..., T], *args) -> T:
+        return await self._enqueue("call", (function, args))
+
+    async def _enqueue(self, kind: str, payload: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if self.writer is None or self.writer.done() or self.loop is not loop:
+            self.loop, self.queue = loop, asyncio.Queue()
+            self.writer = loop.create_task(self._write_loop())
+        future = loop.create_future()
+        self.queue.put_nowait((kind, payload, future))
+        return await future
+
+    async def _write_loop(self) -> None:
+        while True:
+            items = [await self.queue.get()]
+            while len(items) < self.batch and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            try:
+                await self._write_batch(items)
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    async def _write_batch(self, items: list[tuple[str, Any, asyncio.Future]]) -> None:
+        candles = [payload for kind, payload, _ in items if kind == "candles"]
+        coverage = dict(payload for kind, payload, _ in items if kind == "coverage")
+        grouped = [future for kind, _, future in items if kind != "call"]
+        if grouped:
+            try:
+                await self.run(self._flush, candles, coverage)
+            except Exception as e:
+                logger.error(f"Writing {len(candles)} series failed: {e}")
+                self._settle(grouped, exception=e)
+            else:
+                self._settle(grouped)
+        for kind, payload, future in items:
+            if kind != "call":
+                continue
+            function, args = payload
+            try:
+                self._settle([future], await self.run(function, *args))
+            except Exception as e:
+                self._settle([future], exception=e)
+
+    def _flush(self, candles: list[tuple[str, pd.DataFrame]], coverage: CoverageRanges) -> None:
+        # Candles are committed before the coverage which claims them
+        if candles:
+            self.storage.write_many(candles)
+            self.transactions += 1
+            self.writes += len(candles)
+        if coverage:
+            self.save_coverage(coverage)
+
+    @staticmethod
+    def _settle(futures: list[asyncio.Future], result: Any = None, exception: Exception | None = None) -> None:
+        for future in futures:
+            # The waiting caller may be cancelled already
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    # Wait for queued writes and release the threads
+    async def close(self) -> None:
+        if self.writer is not None and self.loop is asyncio.get_running_loop():
+            await self.queue.join()
+            self.writer.cancel()
+        self.writer = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,144 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.condition_parser import Node, Term
+from src.config import moex_timezone
+from src.enums import ToMinutes
+from src.fetch_planner import FetchPlanner, SeriesKey, snap_to_candle, MOEX_TIMEZONE
+from src.iss import floor_wall_time, to_timestamps
+from src.tickers_naming import TickerNaming
+
+logger = logging.getLogger("submodule")
+
+
+@dataclass
+class BacktestResult:
+    condition: Node
+    start: datetime
+    end: datetime
+    # Timestamps of candles the condition was evaluated at and of those it held at
+    moments: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    fired: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    # Times the condition turned from false to true
+    episodes: int = 0
+    duration: float = 0
+
+    def __str__(self) -> str:
+        return f"held at {len(self.fired)} of {len(self.moments)} candles, {self.episodes} times, " \
+               f"in {self.duration:.2f}s"
+
+    def fired_at(self) -> list[datetime]:
+        return [datetime.fromtimestamp(timestamp, MOEX_TIMEZONE) for timestamp in self.fired.tolist()]
+
+
+def span(timespan: str) -> int:
+    return ToMinutes[timespan].value * 60
+
+
+# Start of the candle of the time span every timestamp belongs to
+def anchors(timestamps: np.ndarray, timespan: str) -> np.ndarray:
+    if timespan == "minute":
+        return timestamps - timestamps % 60
+    wall_time = pd.to_datetime(timestamps, unit="s", utc=True).tz_convert(moex_timezone).tz_localize(None)
+    return to_timestamps(floor_wall_time(wall_time, timespan))
+
+
+# Extremes of values[lo:hi] for every pair of bounds from a sparse table of extremes of power of two lengths
+def range_extremes(values: np.ndarray, lo: np.ndarray, hi: np.ndarray, longest: int, function: str) -> np.ndarray:
+    reduce, fill = (np.fmax, -np.inf) if function == "max" else (np.fmin, np.inf)
+    table = [np.where(np.isnan(values), fill, values)]
+    while 2 ** len(table) <= longest:
+        step = 2 ** (len(table) - 1)
+        table.append(reduce(table[-1][:-step], table[-1][step:]))
+
+    sizes = hi - lo
+    result = np.full(len(lo), np.nan)
+    levels = np.zeros(len(lo), dtype=np.int64)
+    levels[sizes > 0] = np.log2(sizes[sizes > 0]).astype(np.int64)
+    for level, extremes in enumerate(table):
+        selected = (sizes > 0) & (levels == level)
+        result[selected] = reduce(extremes[lo[selected]], extremes[hi[selected] - 2 ** level])
+    # Windows of missing values only
+    result[np.isinf(result)] = np.nan
+    return result
+
+
+# Value of the term at every moment, as the live evaluation at the close of the candle starting at the moment
+# would see it, except that a candle of a longer time span counts once it's closed, so nothing is looked ahead
+def term_values(term: Term, df: pd.DataFrame | None, moments: np.ndarray, closes: np.ndarray) -> np.ndarray:
+    if df is None or df.empty or term.column.value not in df.columns:
+        return np.full(len(moments), np.nan)
+    index = df.index.to_numpy(dtype=np.int64)
+    values = df[term.column.value].to_numpy(dtype=float)
+    anchor = anchors(moments, term.timespan)
+    start, end = term.window
+    hi = np.minimum(index.searchsorted(anchor + end * span(term.timespan), side="right"),
+                    index.searchsorted(closes - span(term.timespan), side="right"))
+    lo = np.minimum(index.searchsorted(anchor + start * span(term.timespan), side="left"), hi)
+    if term.function is None:
+        result = np.full(len(moments), np.nan)
+        result[hi > lo] = values[hi[hi > lo] - 1]
+        return result
+
+    # Only the last length candles of the window are aggregated
+    lo = np.maximum(lo, hi - term.length)
+    if term.function in ("max", "min"):
+        return range_extremes(values, lo, hi, term.length, term.function)
+    present = ~np.isnan(values)
+    totals = np.concatenate(([0.], np.cumsum(np.where(present, values, 0.))))
+    counts = np.concatenate(([0], np.cumsum(present)))
+    total, count = totals[hi] - totals[lo], counts[hi] - counts[lo]
+    if term.function == "sum":
+        return total
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+# Range of timestamps the term reads for moments between start and end
+def term_range(term: Term, start: datetime, end: datetime) -> tuple[float, float]:
+    first, last = term.window
+    return (snap_to_candle(start, term.timespan).timestamp() + first * span(term.timespan),
+            snap_to_candle(end, term.timespan).timestamp() + last * span(term.timespan))
+
+
+# Evaluate the condition at every candle of its shortest time span between start and end over stored history
+async def backtest(store_keeper, condition: Node, start: datetime, end: datetime) -> BacktestResult:
+    started = time.monotonic()
+    terms = set(condition.terms())
+    ranges: dict[SeriesKey, tuple[float, float]] = dict()
+    namings: dict[SeriesKey, TickerNaming] = dict()
+    for term in terms:
+        key = FetchPlanner.series_key(term.naming)
+        first, last = term_range(term, start, end)
+        if key in ranges:
+            first, last = min(first, ranges[key][0]), max(last, ranges[key][1])
+        ranges[key], namings[key] = (first, last), term.naming
+    frames = {key: await store_keeper.async_get_range(namings[key], *ranges[key]) for key in ranges}
+
+    # Every candle of the series of the shortest time span is a moment
+    shortest = min((term.timespan for term in terms), key=lambda timespan: ToMinutes[timespan].value)
+    indexes = [df.index.to_numpy(dtype=np.int64) for key, df in frames.items()
+               if namings[key].timespan == shortest and df is not None]
+    moments = np.unique(np.concatenate(indexes)) if indexes else np.empty(0, dtype=np.int64)
+    moments = moments[(start.timestamp() <= moments) & (moments < end.timestamp())]
+    result = BacktestResult(condition, start, end, moments)
+    if not len(moments):
+        result.duration = time.monotonic() - started
+        return result
+
+    closes = moments + span(shortest)
+    values = {term: term_values(term, frames[FetchPlanner.series_key(term.naming)], moments, closes)
+              for term in terms}
+    with np.errstate(all="ignore"):
+        held = np.broadcast_to(condition.evaluate_array(values), moments.shape)
+    held = held.astype(bool) if held.dtype == bool else (held != 0) & ~np.isnan(held)
+    result.fired = moments[held]
+    result.episodes = int(np.count_nonzero(held[1:] & ~held[:-1]) + held[0])
+    result.duration = time.monotonic() - started
+    logger.debug(f"Backtest of {condition}: {result}")
+    return result
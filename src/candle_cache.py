@@ -0,0 +1,95 @@
+import logging
+import mmap
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("submodule")
+
+
+# Whether the values are a view of a memory-mapped file, which the OS pages in and out on its own
+def is_mapped(values: np.ndarray) -> bool:
+    while isinstance(values.base, np.ndarray):
+        values = values.base
+    return isinstance(values.base, mmap.mmap)
+
+
+# Bytes the frame holds in memory
+def resident_size(df: pd.DataFrame) -> int:
+    arrays = [df.index.to_numpy()] + [df[column].to_numpy() for column in df.columns]
+    return sum(values.nbytes for values in arrays if not is_mapped(values))
+
+
+@dataclass
+class CachedSeries:
+    df: pd.DataFrame
+    # Every stored candle of [start, end] is in df
+    start: float
+    end: float
+    size: int
+
+
+# Recent candles of hot series in memory. Least recently used series are evicted when the budget is exceeded
+class CandleCache:
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.size = 0
+        self.series: OrderedDict[str, CachedSeries] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __str__(self) -> str:
+        return f"{len(self.series)} series, {self.size / 1024 ** 2:.1f} MiB, hits {self.hits}, " \
+               f"misses {self.misses}, evictions {self.evictions}"
+
+    @staticmethod
+    def _slice(df: pd.DataFrame, start: float, end: float) -> pd.DataFrame:
+        return df.iloc[df.index.searchsorted(start, side="left"):df.index.searchsorted(end, side="right")]
+
+    def get(self, storing_name: str, start: float, end: float) -> pd.DataFrame | None:
+        item = self.series.get(storing_name)
+        if item is None or start < item.start or item.end < end:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.series.move_to_end(storing_name)
+        return self._slice(item.df, start, end)
+
+    def _set(self, storing_name: str, df: pd.DataFrame, start: float, end: float) -> None:
+        self.invalidate(storing_name)
+        item = CachedSeries(df, start, end, resident_size(df))
+        if item.size > self.budget:
+            return
+        self.series[storing_name] = item
+        self.size += item.size
+        while self.size > self.budget:
+            _, evicted = self.series.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+    def _merge(self, storing_name: str, df: pd.DataFrame, start: float, end: float) -> bool:
+        item = self.series.get(storing_name)
+        if item is None or end < item.start or item.end < start:
+            return False
+        cached = item.df
+        df = pd.concat([cached.iloc[:cached.index.searchsorted(start, side="left")], df,
+                        cached.iloc[cached.index.searchsorted(end, side="right"):]])
+        self._set(storing_name, df, min(start, item.start), max(end, item.end))
+        return True
+
+    # df holds every stored candle of [start, end]
+    def put(self, storing_name: str, df: pd.DataFrame, start: float, end: float) -> None:
+        if not self._merge(storing_name, df, start, end):
+            self._set(storing_name, df, start, end)
+
+    # Candles of [start, end] were written to storage
+    def write(self, storing_name: str, df: pd.DataFrame, start: float, end: float) -> None:
+        self._merge(storing_name, df.sort_index(), start, end)
+
+    def invalidate(self, storing_name: str) -> None:
+        item = self.series.pop(storing_name, None)
+        if item is not None:
+            self.size -= item.size
@@ -0,0 +1,287 @@
+import logging
+import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+from sqlalchemy import text, select
+from sqlalchemy.dialects.sqlite import insert
+
+from src import db_session
+from src.enums import Column
+
+logger = logging.getLogger("submodule")
+# Value of PRAGMA auto_vacuum letting free pages be returned step by step
+INCREMENTAL_VACUUM = 2
+# Rows converted and inserted at once. Short steps leave the interpreter to the event loop thread between them
+WRITE_CHUNK = 5000
+
+
+# Keeps candle history of series by their storing names. Every backend returns candles sorted by datetime
+class CandleStorage(ABC):
+    # Whether reads may run in other threads while a write is going on
+    concurrent_reads = False
+
+    def __init__(self):
+        logger.debug(f"{self.__class__.__name__} init")
+
+    # Upsert candles, candles with the same datetime are replaced
+    @abstractmethod
+    def write(self, storing_name: str, df: pd.DataFrame) -> None:
+        ...
+
+    # Write candles of several series at once, in one transaction if the backend has them
+    def write_many(self, items: list[tuple[str, pd.DataFrame]]) -> None:
+        for storing_name, df in items:
+            self.write(storing_name, df)
+
+    @abstractmethod
+    def read(self, storing_name: str, start: float, end: float) -> pd.DataFrame | None:
+        ...
+
+    # Delete at most limit oldest candles starting before end, returns the number of deleted ones
+    @abstractmethod
+    def delete(self, storing_name: str, end: float, limit: int) -> int:
+        ...
+
+    # Return at most the given number of free pages to the file system, returns their bytes
+    def vacuum(self, pages: int) -> int:
+        return 0
+
+    # Drop state kept of the series, another process wrote it
+    def forget(self, storing_name: str) -> None:
+        pass
+
+    # Bytes the series takes on disk
+    @abstractmethod
+    def footprint(self, storing_name: str) -> int:
+        ...
+
+    def migrate(self, storing_names: list[str]) -> None:
+        pass
+
+
+# One SQLite table keyed by datetime per series. WAL lets readers work during a write
+class SQLiteStorage(CandleStorage):
+    concurrent_reads = True
+
+    def __init__(self):
+        super().__init__()
+        self.metadata = sa.MetaData()
+        # Metadata is shared by reading and writing threads
+        self.lock = threading.Lock()
+
+    # Candle table keyed by datetime. Reflected if exists, created if columns are given
+    def get_table(self, storing_name: str, columns: list[str] | None = None) -> sa.Table | None:
+        with self.lock:
+            return self._get_table(storing_name, columns)
+
+    def _get_table(self, storing_name: str, columns: list[str] | None = None) -> sa.Table | None:
+        if storing_name in self.metadata.tables:
+            return self.metadata.tables[storing_name]
+        with db_session.create_connection() as connection:
+            if sa.inspect(connection).has_table(storing_name):
+                return sa.Table(storing_name, self.metadata, autoload_with=connection)
+            if columns is None:
+                return None
+            table = sa.Table(storing_name, self.metadata,
+                             sa.Column(Column.index.value, sa.Integer, primary_key=True),
+                             *(sa.Column(column, sa.Float) for column in columns))
+            table.create(connection)
+            connection.commit()
+        return table
+
+    # Tables written before candle tables had a primary key contain duplicated candles.
+    # Rebuild them keyed by datetime keeping the last written candle
+    def migrate(self, storing_names: list[str]) -> None:
+        for storing_name in storing_names:
+            with db_session.create_connection() as connection:
+                inspector = sa.inspect(connection)
+                if not inspector.has_table(storing_name) or \
+                        inspector.get_pk_constraint(storing_name)["constrained_columns"]:
+                    continue
+                logger.info(f"Compacting candle table {storing_name}")
+                legacy = sa.Table(storing_name, sa.MetaData(), autoload_with=connection)
+                columns = [column.name for column in legacy.columns if column.name != Column.index.value]
+                compacted = sa.Table(f"{storing_name}_compacted", sa.MetaData(),
+                                     sa.Column(Column.index.value, sa.Integer, primary_key=True),
+                                     *(sa.Column(column, sa.Float) for column in columns))
+                compacted.create(connection)
+                names = [Column.index.value] + columns
+                connection.execute(insert(compacted).prefix_with("OR REPLACE").from_select(
+                    names, select(*(legacy.c[name] for name in names)).order_by(text("rowid"))))
+                legacy.drop(connection)
+                connection.execute(text(f'ALTER TABLE "{compacted.name}" RENAME TO "{storing_name}"'))
+                connection.commit()
+
+    def write(self, storing_name: str, df: pd.DataFrame) -> None:
+        self.write_many([(storing_name, df)])
+
+    def write_many(self, items: list[tuple[str, pd.DataFrame]]) -> None:
+        tables = [self.get_table(storing_name, list(df.columns)) for storing_name, df in items]
+        with db_session.create_connection() as connection:
+            for table, (_, df) in zip(tables, items):
+                statement = insert(table)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[Column.index.value],
+                    set_={column.name: statement.excluded[column.name] for column in table.columns
+                          if not column.primary_key})
+                for offset in range(0, len(df), WRITE_CHUNK):
+                    chunk = df.iloc[offset:offset + WRITE_CHUNK].reset_index()
+                    chunk[Column.index.value] = chunk[Column.index.value].astype(np.int64)
+                    chunk = chunk.astype(object).where(chunk.notna(), None)
+                    connection.execute(statement, chunk.to_dict("records"))
+            connection.commit()
+
+    def read(self, storing_name: str, start: float, end: float) -> pd.DataFrame | None:
+        table = self.get_table(storing_name)
+        if table is None:
+            return None
+        request = select(table).where(table.c[Column.index.value].between(start, end)) \
+            .order_by(table.c[Column.index.value])
+        with db_session.create_connection() as connection:
+            df = pd.read_sql(request, connection, index_col=Column.index.value)
+        return df
+
+    def footprint(self, storing_name: str) -> int:
+        with db_session.create_connection() as connection:
+            return connection.execute(text("SELECT coalesce(sum(pgsize), 0) FROM dbstat WHERE name = :name"),
+                                      {"name": storing_name}).scalar()
+
+    def delete(self, storing_name: str, end: float, limit: int) -> int:
+        table = self.get_table(storing_name)
+        if table is None:
+            return 0
+        index = table.c[Column.index.value]
+        with db_session.create_connection() as connection:
+            deleted = connection.execute(sa.delete(table).where(
+                index.in_(select(index).where(index < end).order_by(index).limit(limit)))).rowcount
+            connection.commit()
+        return deleted
+
+    # Pages freed by deletes are reused by later writes. They are only returned to the file system in databases
+    # created with incremental auto vacuum
+    def vacuum(self, pages: int) -> int:
+        with db_session.create_connection() as connection:
+            if connection.execute(text("PRAGMA auto_vacuum")).scalar() != INCREMENTAL_VACUUM:
+                return 0
+            page_size = connection.execute(text("PRAGMA page_size")).scalar()
+            before = connection.execute(text("PRAGMA page_count")).scalar()
+            connection.execute(text(f"PRAGMA incremental_vacuum({int(pages)})"))
+            connection.commit()
+            return (before - connection.execute(text("PRAGMA page_count")).scalar()) * page_size
+
+
+# Directory per series with an append-only binary file per column, memory-mapped on read.
+# Candles newer than the stored ones are appended, any other write rewrites the series
+class ColumnarStorage(CandleStorage):
+    index_dtype = np.dtype(np.int64)
+    column_dtype = np.dtype(np.float64)
+
+    def __init__(self, directory: Path):
+        super().__init__()
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Inode and size of the index file when it was mapped, index and columns by storing name
+        self.mapped: dict[str, tuple[tuple[int, int], np.ndarray, dict[str, np.ndarray]]] = dict()
+
+    def forget(self, storing_name: str) -> None:
+        self.mapped.pop(storing_name, None)
+
+    def _index_file(self, storing_name: str) -> Path:
+        return self.directory / storing_name / f"{Column.index.value}.bin"
+
+    def _column_files(self, storing_name: str) -> dict[str, Path]:
+        return {file.stem: file for file in (self.directory / storing_name).glob("*.bin")
+                if file.stem != Column.index.value}
+
+    @staticmethod
+    def _map(file: Path, dtype: np.dtype) -> np.ndarray:
+        if file.stat().st_size == 0:
+            return np.empty(0, dtype)
+        return np.memmap(file, dtype, mode="r")
+
+    # Files are mapped again once the series was appended to or rewritten, by this process or another one
+    def _load(self, storing_name: str) -> tuple[np.ndarray, dict[str, np.ndarray]] | None:
+        try:
+            stat = self._index_file(storing_name).stat()
+        except FileNotFoundError:
+            self.mapped.pop(storing_name, None)
+            return None
+        identity = (stat.st_ino, stat.st_size)
+        if storing_name not in self.mapped or self.mapped[storing_name][0] != identity:
+            columns = self._column_files(storing_name)
+            self.mapped[storing_name] = (identity, self._map(self._index_file(storing_name), self.index_dtype),
+                                         {column: self._map(file, self.column_dtype)
+                                          for column, file in columns.items()})
+        _, index, columns = self.mapped[storing_name]
+        return index, columns
+
+    # The index is written last, so candles it holds are in every column
+    def _dump(self, storing_name: str, df: pd.DataFrame, mode: str) -> None:
+        (self.directory / storing_name).mkdir(exist_ok=True)
+        for column in df.columns:
+            with open(self.directory / storing_name / f"{column}.bin", mode) as file:
+                df[column].to_numpy(self.column_dtype, na_value=np.nan).tofile(file)
+        with open(self._index_file(storing_name), mode) as file:
+            df.index.to_numpy(self.index_dtype).tofile(file)
+
+    def write(self, storing_name: str, df: pd.DataFrame) -> None:
+        df = df[~df.index.duplicated(keep="last")].sort_index()
+        stored = self._load(storing_name)
+        self.mapped.pop(storing_name, None)
+        if stored is None:
+            self._dump(storing_name, df, "wb")
+            return
+
+        index, columns = stored
+        df = df.reindex(columns=sorted(set(columns) | set(df.columns)))
+        if len(index) and df.index[0] > index[-1] and set(df.columns) == set(columns):
+            self._dump(storing_name, df, "ab")
+            return
+
+        stored = pd.DataFrame({column: np.array(values) for column, values in columns.items()},
+                              index=pd.Index(np.array(index), name=Column.index.value))
+        self._rewrite(storing_name, pd.concat([stored[~stored.index.isin(df.index)], df]).sort_index())
+
+    # Rewrite next to the series and swap, so readers never see a half written series. The old files are moved
+    # aside and removed only once the new ones are in place
+    def _rewrite(self, storing_name: str, df: pd.DataFrame) -> None:
+        temporary, old = self.directory / f"{storing_name}.tmp", self.directory / f"{storing_name}.old"
+        shutil.rmtree(temporary, ignore_errors=True)
+        shutil.rmtree(old, ignore_errors=True)
+        self._dump(temporary.name, df, "wb")
+        os.replace(self.directory / storing_name, old)
+        os.replace(temporary, self.directory / storing_name)
+        shutil.rmtree(old)
+
+    # Columns of the slice are views of the mapped files
+    def read(self, storing_name: str, start: float, end: float) -> pd.DataFrame | None:
+        stored = self._load(storing_name)
+        if stored is None:
+            return None
+        index, columns = stored
+        lo, hi = index.searchsorted(start, side="left"), index.searchsorted(end, side="right")
+        return pd.DataFrame({column: values[lo:hi] for column, values in columns.items()},
+                            index=pd.Index(index[lo:hi], name=Column.index.value), copy=False)
+
+    def footprint(self, storing_name: str) -> int:
+        return sum(file.stat().st_size for file in (self.directory / storing_name).glob("*.bin"))
+
+    # The series is rewritten once whatever the limit is
+    def delete(self, storing_name: str, end: float, limit: int) -> int:
+        stored = self._load(storing_name)
+        if stored is None:
+            return 0
+        index, columns = stored
+        deleted = int(index.searchsorted(end, side="left"))
+        if deleted:
+            self.mapped.pop(storing_name, None)
+            self._rewrite(storing_name, pd.DataFrame(
+                {column: np.array(values[deleted:]) for column, values in columns.items()},
+                index=pd.Index(np.array(index[deleted:]), name=Column.index.value)))
+        return deleted
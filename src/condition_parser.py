@@ -0,0 +1,286 @@
+import ast
+import functools
+import operator
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+import numpy as np
+import pandas as pd
+
+from src.enums import ConditionInterval, AggregatorName, AggregatorShortName, AggregatorNameFromShort, Column
+from src.exceptions import WrongCondition, NonexistentAggregator
+from src.tickers_naming import TickerNaming
+
+# #AGGREGATOR:TICKER.column[NX:rewind].function()
+TERM = re.compile(r"#(?:(?P<aggregator>\w+):)?(?P<ticker>[\w-]+)\.(?P<column>\w+)"
+                  r"\[(?P<length>\d*)(?P<interval>[A-Za-z])(?::(?P<rewind>[^\]]*))?\]"
+                  r"(?:\.(?P<function>\w+)\(\))?")
+TERM_PLACEHOLDER = "__term{}"
+FUNCTIONS = ("mean", "max", "min", "sum")
+INTERVAL_LETTERS = {"minute": "T", "hour": "H", "day": "D", "week": "W", "month": "M", "quarter": "Q"}
+
+UNARY_OPERATORS = {ast.Not: ("not ", operator.not_), ast.USub: ("-", operator.neg), ast.UAdd: ("+", operator.pos)}
+BINARY_OPERATORS = {ast.Add: ("+", operator.add), ast.Sub: ("-", operator.sub), ast.Mult: ("*", operator.mul),
+                    ast.Div: ("/", operator.truediv), ast.FloorDiv: ("//", operator.floordiv),
+                    ast.Mod: ("%", operator.mod), ast.Pow: ("**", operator.pow)}
+COMPARE_OPERATORS = {ast.Lt: ("<", operator.lt), ast.LtE: ("<=", operator.le), ast.Gt: (">", operator.gt),
+                     ast.GtE: (">=", operator.ge), ast.Eq: ("==", operator.eq), ast.NotEq: ("!=", operator.ne)}
+LOGIC_OPERATORS = {ast.And: "and", ast.Or: "or"}
+
+
+# Condition expression tree. Nodes are frozen, so equal conditions and equal subterms are equal dict keys
+class Node(ABC):
+    def terms(self) -> Iterator["Term"]:
+        for child in self.children():
+            yield from child.terms()
+
+    def children(self) -> tuple["Node", ...]:
+        return ()
+
+    @abstractmethod
+    def evaluate(self, values: dict["Term", Any]) -> Any:
+        ...
+
+    # Elementwise evaluation over arrays of term values, one element per moment
+    @abstractmethod
+    def evaluate_array(self, values: dict["Term", np.ndarray]) -> np.ndarray | int | float | bool:
+        ...
+
+
+@dataclass(frozen=True)
+class Constant(Node):
+    value: int | float | bool
+
+    def evaluate(self, values: dict["Term", Any]) -> Any:
+        return self.value
+
+    def evaluate_array(self, values: dict["Term", np.ndarray]) -> int | float | bool:
+        return self.value
+
+    def __str__(self) -> str:
+        return repr(self.value)
+
+
+@dataclass(frozen=True)
+class Term(Node):
+    ticker: str
+    aggregator: AggregatorName
+    timespan: str
+    column: Column
+    length: int
+    rewind: int
+    function: str | None
+
+    def terms(self) -> Iterator["Term"]:
+        yield self
+
+    def evaluate(self, values: dict["Term", Any]) -> Any:
+        return values[self]
+
+    def evaluate_array(self, values: dict["Term", np.ndarray]) -> np.ndarray:
+        return values[self]
+
+    @property
+    def naming(self) -> TickerNaming:
+        return TickerNaming(self.ticker, self.aggregator, self.timespan)
+
+    # Window of candles relative to the current one
+    @property
+    def window(self) -> tuple[int, int]:
+        return self.rewind - self.length, self.rewind
+
+    # Aggregates are updated incrementally by the rolling engine if it's given
+    async def load(self, planner, rolling=None) -> Any:
+        df = await planner.get_ticker(self.naming, *self.window)
+        series: pd.Series = df[self.column.value]
+        if self.function is None:
+            return series.tail(1).item()
+        if rolling is None:
+            return getattr(series.tail(self.length), self.function)()
+        return rolling.aggregate(self, series, self.length, self.function,
+                                 planner.store_keeper.get_final_timestamp(self.naming))
+
+    def __str__(self) -> str:
+        interval = f"{self.length}{INTERVAL_LETTERS[self.timespan]}"
+        if self.rewind:
+            interval += f":{self.rewind}"
+        text = f"#{AggregatorShortName[self.aggregator.name].value.upper()}:{self.ticker}.{self.column.name}" \
+               f"[{interval}]"
+        return text + f".{self.function}()" if self.function else text
+
+
+@dataclass(frozen=True)
+class Unary(Node):
+    op: str
+    operand: Node
+
+    def children(self) -> tuple[Node, ...]:
+        return self.operand,
+
+    def evaluate(self, values: dict[Term, Any]) -> Any:
+        return UNARY_FUNCTIONS[self.op](self.operand.evaluate(values))
+
+    def evaluate_array(self, values: dict[Term, np.ndarray]) -> np.ndarray:
+        return UNARY_ARRAY_FUNCTIONS[self.op](self.operand.evaluate_array(values))
+
+    def __str__(self) -> str:
+        return f"({self.op}{self.operand})"
+
+
+@dataclass(frozen=True)
+class Binary(Node):
+    op: str
+    left: Node
+    right: Node
+
+    def children(self) -> tuple[Node, ...]:
+        return self.left, self.right
+
+    def evaluate(self, values: dict[Term, Any]) -> Any:
+        return BINARY_FUNCTIONS[self.op](self.left.evaluate(values), self.right.evaluate(values))
+
+    def evaluate_array(self, values: dict[Term, np.ndarray]) -> np.ndarray:
+        return BINARY_FUNCTIONS[self.op](self.left.evaluate_array(values), self.right.evaluate_array(values))
+
+    def __str__(self) -> str:
+        return f"({self.left}{self.op}{self.right})"
+
+
+@dataclass(frozen=True)
+class Compare(Node):
+    left: Node
+    ops: tuple[str, ...]
+    comparators: tuple[Node, ...]
+
+    def children(self) -> tuple[Node, ...]:
+        return (self.left,) + self.comparators
+
+    def evaluate(self, values: dict[Term, Any]) -> Any:
+        left = self.left.evaluate(values)
+        for op, comparator in zip(self.ops, self.comparators):
+            right = comparator.evaluate(values)
+            if not COMPARE_FUNCTIONS[op](left, right):
+                return False
+            left = right
+        return True
+
+    def evaluate_array(self, values: dict[Term, np.ndarray]) -> np.ndarray:
+        left = self.left.evaluate_array(values)
+        result = True
+        for op, comparator in zip(self.ops, self.comparators):
+            right = comparator.evaluate_array(values)
+            result = np.logical_and(result, COMPARE_FUNCTIONS[op](left, right))
+            left = right
+        return result
+
+    def __str__(self) -> str:
+        return f"({self.left}" + "".join(f"{op}{comparator}" for op, comparator in
+                                          zip(self.ops, self.comparators)) + ")"
+
+
+@dataclass(frozen=True)
+class Logic(Node):
+    op: str
+    operands: tuple[Node, ...]
+
+    def children(self) -> tuple[Node, ...]:
+        return self.operands
+
+    def evaluate(self, values: dict[Term, Any]) -> Any:
+        if self.op == "and":
+            return all(operand.evaluate(values) for operand in self.operands)
+        return any(operand.evaluate(values) for operand in self.operands)
+
+    def evaluate_array(self, values: dict[Term, np.ndarray]) -> np.ndarray:
+        function = np.logical_and if self.op == "and" else np.logical_or
+        return functools.reduce(function, (operand.evaluate_array(values) for operand in self.operands))
+
+    def __str__(self) -> str:
+        return "(" + f" {self.op} ".join(map(str, self.operands)) + ")"
+
+
+UNARY_FUNCTIONS = {symbol: function for symbol, function in UNARY_OPERATORS.values()}
+UNARY_ARRAY_FUNCTIONS = UNARY_FUNCTIONS | {UNARY_OPERATORS[ast.Not][0]: np.logical_not}
+BINARY_FUNCTIONS = {symbol: function for symbol, function in BINARY_OPERATORS.values()}
+COMPARE_FUNCTIONS = {symbol: function for symbol, function in COMPARE_OPERATORS.values()}
+
+
+def _parse_term(match: re.Match) -> Term:
+    aggregator_name = AggregatorName.moex
+    if match["aggregator"]:
+        aggregator = match["aggregator"].lower()
+        if aggregator not in [agg.name for agg in AggregatorNameFromShort]:
+            raise NonexistentAggregator(f"There's no such aggregator as {aggregator}")
+        aggregator_name = AggregatorName[AggregatorNameFromShort[aggregator].value]
+
+    if match["column"] not in Column.__members__ or match["column"] == Column.index.name:
+        raise WrongCondition(f"Wrong column: {match['column']}")
+    if match["interval"] not in ConditionInterval.__members__:
+        raise WrongCondition(f"Wrong time span: {match['interval']}")
+    if match["function"] is not None and match["function"] not in FUNCTIONS:
+        raise WrongCondition(f"Wrong function: {match['function']}")
+
+    rewind = 0
+    if match["rewind"] is not None:
+        try:
+            rewind = int(match["rewind"])
+        except ValueError:
+            raise WrongCondition(f"Wrong rewind value: {match['rewind']}")
+        if rewind >= 0:
+            raise WrongCondition(f"Wrong rewind value: {rewind}")
+
+    length = int(match["length"]) if match["length"] else 1
+    if length <= 0:
+        raise WrongCondition(f"Wrong interval length: {length}")
+
+    return Term(match["ticker"], aggregator_name, ConditionInterval[match["interval"]].value,
+                Column[match["column"]], length, rewind, match["function"])
+
+
+def _build(node: ast.AST, terms: dict[str, Term]) -> Node:
+    if isinstance(node, ast.Expression):
+        return _build(node.body, terms)
+    if isinstance(node, ast.Name) and node.id in terms:
+        return terms[node.id]
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float, bool):
+        return Constant(node.value)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        operand = _build(node.operand, terms)
+        if isinstance(node.op, ast.USub) and isinstance(operand, Constant):
+            return Constant(-operand.value)
+        return Unary(UNARY_OPERATORS[type(node.op)][0], operand)
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        return Binary(BINARY_OPERATORS[type(node.op)][0], _build(node.left, terms), _build(node.right, terms))
+    if isinstance(node, ast.Compare) and all(type(op) in COMPARE_OPERATORS for op in node.ops):
+        return Compare(_build(node.left, terms), tuple(COMPARE_OPERATORS[type(op)][0] for op in node.ops),
+                       tuple(_build(comparator, terms) for comparator in node.comparators))
+    if isinstance(node, ast.BoolOp):
+        operands = []
+        # a and (b and c) is the same as a and b and c
+        for value in node.values:
+            value = _build(value, terms)
+            if isinstance(value, Logic) and value.op == LOGIC_OPERATORS[type(node.op)]:
+                operands.extend(value.operands)
+            else:
+                operands.append(value)
+        return Logic(LOGIC_OPERATORS[type(node.op)], tuple(operands))
+    raise WrongCondition(f"Not allowed in condition: {ast.unparse(node)}")
+
+
+# Parse condition written by user into normalized expression tree
+def parse_condition(condition: str) -> Node:
+    terms: dict[str, Term] = dict()
+
+    def replace(match: re.Match) -> str:
+        placeholder = TERM_PLACEHOLDER.format(len(terms))
+        terms[placeholder] = _parse_term(match)
+        return placeholder
+
+    expression = TERM.sub(replace, condition.strip())
+    if '#' in expression:
+        raise WrongCondition(f"Wrong ticker syntax: {condition}")
+    if not terms:
+        raise WrongCondition(f"No tickers in condition: {condition}")
+    return _build(ast.parse(expression, mode="eval"), terms)
@@ -1,13 +1,28 @@
+import asyncio
 import logging
-from typing import Callable, Coroutine, Any
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Coroutine, Any, Iterable
 
-import pandas as pd
 from telegram.ext import JobQueue, ContextTypes
 
-from src.config import notification_interval
-from src.enums import ConditionInterval, AggregatorName, Column, AggregatorNameFromShort
-from src.exceptions import WrongCondition, NonexistentAggregator, NonexistentNotification
+from src.backtest import BacktestResult, backtest
+from src.condition_parser import Node, parse_condition
+from src.config import evaluation_workers, backtest_days, backtest_max_days, warm_up_concurrency, prefetch_lead, \
+    condition_timeout
+from src.dependency_index import DependencyIndex
+from src.enums import EvaluationOutcome
+from src.evaluation import load_terms, evaluate_conditions
+from src.exceptions import WrongCondition, NonexistentNotification
+from src.fetch_planner import FetchPlanner, SeriesKey, moex_now
+from src.live_tail import LiveTail, SeriesUpdated
 from src.notifications import Notification
+from src.retention import Compactor
+from src.rolling import RollingEngine
+from src.scheduler import EvaluationScheduler
+from src.sharding import ShardedEvaluator
 from src.store_keeper import StoreKeeper
 from src.tickers_naming import TickerNaming
 
@@ -16,100 +31,226 @@ logger = logging.getLogger("submodule")
 NOTIFICATOR = "notificator"
 
 
+@dataclass
+class TickSummary:
+    evaluated: int = 0
+    fired: list[Notification] = field(default_factory=list)
+    timed_out: list[Notification] = field(default_factory=list)
+    errored: list[Notification] = field(default_factory=list)
+    unique_conditions: int = 0
+    unique_terms: int = 0
+    # Notifications which reused the result of unchanged inputs
+    skipped: int = 0
+    duration: float = 0
+
+    def __str__(self) -> str:
+        return f"evaluated {self.evaluated} ({self.unique_conditions} unique, {self.unique_terms} terms), " \
+               f"skipped {self.skipped}, fired {len(self.fired)}, timed out {len(self.timed_out)}, " \
+               f"errored {len(self.errored)} in {self.duration:.2f}s"
+
+
+# Conditions are evaluated when the scheduler finds them due: on new candles brought by the live tail or
+# after a candle of the finest time span they read closes.
+# Summaries of evaluations are handed to the notificator job, without a job queue they are only returned by run_tick
 class ConditionProcessor:
-    def __init__(self, job_queue: JobQueue,
-                 notification: Callable[[ContextTypes.DEFAULT_TYPE], Coroutine[Any, Any, None]]):
+    def __init__(self, job_queue: JobQueue | None,
+                 notification: Callable[[ContextTypes.DEFAULT_TYPE], Coroutine[Any, Any, None]] | None = None,
+                 store_keeper: StoreKeeper | None = None):
         self.job_queue = job_queue
-        self.store_keeper = StoreKeeper()
+        self.store_keeper = store_keeper or StoreKeeper()
         self.notifications: dict[int, Notification] = dict()
+        self.conditions: dict[int, Node] = dict()
+        self.dependencies = DependencyIndex()
+        # Inputs of the last evaluation of a condition and its result
+        self.results: dict[Node, tuple[tuple, bool]] = dict()
+        self.rolling = RollingEngine()
+        self.sharded = ShardedEvaluator(evaluation_workers) if evaluation_workers else None
+        self.evaluations = 0
+        self.skipped = 0
+        self.live_tail = LiveTail(self.store_keeper, self.series_updated)
+        self.compactor = Compactor(self.store_keeper)
+        # Series updated since the last evaluation, None to evaluate every condition
+        self.updated: set[SeriesKey] | None = None
+        self.update_event: asyncio.Event | None = None
+        self.dispatcher: asyncio.Task | None = None
+        self.scheduler = EvaluationScheduler(calendar=self.store_keeper.calendar)
+        # Due moment of the last prefetch, seconds the startup warm-up took
+        self.prefetched: datetime | None = None
+        self.warm_up_duration: float | None = None
+        self.notificator = notification
         self.load_notifications()
-        self.set_notificator(notification)
         logger.info("Condition processor initiated")
 
     def load_notifications(self, chat_id: int = None) -> None:
         self.notifications = self.store_keeper.get_notifications(chat_id)
+        self.conditions.clear()
+        self.dependencies.clear()
+        self.scheduler.clear()
+        self.results.clear()
+        for notification in self.notifications.values():
+            try:
+                self.conditions[notification.id] = parse_condition(notification.origin_condition)
+                self.dependencies.add(notification.id, self.conditions[notification.id])
+                self.scheduler.add(notification.id, self.conditions[notification.id],
+                                   self.publication_delay(self.conditions[notification.id]))
+            except Exception as e:
+                logger.error(f"Can't parse notification {notification.id}", exc_info=e)
+
+    async def start(self) -> None:
+        self.update_event = asyncio.Event()
+        self.update_event.set()
+        self.dispatcher = asyncio.create_task(self._dispatch())
+        self.compactor.start()
+
+    async def close(self) -> None:
+        self.remove_notificator()
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+            await asyncio.gather(self.dispatcher, return_exceptions=True)
+        await self.live_tail.close()
+        await self.compactor.close()
+        if self.sharded is not None:
+            self.sharded.close()
+        await self.store_keeper.close()
+
+    def referenced_namings(self) -> list[TickerNaming]:
+        return list(self.dependencies.namings.values())
+
+    def request_evaluation(self, series: set[SeriesKey] | None) -> None:
+        if self.update_event is None:
+            return
+        if series is None or self.updated is None:
+            self.updated = None
+        else:
+            self.updated |= series
+        self.update_event.set()
+
+    def series_updated(self, event: SeriesUpdated) -> None:
+        self.request_evaluation(set(event.dependents))
+
+    # Longest delay of candles of the aggregators the condition reads
+    def publication_delay(self, condition: Node) -> timedelta:
+        return max((self.store_keeper.aggregators[term.aggregator.value].delay for term in condition.terms()
+                    if term.aggregator.value in self.store_keeper.aggregators), default=timedelta(0))
+
+    # Load series the conditions read into the candle cache, in parallel. Returns the number of series loaded
+    async def warm(self, conditions: Iterable[Node], now: datetime | None = None, progress: bool = False) -> int:
+        planner = FetchPlanner(self.store_keeper, now)
+        conditions = list(conditions)
+        loaded = await self.load_series(conditions, planner, progress)
+        # Rolling aggregates are built from the loaded series, workers build their own
+        if self.sharded is None:
+            await load_terms({term for condition in conditions for term in condition.terms()}, planner, self.rolling)
+        return loaded
+
+    # Download and store missing windows of series the conditions read, through the planner
+    async def load_series(self, conditions: Iterable[Node], planner: FetchPlanner, progress: bool = False) -> int:
+        namings = dict()
+        for term in {term for condition in conditions for term in condition.terms()}:
+            planner.plan(term.naming, *term.window)
+            namings[FetchPlanner.series_key(term.naming)] = term.naming
+        semaphore = asyncio.Semaphore(warm_up_concurrency)
+        loaded = 0
+
+        async def load(key: SeriesKey, naming: TickerNaming) -> None:
+            nonlocal loaded
+            async with semaphore:
+                try:
+                    await asyncio.wait_for(planner.get_ticker(naming, *planner.windows[key]), condition_timeout)
+                except Exception as e:
+                    logger.warning(f"Can't load {key}", exc_info=e)
+                    return
+            loaded += 1
+            if progress and loaded % max(1, len(namings) // 10) == 0:
+                logger.info(f"Warming up: {loaded} of {len(namings)} series loaded")
+
+        await asyncio.gather(*(load(key, naming) for key, naming in namings.items()))
+        return loaded
+
+    # Series of every stored notification are loaded before the first tick, so it doesn't wait for them
+    async def warm_up(self) -> None:
+        start = time.monotonic()
+        loaded = await self.warm(self.conditions.values(), progress=True)
+        self.warm_up_duration = time.monotonic() - start
+        logger.info(f"Warm-up: {loaded} series loaded in {self.warm_up_duration:.1f}s")
+
+    # Load series of the notifications due at the next candle boundary shortly before it, so that only the candles
+    # closing at the boundary are left to download
+    async def prefetch(self, ids: set[int]) -> None:
+        start = time.monotonic()
+        loaded = await self.warm(self.conditions[id] for id in ids if id in self.conditions)
+        logger.debug(f"Prefetched {loaded} series of {len(ids)} notifications in {time.monotonic() - start:.2f}s")
+
+    # Updates arriving during an evaluation are coalesced into the next one, the dispatcher also wakes up
+    # when a group of the scheduler is due and shortly before it to prefetch its series
+    async def _dispatch(self) -> None:
+        await self.warm_up()
+        while True:
+            now = moex_now()
+            timeout, upcoming = self.scheduler.seconds_until_due(now), self.scheduler.upcoming(now)
+            prefetch = upcoming is not None and upcoming[0] != self.prefetched and timeout > prefetch_lead
+            try:
+                await asyncio.wait_for(self.update_event.wait(), timeout - prefetch_lead if prefetch else timeout)
+            except asyncio.TimeoutError:
+                if prefetch:
+                    self.prefetched = upcoming[0]
+                    await self.prefetch(upcoming[1])
+                    continue
+            self.update_event.clear()
+            updated, self.updated = self.updated, set()
+            ids = None if updated is None else self.dependencies.dependents(updated)
+            ids = self.scheduler.select(ids, moex_now())
+            if not ids:
+                continue
+            try:
+                summary = await self.run_tick(ids)
+            except Exception as e:
+                logger.error("Evaluation failed", exc_info=e)
+                continue
+            finally:
+                self.live_tail.track(self.referenced_namings())
+            if summary.evaluated and self.job_queue is not None:
+                self.job_queue.run_once(self.notificator, 0, data=summary, name=NOTIFICATOR)
 
     def remove_notificator(self) -> None:
+        if self.job_queue is None:
+            return
         jobs = self.job_queue.get_jobs_by_name(NOTIFICATOR)
         for job in jobs:
             job.schedule_removal()
 
-    def set_notificator(self, notification: Callable[[ContextTypes.DEFAULT_TYPE], Coroutine[Any, Any, None]]) -> None:
-        self.remove_notificator()
-        self.job_queue.run_repeating(notification, notification_interval, name=NOTIFICATOR)
-
-    @staticmethod
-    def _reformat_condition(condition: str) -> str:
-        new_condition = 'async def __ex():\n return '
-        while condition.partition('#')[2]:
-            new_part, _, condition = condition.partition('#')
-            new_condition += new_part
-            ticker, _, condition = condition.partition('.')
-            column, _, condition = condition.partition('[')
-            column = f"['{Column[column].value}']"
-            interval, _, condition = condition.partition(']')
-            if condition and condition[0] == '.':
-                new_part, _, condition = condition.partition('()')
-                column += new_part + '()'
-            else:
-                column += ".tail(1).item()"
-
-            rewind = 0
-            if ':' in interval:
-                interval, _, rewind = interval.partition(':')
-                try:
-                    rewind = int(rewind)
-                except ValueError:
-                    raise WrongCondition(f"Wrong rewind value: {rewind}")
-                if rewind >= 0:
-                    raise WrongCondition(f"Wrong rewind value: {rewind}")
-            timespan = ConditionInterval[interval[-1]].value
-            interval_time = int(interval[:-1]) if interval[:-1] else 1
-            end = rewind
-            start = end - interval_time
-
-            aggregator_name = AggregatorName.moex
-            if ':' in ticker:
-                aggregator, _, ticker = ticker.partition(':')
-                if aggregator.lower() not in [agg.name for agg in AggregatorNameFromShort]:
-                    raise NonexistentAggregator(f"There's no such aggregator as {aggregator.lower()}")
-                aggregator_name = AggregatorName[AggregatorNameFromShort[aggregator.lower()].value]
-
-            new_condition += f"(await gt(TN('{ticker}', AN{aggregator_name.value}, '{timespan}'), " \
-                             f"{start}, {end})).tail({interval_time}){column}"
-
-        return new_condition + condition
-
-    async def _check_condition(self, condition: str) -> bool:
-        allowed_names = {"gt": self.store_keeper.async_get_ticker, "TN": TickerNaming, "tail": pd.DataFrame.tail,
-                         "mean": pd.Series.mean, "max": pd.Series.max, "min": pd.Series.min,
-                         "sum": pd.Series.sum, "item": pd.Series.item}
-        for aggregator in AggregatorName:
-            allowed_names[f"AN{aggregator.value}"] = aggregator
-        # code = compile(condition, "<string>", "eval")
-        # for name in code.co_names:
-        #     if name not in allowed_names:
-        #         logger.debug(f"Wrong condition:\n{condition}")
-        #         raise NameError(f"Use of {name} not allowed")
-        allowed_names["__builtins__"] = {}
-        exec(condition, allowed_names)
+    async def _check_condition(self, condition: Node, planner: FetchPlanner | None = None) -> bool:
+        values = await load_terms(set(condition.terms()), planner or FetchPlanner(self.store_keeper))
         try:
-            return await locals()['allowed_names']['__ex']()
+            for value in values.values():
+                if isinstance(value, Exception):
+                    raise value
+            return bool(condition.evaluate(values))
         except Exception as e:
             raise WrongCondition(e)
 
-    def save_notification(self, chat_id: int, condition: str, origin_condition: str) -> None:
-        notification = self.store_keeper.add_notification(chat_id, condition, origin_condition)
+    async def save_notification(self, chat_id: int, condition: Node, origin_condition: str) -> None:
+        notification = await self.store_keeper.async_add_notification(chat_id, str(condition), origin_condition)
         self.notifications[notification.id] = notification
+        self.conditions[notification.id] = condition
+        self.dependencies.add(notification.id, condition)
+        self.scheduler.add(notification.id, condition, self.publication_delay(condition))
         logger.debug(f"Notification {notification.id} saved")
 
     async def create_condition(self, chat_id: int, condition: str) -> None:
         logger.debug("Processing new condition")
-        condition, origin_condition = self._reformat_condition(condition), condition
-        print(condition, origin_condition)
+        condition, origin_condition = parse_condition(condition), condition
         await self._check_condition(condition)
         logger.debug("Checked!")
-        self.save_notification(chat_id, condition, origin_condition)
+        await self.save_notification(chat_id, condition, origin_condition)
+        self.request_evaluation({FetchPlanner.series_key(term.naming) for term in condition.terms()})
+
+    # Candles of the last days the condition would have fired at
+    async def backtest(self, condition: str, days: int = backtest_days) -> BacktestResult:
+        if not 0 < days <= backtest_max_days:
+            raise ValueError(f"Backtest period must be from 1 to {backtest_max_days} days")
+        end = moex_now()
+        return await backtest(self.store_keeper, parse_condition(condition), end - timedelta(days=days), end)
 
     def list_notifications(self, chat_id: int) -> list[Notification]:
         notifications = []
@@ -118,15 +259,78 @@ class ConditionProcessor:
                 notifications.append(notification)
         return notifications
 
-    def remove_notification(self, id: int) -> None:
+    async def remove_notification(self, id: int) -> None:
         if id not in self.notifications:
             raise NonexistentNotification
-        self.store_keeper.remove_notification(id)
+        await self.store_keeper.async_remove_notification(id)
         self.notifications.pop(id)
+        condition = self.conditions.pop(id, None)
+        self.dependencies.remove(id)
+        self.scheduler.remove(id)
+        if condition not in self.conditions.values():
+            self.results.pop(condition, None)
+            self.rolling.retain({term for condition in self.conditions.values() for term in condition.terms()})
+        if self.dispatcher is not None:
+            self.live_tail.track(self.referenced_namings())
+
+    # Data versions and window anchors of every term
+    def input_key(self, condition: Node, planner: FetchPlanner) -> tuple:
+        return tuple((term, self.store_keeper.get_version(term.naming, term.column), planner.anchor(term.timespan))
+                     for term in condition.terms())
+
+    # Evaluate conditions of the notifications, every condition if ids is None
+    async def run_tick(self, ids: Iterable[int] | None = None) -> TickSummary:
+        start = time.monotonic()
+        planner = FetchPlanner(self.store_keeper)
+        ids = self.conditions.keys() if ids is None else [id for id in ids if id in self.conditions]
+        # Equal conditions of different notifications are evaluated once
+        by_condition: dict[Node, list[Notification]] = defaultdict(list)
+        for id in ids:
+            by_condition[self.conditions[id]].append(self.notifications[id])
+        summary = TickSummary(evaluated=sum(map(len, by_condition.values())), unique_conditions=len(by_condition))
+
+        # Windows of unchanged data give the same result
+        pending: dict[Node, list[Notification]] = dict()
+        for condition, notifications in by_condition.items():
+            result = self.results.get(condition)
+            if result is None or result[0] != self.input_key(condition, planner):
+                pending[condition] = notifications
+                continue
+            summary.skipped += len(notifications)
+            if result[1]:
+                summary.fired.extend(notifications)
+
+        if self.sharded is None:
+            outcomes = await evaluate_conditions(pending, planner, self.rolling)
+        else:
+            # Workers only read, so series are stored first and workers drop what they kept of written ones
+            await self.load_series(pending, planner)
+            self.sharded.invalidate({storing_name: self.store_keeper.tailed.get(storing_name)
+                                     for storing_name in self.store_keeper.take_changed()})
+            outcomes = await self.sharded.evaluate(list(pending), planner.now)
+        summary.unique_terms = len({term for condition in pending for term in condition.terms()})
+        for condition, notifications in pending.items():
+            outcome = outcomes[condition]
+            if outcome == EvaluationOutcome.timed_out:
+                summary.timed_out.extend(notifications)
+                continue
+            if outcome == EvaluationOutcome.errored:
+                summary.errored.extend(notifications)
+                continue
+            # Versions after loading, the load itself may have stored candles
+            self.results[condition] = (self.input_key(condition, planner), outcome == EvaluationOutcome.fired)
+            if outcome == EvaluationOutcome.fired:
+                summary.fired.extend(notifications)
+        summary.duration = time.monotonic() - start
+        self.evaluations += len(pending)
+        self.skipped += summary.skipped
+        logger.debug(f"Evaluations: {self.evaluations} run, {self.skipped} skipped")
+        logger.debug(f"Candle cache: {self.store_keeper.candle_cache}")
+        logger.debug(f"Requests: {self.store_keeper.request_scheduler}")
+        logger.debug(f"Live tail: {self.live_tail}")
+        logger.debug(f"Scheduler: {self.scheduler}")
+        logger.debug(f"Compaction: {self.compactor}")
+        return summary
 
     async def get_active_notifications(self) -> list[Notification]:
-        active_notifications = []
-        for notification in self.notifications.values():
-            if await self._check_condition(notification.condition):
-                active_notifications.append(notification)
-        return active_notifications
+        return (await self.run_tick()).fired
@@ -1,8 +1,85 @@
 from datetime import datetime, timedelta
 
 
-# TODO: DEBUG mode. Turn to 1800
+# Seconds between live tail polls of a series referenced by notifications
 notification_interval = 30
+moex_timezone = "Europe/Moscow"
+# MOEX trading sessions in Moscow time on working days by engine and market, other markets are assumed always open
+trading_sessions = {
+    ("stock", "shares"): (("06:50", "18:50"), ("19:05", "23:50")),
+    ("futures", "forts"): (("08:50", "14:00"), ("14:05", "18:50"), ("19:05", "23:50")),
+}
+# Days without trading besides weekends, "MM-DD" every year or "YYYY-MM-DD"
+trading_holidays = ("01-01", "01-02", "01-07", "02-23", "03-08", "05-01", "05-09", "06-12", "11-04")
+# Engine and market of MOEX series by aggregator, futures are told from shares by their short code otherwise
+moex_aggregator_markets = {"moex_analytic": ("futures", "forts")}
+moex_futures_code = r"[A-Za-z0-9]{2}[FGHJKMNQUVXZ]\d"
+# Seconds a download which found no candles while the market was closed is trusted for, ranges closed by the
+# calendar are downloaded again after that
+closed_skip_ttl = 15 * 60
+# Seconds after a candle closes and is published before conditions on its time span are evaluated
+scheduler_grace = 5
+# Series loaded at the same time while warming up at startup, and seconds before a candle boundary series of
+# the conditions due at it are prefetched
+warm_up_concurrency = 16
+prefetch_lead = 15
+# Maximum number of conditions evaluated at the same time
+evaluation_concurrency = 32
+# Seconds given to a single condition before it is reported as timed out
+condition_timeout = 20
+# Worker processes evaluating shards of conditions, 0 evaluates in the bot process
+evaluation_workers = 0
+# Days of history a backtest covers by default and at most
+backtest_days = 30
+backtest_max_days = 366
+
+# Telegram delivery: concurrent senders, messages per second for the bot and seconds between messages of a chat
+delivery_workers = 32
+delivery_rate = 25
+delivery_chat_interval = 1
+# Attempts after the first one on network errors and flood control, backoff doubles from delivery_backoff
+delivery_retries = 5
+delivery_backoff = 1
+
+# Connection pool of aggregators
+http_pool_size = 20
+http_keepalive_timeout = 60
+dns_cache_ttl = 300
+# Request scheduler shared by aggregators, limits are per host
+request_rate = 10
+request_burst = 20
+request_in_flight = 8
+request_timeout = 30
+# Attempts after the first one on 429, 5xx and connection errors, backoff doubles from request_backoff
+request_retries = 4
+request_backoff = 0.5
+request_backoff_max = 30
+# Consecutive failures opening the circuit of a host and seconds it stays open
+circuit_failure_threshold = 5
+circuit_reset_timeout = 60
+# SQLite database, connection pool and pragmas
+db_file_path = "res/db/athena_data.sqlite"
+db_pool_size = 5
+db_max_overflow = 10
+db_pool_timeout = 30
+db_busy_timeout = 5000
+db_cache_size_kb = 64 * 1024
+# Threads running blocking database work off the event loop, and writes grouped into one transaction at most
+db_threads = 4
+db_write_batch = 64
+# Candle history backend: "sqlite" or "columnar"
+candle_storage = "sqlite"
+columnar_storage_dir = "res/db/columnar"
+# Days candles of a time span are kept, and the longer time span they are rolled up into before they are deleted
+candle_retention = {"minute": (30, "hour")}
+# Hours between compaction runs, candles deleted and free pages returned to the file system per step
+compaction_interval = 6
+compaction_chunk = 20_000
+compaction_vacuum_pages = 512
+# Bytes of candles kept in memory by StoreKeeper
+candle_cache_budget = 128 * 1024 ** 2
+# Seconds MOEX authentication is reused when the passport cookie has no expiration
+moex_auth_ttl = 60 * 60
 
 try:
     with open("res/telegram.key", 'r') as f:
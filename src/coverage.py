@@ -0,0 +1,13 @@
+import sqlalchemy
+from sqlalchemy_serializer import SerializerMixin
+from src.db_session import SqlAlchemyBase
+
+
+# Time range [start, end) of a series which is completely stored
+class Coverage(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = 'coverage'
+    __table_args__ = {'extend_existing': True}
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    series = sqlalchemy.Column(sqlalchemy.String, index=True)
+    start = sqlalchemy.Column(sqlalchemy.Float)
+    end = sqlalchemy.Column(sqlalchemy.Float)
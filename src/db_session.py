@@ -4,6 +4,9 @@ import sqlalchemy.orm as orm
 from sqlalchemy.orm import Session
 import sqlalchemy.ext.declarative as dec
 from sqlalchemy.engine import Connection
+from sqlalchemy.pool import QueuePool
+
+from src.config import db_pool_size, db_max_overflow, db_pool_timeout, db_busy_timeout, db_cache_size_kb
 
 
 SqlAlchemyBase = dec.declarative_base()
@@ -11,6 +14,19 @@ __engine = None
 __factory = None
 
 
+# WAL lets readers work while a writer commits
+def _set_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    # Only takes effect in a new database, before its first table is created
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{db_cache_size_kb}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute(f"PRAGMA busy_timeout={db_busy_timeout}")
+    cursor.close()
+
+
 def global_init(db_file: Path):
     global __engine, __factory
     if __factory:
@@ -18,7 +34,9 @@ def global_init(db_file: Path):
     if not db_file.parent.exists():
         raise Exception("You need to set db file name")
     conn_str = f'sqlite:///{db_file}?check_same_thread=False'
-    __engine = sa.create_engine(conn_str, echo=False)
+    __engine = sa.create_engine(conn_str, echo=False, poolclass=QueuePool, pool_size=db_pool_size,
+                                max_overflow=db_max_overflow, pool_timeout=db_pool_timeout)
+    sa.event.listen(__engine, "connect", _set_pragmas)
     __factory = orm.sessionmaker(bind=__engine, expire_on_commit=False)
     import src.__all_models
     SqlAlchemyBase.metadata.create_all(__engine)
@@ -32,3 +50,11 @@ def create_session() -> Session:
 def create_connection() -> Connection:
     global __engine
     return __engine.connect()
+
+
+# Dispose of the engine, so that the next global_init opens another database
+def global_reset() -> None:
+    global __engine, __factory
+    if __engine is not None:
+        __engine.dispose()
+    __engine, __factory = None, None
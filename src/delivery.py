@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import numpy as np
+from telegram import Bot
+from telegram.constants import MessageLimit
+from telegram.error import RetryAfter, BadRequest, Forbidden, ChatMigrated, NetworkError
+
+from src.config import delivery_workers, delivery_rate, delivery_chat_interval, delivery_retries, delivery_backoff
+from src.request_scheduler import TokenBucket
+
+logger = logging.getLogger("submodule")
+
+
+@dataclass
+class Message:
+    chat_id: int
+    text: str
+    created: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+# Split text into messages within the length limit, by paragraphs, then lines, then characters
+def split_message(text: str, limit: int = MessageLimit.MAX_TEXT_LENGTH) -> list[str]:
+    if len(text) <= limit:
+        return [text]
+    for separator in ("\n\n", "\n"):
+        parts = text.split(separator)
+        if len(parts) == 1:
+            continue
+        messages, current = [], ""
+        for part in parts:
+            candidate = current + separator + part if current else part
+            if len(candidate) <= limit:
+                current = candidate
+                continue
+            if current:
+                messages.append(current)
+            current = part
+        messages.append(current)
+        return [message for text in messages for message in split_message(text, limit)]
+    return [text[i:i + limit] for i in range(0, len(text), limit)]
+
+
+# Sends messages concurrently within the bot-wide rate and the interval between messages of a chat.
+# Messages of a chat are sent in order by one worker at a time, flood control of Telegram pauses every worker
+class DeliveryQueue:
+    def __init__(self, bot: Bot, workers: int = delivery_workers, rate: float = delivery_rate,
+                 chat_interval: float = delivery_chat_interval, retries: int = delivery_retries,
+                 backoff: float = delivery_backoff, history: int = 10000):
+        self.bot = bot
+        self.workers = workers
+        self.bucket = TokenBucket(rate, rate)
+        self.chat_interval = chat_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.pending: dict[int, deque[Message]] = dict()
+        self.ready: asyncio.Queue[int] | None = None
+        self.tasks: list[asyncio.Task] = []
+        # Moments chats last sent at, in the order they were set. Chats whose interval has passed are forgotten
+        # whenever a queue of a chat drains
+        self.last_sent: OrderedDict[int, float] = OrderedDict()
+        self.paused_until = 0.
+        # Seconds from submission to delivery of recent messages
+        self.latencies: deque[float] = deque(maxlen=history)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def __str__(self) -> str:
+        percentiles = ", ".join(f"p{p} {value:.2f}s" for p, value in self.percentiles().items())
+        return f"sent {self.sent}, failed {self.failed}, retried {self.retried}, " \
+               f"queued {sum(map(len, self.pending.values()))}" + (f", latency {percentiles}" if percentiles else "")
+
+    def percentiles(self, percentiles: tuple[int, ...] = (50, 90, 99)) -> dict[int, float]:
+        if not self.latencies:
+            return dict()
+        values = np.percentile(np.fromiter(self.latencies, float), percentiles)
+        return dict(zip(percentiles, values.tolist()))
+
+    async def start(self) -> None:
+        self.ready = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        for chat_id in self.pending:
+            self.ready.put_nowait(chat_id)
+
+    def submit(self, chat_id: int, text: str) -> None:
+        messages = [Message(chat_id, part) for part in split_message(text)]
+        if chat_id in self.pending:
+            self.pending[chat_id].extend(messages)
+            return
+        self.pending[chat_id] = deque(messages)
+        if self.ready is not None:
+            self.ready.put_nowait(chat_id)
+
+    # Wait until every submitted message is delivered or dropped
+    async def join(self) -> None:
+        await self.ready.join()
+
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+
+    async def _work(self) -> None:
+        while True:
+            chat_id = await self.ready.get()
+            try:
+                queue = self.pending[chat_id]
+                while queue:
+                    if await self._deliver(queue[0]):
+                        queue.popleft()
+                del self.pending[chat_id]
+                self._forget_idle(time.monotonic())
+            except Exception as e:
+                logger.error(f"Delivery to {chat_id} failed", exc_info=e)
+                self.pending.pop(chat_id, None)
+            finally:
+                self.ready.task_done()
+
+    async def _wait_turn(self, chat_id: int) -> None:
+        while True:
+            now = time.monotonic()
+            wait = max(self.paused_until, self.last_sent.get(chat_id, -self.chat_interval) + self.chat_interval) - now
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        await self.bucket.acquire()
+
+    # False if the message should be tried again
+    async def _deliver(self, message: Message) -> bool:
+        await self._wait_turn(message.chat_id)
+        message.attempts += 1
+        try:
+            await self.bot.send_message(message.chat_id, message.text)
+        except RetryAfter as e:
+            delay = e.retry_after
+            delay = delay.total_seconds() if isinstance(delay, timedelta) else delay
+            logger.warning(f"Flood control, delivery paused for {delay}s")
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            return self._retry(message, e)
+        except (BadRequest, Forbidden, ChatMigrated) as e:
+            # Chat is gone or the message can't be sent, retrying won't help
+            logger.warning(f"Can't deliver to {message.chat_id}: {e}")
+            self.failed += 1
+            return True
+        except NetworkError as e:
+            # Backoff holds the chat back, other chats go on
+            self._mark_sent(message.chat_id,
+                            time.monotonic() + random.uniform(0, self.backoff * 2 ** message.attempts))
+            return self._retry(message, e)
+        self._mark_sent(message.chat_id, time.monotonic())
+        self.latencies.append(time.monotonic() - message.created)
+        self.sent += 1
+        return True
+
+    def _mark_sent(self, chat_id: int, moment: float) -> None:
+        self.last_sent[chat_id] = moment
+        self.last_sent.move_to_end(chat_id)
+
+    def _forget_idle(self, now: float) -> None:
+        while self.last_sent:
+            chat_id, sent = next(iter(self.last_sent.items()))
+            if sent + self.chat_interval > now:
+                break
+            del self.last_sent[chat_id]
+
+    def _retry(self, message: Message, error: Exception) -> bool:
+        if message.attempts > self.retries:
+            logger.error(f"Giving up delivery to {message.chat_id}", exc_info=error)
+            self.failed += 1
+            return True
+        self.retried += 1
+        return False
@@ -0,0 +1,50 @@
+from collections import defaultdict
+from typing import Iterable
+
+from src.condition_parser import Node
+from src.enums import Column
+from src.fetch_planner import FetchPlanner, SeriesKey
+from src.tickers_naming import TickerNaming
+
+Input = tuple[SeriesKey, Column]
+
+
+# Notifications by the series and columns their conditions read
+class DependencyIndex:
+    def __init__(self):
+        self.readers: dict[Input, set[int]] = defaultdict(set)
+        self.inputs: dict[int, set[Input]] = dict()
+        self.namings: dict[SeriesKey, TickerNaming] = dict()
+
+    def __len__(self) -> int:
+        return len(self.inputs)
+
+    def add(self, id: int, condition: Node) -> None:
+        self.remove(id)
+        inputs = set()
+        for term in condition.terms():
+            key = FetchPlanner.series_key(term.naming)
+            self.namings[key] = term.naming
+            inputs.add((key, term.column))
+        self.inputs[id] = inputs
+        for item in inputs:
+            self.readers[item].add(id)
+
+    def remove(self, id: int) -> None:
+        for item in self.inputs.pop(id, ()):
+            self.readers[item].discard(id)
+            if not self.readers[item]:
+                del self.readers[item]
+        series = {key for key, _ in self.readers}
+        for key in self.namings.keys() - series:
+            del self.namings[key]
+
+    def clear(self) -> None:
+        self.readers.clear()
+        self.inputs.clear()
+        self.namings.clear()
+
+    # Notifications reading any column of the series
+    def dependents(self, series: Iterable[SeriesKey]) -> set[int]:
+        series = set(series)
+        return {id for (key, _), ids in self.readers.items() if key in series for id in ids}
@@ -14,7 +14,7 @@ class DialogLines(enum.Enum):
     help = DialogLine(
         "Possible commands:\n\n/help {command} - get info about some command\n\n/list - list all your "
         "notifications\n\n/add {condition} - create new notification\n\n/remove {notification_id} - remove "
-        "notification")
+        "notification\n\n/backtest {days} {condition} - check how often the condition held in the past")
     add_condition = DialogLine(
         "Example of syntax: #YNDX.low[2H].mean()*2<#POLY:AAPL.vol[C]\n\nWhere:\n - Possible functions: sum(), min(), "
         "max(), mean()\n\n - Tickers: #POLY:AAPL, where possible aggregators: MOEX, "
@@ -26,7 +26,11 @@ class DialogLines(enum.Enum):
         "C (current, exactly the same as 1T) and number before them")
     list_notifications = DialogLine("Use it to show active notifications and their ID's")
     remove_notification = DialogLine("Use it to remove active notification. Notification ID you can get from /list")
+    backtest_condition = DialogLine(
+        "Use it to check how often a condition held in the past: /backtest 30 #YNDX.mean[C]>2000 evaluates the "
+        "condition at every candle of the last 30 days. Number of days is optional, 30 by default")
     wrong_condition_syntax = DialogLine("Wrong syntax")
+    wrong_backtest_period = DialogLine("Wrong number of days. Check </help backtest> for help")
     wrong_notification_id = DialogLine("Wrong notification id. Check </help remove> for help")
     no_notifications = DialogLine("You have no any notifications")
     created_rule = DialogLine("Rule saved!")
@@ -98,11 +98,46 @@ class Column(enum.Enum):
     short_numb = "number_short"
 
 
+# How candles of a column are combined into a longer candle
+class ColumnAggregation(enum.Enum):
+    index = "first"
+    mean = "mean"
+    vol = "sum"
+    high = "max"
+    low = "min"
+    long = "mean"
+    short = "mean"
+    long_numb = "mean"
+    short_numb = "mean"
+
+
+# Pandas resample rules of the time spans which can be built from shorter candles
+class ResampleRule(enum.Enum):
+    hour = "h"
+    day = "D"
+    week = "W-MON"
+
+
+# Shorter time spans a time span can be built from, most preferable first
+class DerivedFrom(enum.Enum):
+    hour = ("minute",)
+    day = ("hour", "minute")
+    week = ("day", "hour", "minute")
+
+
+class EvaluationOutcome(enum.Enum):
+    fired = "fired"
+    quiet = "quiet"
+    timed_out = "timed out"
+    errored = "errored"
+
+
 class Command(enum.Enum):
     help = "help"
     add = "add"
     list = "list"
     remove = "remove"
+    backtest = "backtest"
 
 
 class CommandHelpMessage(enum.Enum):
@@ -110,3 +145,4 @@ class CommandHelpMessage(enum.Enum):
     add = DialogLines.add_condition
     list = DialogLines.list_notifications
     remove = DialogLines.remove_notification
+    backtest = DialogLines.backtest_condition
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Any, Iterable
+
+from src.condition_parser import Node, Term
+from src.config import evaluation_concurrency, condition_timeout
+from src.enums import EvaluationOutcome
+from src.fetch_planner import FetchPlanner
+from src.rolling import RollingEngine
+
+logger = logging.getLogger("submodule")
+
+
+# Tasks loading every term once, at most evaluation_concurrency at a time
+def start_loads(terms: set[Term], planner: FetchPlanner, rolling: RollingEngine | None = None,
+                timeout: float | None = None) -> dict[Term, asyncio.Task]:
+    for term in terms:
+        planner.plan(term.naming, *term.window)
+
+    semaphore = asyncio.Semaphore(evaluation_concurrency)
+
+    async def load(term: Term) -> Any:
+        async with semaphore:
+            return await asyncio.wait_for(term.load(planner, rolling), timeout)
+
+    return {term: asyncio.ensure_future(load(term)) for term in terms}
+
+
+# Values of terms, exceptions for terms which failed to load
+async def load_terms(terms: set[Term], planner: FetchPlanner, rolling: RollingEngine | None = None) -> dict[Term, Any]:
+    tasks = start_loads(terms, planner, rolling, condition_timeout)
+    return dict(zip(tasks, await asyncio.gather(*tasks.values(), return_exceptions=True)))
+
+
+# Every unique term is loaded once and every series once, through the planner shared by the conditions.
+# A condition which doesn't get all of its terms in time times out, loads of its terms go on for the others
+async def evaluate_conditions(conditions: Iterable[Node], planner: FetchPlanner,
+                              rolling: RollingEngine | None = None) -> dict[Node, EvaluationOutcome]:
+    conditions = list(conditions)
+    tasks = start_loads({term for condition in conditions for term in condition.terms()}, planner, rolling)
+
+    async def evaluate(condition: Node) -> EvaluationOutcome:
+        terms = set(condition.terms())
+        try:
+            await asyncio.wait_for(asyncio.wait([tasks[term] for term in terms]), condition_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Condition {condition} timed out")
+            return EvaluationOutcome.timed_out
+        try:
+            for term in terms:
+                if tasks[term].exception() is not None:
+                    raise tasks[term].exception()
+            fired = bool(condition.evaluate({term: tasks[term].result() for term in terms}))
+        except Exception as e:
+            logger.warning(f"Condition {condition} failed", exc_info=e)
+            return EvaluationOutcome.errored
+        return EvaluationOutcome.fired if fired else EvaluationOutcome.quiet
+
+    try:
+        outcomes = await asyncio.gather(*map(evaluate, conditions))
+    finally:
+        # Failures of terms only conditions which timed out read are reported by them
+        for task in tasks.values():
+            if task.done() and not task.cancelled():
+                task.exception()
+            task.cancel()
+    return dict(zip(conditions, outcomes))
@@ -8,3 +8,7 @@ class NonexistentNotification(Exception):
 
 class WrongCondition(Exception):
     pass
+
+
+class CircuitOpen(Exception):
+    pass
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+from src.config import moex_timezone
+from src.enums import Column
+from src.tickers_naming import TickerNaming
+
+logger = logging.getLogger("submodule")
+
+SeriesKey = tuple[str, str, str, str | None, str | None]
+MOEX_TIMEZONE = ZoneInfo(moex_timezone)
+
+
+# Candles are bounded by Moscow time
+def moex_now() -> datetime:
+    return datetime.now(MOEX_TIMEZONE)
+
+
+# Floor moment to the beginning of the candle it belongs to
+def snap_to_candle(moment: datetime, timespan: str) -> datetime:
+    moment = moment.replace(second=0, microsecond=0)
+    if timespan == "minute":
+        return moment
+    moment = moment.replace(minute=0)
+    if timespan == "hour":
+        return moment
+    moment = moment.replace(hour=0)
+    if timespan == "day":
+        return moment
+    if timespan == "week":
+        return moment - timedelta(days=moment.weekday())
+    if timespan == "month":
+        return moment.replace(day=1)
+    if timespan == "quarter":
+        return moment.replace(month=(moment.month - 1) // 3 * 3 + 1, day=1)
+    raise ValueError(f"Unknown timespan: {timespan}")
+
+
+# Loads every distinct series at most once per notification cycle.
+# Windows are measured in candles relative to the snapped tick time, requested windows of the same series are
+# merged into one superset load and concurrent requests for the same series share a single in-flight load
+class FetchPlanner:
+    def __init__(self, store_keeper, now: datetime | None = None):
+        self.store_keeper = store_keeper
+        self.now = now or moex_now()
+        self.windows: dict[SeriesKey, tuple[int, int]] = dict()
+        self.loads: dict[SeriesKey, tuple[tuple[int, int], asyncio.Task]] = dict()
+        self.fetches = 0
+
+    @staticmethod
+    def series_key(naming: TickerNaming) -> SeriesKey:
+        return naming.name, naming.aggregator.value, naming.timespan, naming.moex_market, naming.moex_engine
+
+    def anchor(self, timespan: str) -> datetime:
+        return snap_to_candle(self.now, timespan)
+
+    # Register window before loading so that it is merged into the superset load
+    def plan(self, naming: TickerNaming, start: int, end: int) -> None:
+        key = self.series_key(naming)
+        if key in self.windows:
+            planned_start, planned_end = self.windows[key]
+            start, end = min(start, planned_start), max(end, planned_end)
+        self.windows[key] = (start, end)
+
+    async def _load(self, naming: TickerNaming, start: int, end: int) -> pd.DataFrame:
+        self.fetches += 1
+        df = await self.store_keeper.async_get_ticker(naming, start, end, now=self.anchor(naming.timespan))
+        if df is None:
+            return pd.DataFrame(columns=[Column.index.value]).set_index(Column.index.value)
+        return df
+
+    async def get_ticker(self, naming: TickerNaming, start: int, end: int) -> pd.DataFrame:
+        if start >= end:
+            raise ValueError("Start time is greater than end time")
+        self.plan(naming, start, end)
+        key = self.series_key(naming)
+        loaded = self.loads.get(key)
+        if loaded is None or not (loaded[0][0] <= start and end <= loaded[0][1]):
+            window = self.windows[key]
+            loaded = window, asyncio.ensure_future(self._load(naming, *window))
+            self.loads[key] = loaded
+        # Shield the shared load so a cancelled waiter doesn't cancel it for the others
+        df = await asyncio.shield(loaded[1])
+
+        start_time, end_time = self.store_keeper.get_window(naming, start, end, self.anchor(naming.timespan))
+        return df.iloc[df.index.searchsorted(start_time.timestamp(), side="left"):
+                       df.index.searchsorted(end_time.timestamp(), side="right")]
@@ -0,0 +1,83 @@
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from src.config import moex_timezone
+from src.enums import Column
+
+ISS_URL = "https://iss.moex.com/iss"
+CANDLE_COLUMNS = ("begin", "open", "close", "high", "low", "volume")
+FUTOI_COLUMNS = {"pos_long": Column.long.value, "pos_short": Column.short.value,
+                 "pos_long_num": Column.long_numb.value, "pos_short_num": Column.short_numb.value}
+EPOCH = pd.Timestamp(0, tz="UTC")
+
+
+# ISS block {"columns": [...], "data": [[...], ...]} as a numpy array per column
+def parse_blocks(blocks: list[dict], dtypes: dict[str, str]) -> dict[str, np.ndarray] | None:
+    rows = list(chain.from_iterable(block["data"] for block in blocks))
+    if not rows:
+        return None
+    positions = {name: position for position, name in enumerate(blocks[0]["columns"])}
+    columns = list(zip(*rows))
+    return {name: np.array(columns[positions[name]], dtype=dtype) for name, dtype in dtypes.items()}
+
+
+# Moscow wall time of ISS to naive datetime64, ISS writes "YYYY-MM-DD hh:mm:ss"
+def parse_wall_time(values: np.ndarray) -> np.ndarray:
+    return values.astype("datetime64[s]")
+
+
+def to_timestamps(wall_time: np.ndarray | pd.DatetimeIndex) -> np.ndarray:
+    index = pd.DatetimeIndex(wall_time).tz_localize(moex_timezone, ambiguous="NaT", nonexistent="shift_forward")
+    return np.asarray((index - EPOCH) // pd.Timedelta(seconds=1), dtype=np.int64)
+
+
+# Start of the candle of the time span every wall time belongs to
+def floor_wall_time(wall_time: pd.DatetimeIndex, timespan: str) -> pd.DatetimeIndex:
+    if timespan == "minute":
+        return wall_time.floor("min")
+    if timespan == "hour":
+        return wall_time.floor("h")
+    day = wall_time.normalize()
+    if timespan == "day":
+        return day
+    if timespan == "week":
+        return day - pd.to_timedelta(day.weekday, unit="D")
+    if timespan == "month":
+        return wall_time.to_period("M").to_timestamp()
+    if timespan == "quarter":
+        return wall_time.to_period("Q").to_timestamp()
+    raise ValueError(f"Unknown timespan: {timespan}")
+
+
+def candles_frame(blocks: list[dict]) -> pd.DataFrame | None:
+    columns = parse_blocks(blocks, {"begin": "U19", "open": "f8", "close": "f8", "high": "f8", "low": "f8",
+                                    "volume": "f8"})
+    if columns is None:
+        return None
+    index = pd.Index(to_timestamps(parse_wall_time(columns["begin"])), name=Column.index.value)
+    return pd.DataFrame({Column.high.value: columns["high"], Column.low.value: columns["low"],
+                         Column.vol.value: columns["volume"],
+                         Column.mean.value: (columns["open"] + columns["close"]) / 2}, index=index)
+
+
+# Open interest of legal entities, 5 minute records averaged into candles of the time span
+def futoi_frame(blocks: list[dict], timespan: str) -> pd.DataFrame | None:
+    dtypes = {"tradedate": "U10", "tradetime": "U8", "clgroup": "U8"} | {name: "f8" for name in FUTOI_COLUMNS}
+    columns = parse_blocks(blocks, dtypes)
+    if columns is None:
+        return None
+    legal = columns["clgroup"] == "YUR"
+    wall_time = parse_wall_time(np.char.add(np.char.add(columns["tradedate"][legal], " "),
+                                            columns["tradetime"][legal]))
+    # Records are published every 5 minutes with a few seconds of jitter
+    seconds = wall_time.astype(np.int64)
+    wall_time = ((seconds + 150) // 300 * 300).astype("datetime64[s]")
+    buckets = floor_wall_time(pd.DatetimeIndex(wall_time), timespan)
+
+    df = pd.DataFrame({FUTOI_COLUMNS[name]: columns[name][legal] for name in FUTOI_COLUMNS})
+    df[Column.short.value] *= -1
+    df = df.groupby(to_timestamps(buckets), sort=True).mean().dropna(how="all")
+    df.index.name = Column.index.value
+    return df
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Iterable
+
+from src.config import notification_interval
+from src.fetch_planner import FetchPlanner, SeriesKey, moex_now
+from src.tickers_naming import TickerNaming
+from src.trading_calendar import market_of
+
+logger = logging.getLogger("submodule")
+
+
+@dataclass(frozen=True)
+class SeriesUpdated:
+    series: SeriesKey
+    # Referenced series built from the updated one
+    dependents: frozenset[SeriesKey]
+    start: float
+    end: float
+    candles: int
+
+
+# Polling loop per series referenced by notifications. Every poll downloads only candles after the stored final ones,
+# stores them and publishes an event if any candle is new or changed. Polling pauses while the market is closed
+class LiveTail:
+    def __init__(self, store_keeper, publish: Callable[[SeriesUpdated], None], interval: float = notification_interval):
+        self.store_keeper = store_keeper
+        self.publish = publish
+        self.interval = interval
+        self.sources: dict[SeriesKey, TickerNaming] = dict()
+        self.dependents: dict[SeriesKey, set[SeriesKey]] = dict()
+        self.tasks: dict[SeriesKey, asyncio.Task] = dict()
+        self.polls = 0
+        self.updates = 0
+        self.pauses = 0
+
+    def __str__(self) -> str:
+        return f"{len(self.tasks)} series, {self.polls} polls, {self.updates} updates, {self.pauses} pauses"
+
+    # Tail exactly the series the given ones are built from
+    def track(self, namings: Iterable[TickerNaming]) -> None:
+        sources = dict()
+        dependents = defaultdict(set)
+        for naming in namings:
+            source = self.store_keeper.get_source_naming(naming)
+            sources[FetchPlanner.series_key(source)] = source
+            dependents[FetchPlanner.series_key(source)].add(FetchPlanner.series_key(naming))
+        self.sources, self.dependents = sources, dict(dependents)
+
+        for key in self.tasks.keys() - self.sources.keys():
+            self.tasks.pop(key).cancel()
+        for key in self.sources.keys() - self.tasks.keys():
+            self.tasks[key] = asyncio.create_task(self._tail(key))
+
+    async def poll(self, key: SeriesKey) -> SeriesUpdated | None:
+        self.polls += 1
+        df = await self.store_keeper.tail(self.sources[key])
+        if df is None or df.empty:
+            return None
+        self.updates += 1
+        return SeriesUpdated(key, frozenset(self.dependents.get(key, ())), float(df.index[0]), float(df.index[-1]),
+                             len(df))
+
+    # Seconds till the market of the series opens if nothing was traded since the last candles were published.
+    # Only as long as the last download confirmed it's closed, so that polling checks the calendar now and then
+    def idle(self, key: SeriesKey) -> float:
+        naming = self.sources[key]
+        confirmed = self.store_keeper.closed_for(naming)
+        if not confirmed:
+            return 0
+        calendar, now = self.store_keeper.calendar, moex_now()
+        aggregator = self.store_keeper.aggregators.get(naming.aggregator.value)
+        published = now - (aggregator.delay if aggregator is not None else timedelta(0)) - \
+            timedelta(seconds=self.interval)
+        if calendar.has_trading(published, now + timedelta(seconds=self.interval), market_of(naming)):
+            return 0
+        opening = calendar.next_opening(now, market_of(naming))
+        return min(confirmed, (opening - now).total_seconds()) if opening is not None else confirmed
+
+    async def _tail(self, key: SeriesKey) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            idle = self.idle(key)
+            if idle:
+                logger.debug(f"Market of {key} is closed, polling paused for {idle:.0f}s")
+                self.pauses += 1
+                await asyncio.sleep(idle)
+                continue
+            try:
+                event = await self.poll(key)
+            except Exception as e:
+                logger.warning(f"Live tail of {key} failed", exc_info=e)
+                continue
+            if event is not None:
+                logger.debug(f"Series {key} updated: {event.candles} candles")
+                self.publish(event)
+
+    async def close(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks.clear()
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from src.config import request_rate, request_burst, request_in_flight, request_timeout, request_retries, \
+    request_backoff, request_backoff_max, circuit_failure_threshold, circuit_reset_timeout
+from src.exceptions import CircuitOpen
+
+logger = logging.getLogger("submodule")
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+# Requests are admitted at rate per second with bursts up to capacity.
+# A request that finds the bucket empty reserves the next token, so waiters are served in order
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    # Seconds to wait before the reserved token is available
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0., -self.tokens / self.rate)
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+# Closed: requests pass. Open after failure_threshold consecutive failures: requests fail fast.
+# Half-open after reset_timeout: a single probe passes, its outcome closes or reopens the circuit
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def check(self, host: str) -> None:
+        if self.opened_at is None:
+            return
+        if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            raise CircuitOpen(f"Circuit of {host} is open")
+        self.probing = True
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    # Probe ended without an outcome, e.g. it was cancelled
+    def abandon(self) -> None:
+        self.probing = False
+
+
+@dataclass
+class HostLimits:
+    bucket: TokenBucket
+    breaker: CircuitBreaker
+    in_flight: asyncio.Semaphore | None = None
+    loop: asyncio.AbstractEventLoop | None = None
+    requests: int = 0
+    retries: int = 0
+    rejected: int = 0
+
+    def semaphore(self, size: int) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self.in_flight is None or self.loop is not loop:
+            self.in_flight = asyncio.Semaphore(size)
+            self.loop = loop
+        return self.in_flight
+
+
+# Every request of aggregators goes through the scheduler. Per host it limits the request rate and the number of
+# requests in flight, retries 429, 5xx and connection errors with exponential backoff and full jitter, and fails fast
+# while the host is down
+class RequestScheduler:
+    def __init__(self, rate: float = request_rate, burst: float = request_burst, in_flight: int = request_in_flight,
+                 timeout: float = request_timeout, retries: int = request_retries, backoff: float = request_backoff,
+                 backoff_max: float = request_backoff_max, failure_threshold: int = circuit_failure_threshold,
+                 reset_timeout: float = circuit_reset_timeout):
+        self.rate = rate
+        self.burst = burst
+        self.in_flight = in_flight
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hosts: dict[str, HostLimits] = dict()
+
+    def __str__(self) -> str:
+        return ", ".join(f"{host}: {limits.requests} requests, {limits.retries} retries, {limits.rejected} rejected, "
+                         f"circuit {limits.breaker.state}" for host, limits in self.hosts.items())
+
+    def host(self, url: str) -> HostLimits:
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = HostLimits(TokenBucket(self.rate, self.burst),
+                                          CircuitBreaker(self.failure_threshold, self.reset_timeout))
+        return self.hosts[host]
+
+    def backoff_delay(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                try:
+                    return min(self.backoff_max, max(0., parsedate_to_datetime(retry_after).timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    async def _attempt(self, session: aiohttp.ClientSession, method: str, url: str, limits: HostLimits,
+                       **kwargs) -> tuple[int, bytes, aiohttp.ClientResponse]:
+        await limits.bucket.acquire()
+        async with limits.semaphore(self.in_flight):
+            limits.requests += 1
+            async with session.request(method, url, timeout=self.timeout, **kwargs) as response:
+                return response.status, await response.read(), response
+
+    # Body of the response. Raises aiohttp.ClientResponseError when the status is not successful after retries,
+    # CircuitOpen while the host is considered down
+    async def request(self, session: aiohttp.ClientSession, method: str, url: str, **kwargs) -> bytes:
+        limits = self.host(url)
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            try:
+                limits.breaker.check(host)
+            except CircuitOpen:
+                limits.rejected += 1
+                raise
+            retry_after = None
+            try:
+                status, body, response = await self._attempt(session, method, url, limits, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                limits.breaker.failure()
+                if attempt >= self.retries:
+                    raise
+                logger.debug(f"{method} {url} failed: {error!r}, retrying")
+            except BaseException:
+                limits.breaker.abandon()
+                raise
+            else:
+                if status < 400:
+                    limits.breaker.success()
+                    return body
+                if status >= 500:
+                    limits.breaker.failure()
+                else:
+                    # The host is up, it refuses this request
+                    limits.breaker.success()
+                if status not in RETRY_STATUSES or attempt >= self.retries:
+                    response.raise_for_status()
+                retry_after = response.headers.get("Retry-After")
+                logger.debug(f"{method} {url} returned {status}, retrying")
+            delay = self.backoff_delay(attempt, retry_after)
+            limits.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get_json(self, session: aiohttp.ClientSession, url: str, **kwargs) -> Any:
+        return json.loads(await self.request(session, "GET", url, **kwargs))
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, fields, replace
+from datetime import datetime, timedelta
+from typing import Iterable
+
+import numpy as np
+
+from src.config import candle_retention, compaction_interval, compaction_chunk, compaction_vacuum_pages
+from src.enums import ResampleRule
+from src.fetch_planner import snap_to_candle, moex_now, MOEX_TIMEZONE
+from src.scheduler import next_candle
+from src.tickers_naming import TickerNaming
+
+logger = logging.getLogger("submodule")
+
+
+@dataclass
+class CompactionReport:
+    series: int = 0
+    rows_deleted: int = 0
+    rows_rolled_up: int = 0
+    # Bytes the deleted candles took in the storage, and free bytes returned to the file system
+    bytes_reclaimed: int = 0
+    bytes_returned: int = 0
+    duration: float = 0.
+
+    def __str__(self) -> str:
+        return f"{self.rows_deleted} candles of {self.series} series deleted, {self.rows_rolled_up} rolled up, " \
+               f"{self.bytes_reclaimed / 1024 ** 2:.1f} MiB reclaimed, " \
+               f"{self.bytes_returned / 1024 ** 2:.1f} MiB returned to disk in {self.duration:.1f}s"
+
+
+# Candles older than the retention days of their time span are rolled up into candles of a longer time span and
+# deleted. Runs in the background in small steps on the database writer, so live reads and writes go on in between
+class Compactor:
+    def __init__(self, store_keeper, retention: dict[str, tuple[int, str | None]] = candle_retention,
+                 interval: float = compaction_interval, chunk: int = compaction_chunk,
+                 vacuum_pages: int = compaction_vacuum_pages):
+        for timespan, (_, rollup) in retention.items():
+            if rollup is not None and rollup not in ResampleRule.__members__:
+                raise ValueError(f"Candles of {timespan} can't be rolled up into {rollup}")
+        self.store_keeper = store_keeper
+        self.retention = retention
+        self.interval = interval
+        self.chunk = chunk
+        self.vacuum_pages = vacuum_pages
+        self.task: asyncio.Task | None = None
+        self.total = CompactionReport()
+
+    def __str__(self) -> str:
+        return str(self.total)
+
+    def start(self) -> None:
+        if self.retention and self.task is None:
+            self.task = asyncio.create_task(self._compact())
+
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _compact(self) -> None:
+        while True:
+            try:
+                logger.info(f"Compaction: {await self.run()}")
+            except Exception as e:
+                logger.error("Compaction failed", exc_info=e)
+            await asyncio.sleep(self.interval * 60 * 60)
+
+    # Compact the given series, every series of the ticker catalog if None
+    async def run(self, now: datetime | None = None,
+                  namings: Iterable[TickerNaming] | None = None) -> CompactionReport:
+        now = now or moex_now()
+        start = time.perf_counter()
+        async_storage = self.store_keeper.async_storage
+        if namings is None:
+            namings = await async_storage.run(self.store_keeper.get_registered_namings)
+        report = CompactionReport()
+        for naming in namings:
+            if naming.timespan in self.retention:
+                days, rollup = self.retention[naming.timespan]
+                await self.compact(naming, now - timedelta(days=days), rollup, report)
+        while returned := await async_storage.execute(async_storage.storage.vacuum, self.vacuum_pages):
+            report.bytes_returned += returned
+        report.duration = time.perf_counter() - start
+
+        for field in fields(report):
+            setattr(self.total, field.name, getattr(self.total, field.name) + getattr(report, field.name))
+        return report
+
+    async def compact(self, naming: TickerNaming, moment: datetime, rollup: str | None,
+                      report: CompactionReport) -> None:
+        async_storage = self.store_keeper.async_storage
+        storing_name = self.store_keeper.get_storing_name(naming)
+        cutoff = snap_to_candle(moment.astimezone(MOEX_TIMEZONE), rollup or naming.timespan).timestamp()
+        footprint = await async_storage.run(async_storage.storage.footprint, storing_name)
+        if rollup is not None:
+            report.rows_rolled_up += await self.roll_up(naming, rollup, cutoff)
+
+        deleted = 0
+        while rows := await async_storage.execute(async_storage.storage.delete, storing_name, cutoff, self.chunk):
+            deleted += rows
+        await self.store_keeper.async_remove_coverage(naming, cutoff)
+        if deleted:
+            logger.debug(f"Deleted {deleted} candles of {storing_name} before {cutoff}")
+            report.series += 1
+            report.rows_deleted += deleted
+            report.bytes_reclaimed += max(0, footprint - await async_storage.run(async_storage.storage.footprint,
+                                                                                 storing_name))
+
+    # Store candles of the longer time span built from the stored candles starting before the cutoff, unless they are
+    # stored already. Returns the number of built candles
+    async def roll_up(self, naming: TickerNaming, rollup: str, cutoff: float) -> int:
+        target = replace(naming, timespan=rollup)
+        rows = 0
+        for covered_start, covered_end in list(self.store_keeper.get_coverage(naming)):
+            # Only candles of the longer time span which are stored completely
+            start = snap_to_candle(datetime.fromtimestamp(covered_start, MOEX_TIMEZONE), rollup)
+            if start.timestamp() < covered_start:
+                start = next_candle(start, rollup)
+            end = snap_to_candle(datetime.fromtimestamp(min(covered_end, cutoff), MOEX_TIMEZONE), rollup)
+            while start < end:
+                # Steps of whole candles of about the chunk size
+                step = start
+                while step < end and (step - start).total_seconds() < self.chunk * 60:
+                    step = next_candle(step, rollup)
+                rows += await self._roll_up_step(naming, target, start.timestamp(), step.timestamp())
+                start = step
+        return rows
+
+    async def _roll_up_step(self, naming: TickerNaming, target: TickerNaming, start: float, end: float) -> int:
+        df = await self.store_keeper.async_get_ticker_from_db(naming, start, end - 1)
+        if df is not None and not df.empty:
+            df = self.store_keeper.resample_candles(df, target.timespan)
+            index = df.index.to_numpy()
+            covered = np.zeros(len(index), dtype=bool)
+            for covered_start, covered_end in self.store_keeper.get_coverage(target):
+                covered |= (covered_start <= index) & (index < covered_end)
+            df = df[~covered]
+            await self.store_keeper.async_add_ticker_to_db(target, df)
+        await self.store_keeper.async_add_coverage(target, start, end)
+        return 0 if df is None else len(df)
@@ -0,0 +1,123 @@
+import math
+from collections import deque
+from typing import Hashable
+
+import numpy as np
+import pandas as pd
+
+FUNCTIONS = ("mean", "max", "min", "sum")
+
+
+# Aggregate of the last length candles of a window sliding forward in time, equal to
+# series.tail(length).<function>() of the candles in the window.
+# Final candles enter the window once and leave it once, so an update costs O(1) amortized per new candle.
+# Candles which are not final yet may still change and are aggregated on every update
+class RollingWindow:
+    def __init__(self, length: int, function: str):
+        if function not in FUNCTIONS:
+            raise ValueError(f"Unknown function: {function}")
+        self.length = length
+        self.function = function
+        # Final candles of the window as (timestamp, value)
+        self.candles: deque[tuple[float, float]] = deque()
+        self.total = 0.
+        self.count = 0
+        self.evicted = 0
+        # Candles with non-increasing (max) or non-decreasing (min) values, the extreme is the first one
+        self.extremes: deque[tuple[float, float]] = deque()
+        self.rebuilds = 0
+
+    def _better(self, left: float, right: float) -> bool:
+        return left >= right if self.function == "max" else left <= right
+
+    def clear(self) -> None:
+        self.candles.clear()
+        self.extremes.clear()
+        self.total = 0.
+        self.count = 0
+        self.evicted = 0
+
+    def _push(self, timestamp: float, value: float) -> None:
+        self.candles.append((timestamp, value))
+        if math.isnan(value):
+            return
+        self.total += value
+        self.count += 1
+        if self.function not in ("max", "min"):
+            return
+        while self.extremes and not self._better(self.extremes[-1][1], value):
+            self.extremes.pop()
+        self.extremes.append((timestamp, value))
+
+    def _evict(self) -> None:
+        timestamp, value = self.candles.popleft()
+        if self.extremes and self.extremes[0][0] == timestamp:
+            self.extremes.popleft()
+        if math.isnan(value):
+            return
+        self.total -= value
+        self.count -= 1
+        self.evicted += 1
+        # Sum of many additions and subtractions drifts, recounting after every length evictions keeps it exact
+        if self.evicted >= self.length:
+            values = [value for _, value in self.candles if not math.isnan(value)]
+            self.total = math.fsum(values)
+            self.evicted = 0
+
+    def _combine(self, pending: np.ndarray) -> float:
+        pending = pending[~np.isnan(pending)]
+        if self.function in ("mean", "sum"):
+            total = self.total + float(pending.sum())
+            if self.function == "sum":
+                return total
+            count = self.count + len(pending)
+            return total / count if count else math.nan
+        values = [self.extremes[0][1]] if self.extremes else []
+        values.extend(pending.tolist())
+        if not values:
+            return math.nan
+        return max(values) if self.function == "max" else min(values)
+
+    # series holds every candle of the window ordered by time, candles at final and later may change
+    def update(self, series: pd.Series, final: float) -> float:
+        index = series.index
+        position = 0
+        if self.candles:
+            last = self.candles[-1][0]
+            position = int(index.searchsorted(last, side="left"))
+            if position < len(index) and index[position] == last:
+                position += 1
+            elif len(index) and last >= index[0]:
+                # History changed under the window
+                self.rebuilds += 1
+                self.clear()
+                position = 0
+        # Older candles would leave the window right away
+        position = max(position, len(index) - self.length)
+
+        values = series.iloc[position:].to_numpy(dtype=np.float64, na_value=np.nan)
+        pending_from = max(0, int(index.searchsorted(final, side="left")) - position)
+        for timestamp, value in zip(index[position:position + pending_from], values[:pending_from]):
+            self._push(float(timestamp), float(value))
+        pending = values[pending_from:]
+
+        start = index[max(0, len(index) - self.length)] if len(index) else math.inf
+        while self.candles and (self.candles[0][0] < start or len(self.candles) > self.length - len(pending)):
+            self._evict()
+        return self._combine(pending)
+
+
+# Rolling windows of condition terms, by series, column, window and function
+class RollingEngine:
+    def __init__(self):
+        self.windows: dict[Hashable, RollingWindow] = dict()
+
+    def aggregate(self, key: Hashable, series: pd.Series, length: int, function: str, final: float) -> float:
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = RollingWindow(length, function)
+        return window.update(series, final)
+
+    def retain(self, keys: set[Hashable]) -> None:
+        for key in self.windows.keys() - keys:
+            del self.windows[key]
@@ -0,0 +1,145 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from src.condition_parser import Node
+from src.config import notification_interval, scheduler_grace
+from src.enums import ToMinutes
+from src.fetch_planner import snap_to_candle
+from src.trading_calendar import TradingCalendar
+
+logger = logging.getLogger("submodule")
+# Groups evaluated whenever the live tail brings new candles of their series
+FOLLOWING_UPDATES = ("minute",)
+
+
+def finest_timespan(condition: Node) -> str:
+    return min((term.timespan for term in condition.terms()), key=lambda timespan: ToMinutes[timespan].value)
+
+
+def next_candle(start: datetime, timespan: str) -> datetime:
+    if timespan == "month":
+        return (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+    if timespan == "quarter":
+        return next_candle(next_candle(next_candle(start, "month"), "month"), "month")
+    return start + timedelta(minutes=ToMinutes[timespan].value)
+
+
+# End of the first candle closing after the moment which had a chance to trade on any market
+def next_boundary(moment: datetime, timespan: str, calendar: TradingCalendar) -> datetime:
+    start = snap_to_candle(moment, timespan)
+    while True:
+        end = next_candle(start, timespan)
+        if calendar.has_trading(start, end):
+            return end
+        # Short candles between sessions are skipped at once
+        opening = calendar.next_opening(start)
+        if opening is None:
+            return end
+        start = snap_to_candle(opening, timespan) if end <= opening else end
+
+
+# Groups notifications by the finest time span they read. A group is evaluated just after a candle of its time span
+# closes and is published, except for groups following live tail updates. New notifications are evaluated at once
+class EvaluationScheduler:
+    def __init__(self, interval: float = notification_interval, grace: float = scheduler_grace,
+                 calendar: TradingCalendar | None = None):
+        self.interval = interval
+        self.calendar = calendar or TradingCalendar()
+        self.grace = timedelta(seconds=grace)
+        self.timespans: dict[int, str] = dict()
+        self.groups: dict[str, set[int]] = defaultdict(set)
+        # Publication delay of the slowest aggregator a notification of the group reads
+        self.delays: dict[int, timedelta] = dict()
+        self.due: dict[str, datetime] = dict()
+        self.fresh: set[int] = set()
+        self.evaluated = 0
+        # Evaluations a fixed timer of the interval would have run
+        self.fixed = 0.
+        self.last: float | None = None
+
+    def __str__(self) -> str:
+        groups = ", ".join(f"{timespan} {len(ids)}" for timespan, ids in self.groups.items() if ids)
+        return f"groups: {groups or 'none'}, evaluated {self.evaluated}, avoided {self.avoided} of " \
+               f"{self.fixed:.0f} by fixed timer"
+
+    @property
+    def avoided(self) -> int:
+        return max(0, round(self.fixed) - self.evaluated)
+
+    def add(self, id: int, condition: Node, delay: timedelta = timedelta(0)) -> None:
+        self.remove(id)
+        timespan = finest_timespan(condition)
+        delay_before = self.group_delay(timespan)
+        self.timespans[id] = timespan
+        self.groups[timespan].add(id)
+        self.delays[id] = delay
+        self.fresh.add(id)
+        self._delay_changed(timespan, delay_before)
+
+    def remove(self, id: int) -> None:
+        timespan = self.timespans.pop(id, None)
+        if timespan is not None:
+            delay_before = self.group_delay(timespan)
+            self.groups[timespan].discard(id)
+            self._delay_changed(timespan, delay_before)
+        self.delays.pop(id, None)
+        self.fresh.discard(id)
+
+    # The group is due at another moment once its delay changes
+    def _delay_changed(self, timespan: str, delay_before: timedelta) -> None:
+        if self.group_delay(timespan) != delay_before:
+            self.due.pop(timespan, None)
+
+    def clear(self) -> None:
+        self.timespans.clear()
+        self.groups.clear()
+        self.delays.clear()
+        self.due.clear()
+        self.fresh.clear()
+
+    def group_delay(self, timespan: str) -> timedelta:
+        return max((self.delays[id] for id in self.groups[timespan]), default=timedelta(0))
+
+    # Moment the group is evaluated at for the first candle closing after the moment
+    def next_due(self, timespan: str, moment: datetime) -> datetime:
+        delay = self.group_delay(timespan) + self.grace
+        return next_boundary(moment - delay, timespan, self.calendar) + delay
+
+    def seconds_until_due(self, now: datetime) -> float | None:
+        moments = [self.due.setdefault(timespan, self.next_due(timespan, now))
+                   for timespan, ids in self.groups.items() if ids and timespan not in FOLLOWING_UPDATES]
+        return max(0., (min(moments) - now).total_seconds()) if moments else None
+
+    # Moment the next group is due at and notifications of the groups due at it
+    def upcoming(self, now: datetime) -> tuple[datetime, set[int]] | None:
+        if self.seconds_until_due(now) is None:
+            return None
+        groups = {timespan: ids for timespan, ids in self.groups.items() if ids and timespan not in FOLLOWING_UPDATES}
+        moment = min(self.due[timespan] for timespan in groups)
+        return moment, {id for timespan, ids in groups.items() if self.due[timespan] == moment for id in ids}
+
+    # Notifications to evaluate now out of those with updated inputs, every notification if updated is None
+    def select(self, updated: Iterable[int] | None, now: datetime) -> set[int]:
+        monotonic = time.monotonic()
+        if self.last is not None:
+            self.fixed += (monotonic - self.last) / self.interval * len(self.timespans)
+        self.last = monotonic
+
+        if updated is None:
+            selected = set(self.timespans)
+        else:
+            selected = {id for id in updated if self.timespans.get(id) in FOLLOWING_UPDATES} | \
+                       (self.fresh & set(updated))
+        for timespan, ids in self.groups.items():
+            if not ids or timespan in FOLLOWING_UPDATES:
+                continue
+            if self.due.setdefault(timespan, self.next_due(timespan, now)) <= now:
+                logger.debug(f"Candle of {timespan} closed, evaluating {len(ids)} notifications")
+                selected |= ids
+                self.due[timespan] = self.next_due(timespan, now)
+        self.fresh -= selected
+        self.evaluated += len(selected)
+        return selected
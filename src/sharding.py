@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import logging.config
+import multiprocessing
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from src.condition_parser import Node
+from src.config import LOGGER_CONFIG
+from src.enums import EvaluationOutcome
+from src.evaluation import evaluate_conditions
+from src.fetch_planner import FetchPlanner
+from src.rolling import RollingEngine
+from src.store_keeper import StoreKeeper
+
+logger = logging.getLogger("submodule")
+
+
+# Evaluation state of a worker process: its own series cache, rolling windows and event loop.
+# Workers only read stored candles, the bot process downloads and stores them before sending conditions
+class ShardWorker:
+    def __init__(self, db_file: Path | None):
+        self.loop = asyncio.new_event_loop()
+        self.store_keeper = StoreKeeper(db_file, read_only=True)
+        self.rolling = RollingEngine()
+
+    def evaluate(self, conditions: list[Node], now: datetime,
+                 updated: dict[str, tuple[float, float] | None]) -> list[EvaluationOutcome]:
+        # Series written by the bot process are read again
+        for storing_name, tailed in updated.items():
+            self.store_keeper.forget(storing_name, tailed)
+        planner = FetchPlanner(self.store_keeper, now)
+        outcomes = self.loop.run_until_complete(evaluate_conditions(conditions, planner, self.rolling))
+        return [outcomes[condition] for condition in conditions]
+
+
+_worker: ShardWorker | None = None
+
+
+def _init_worker(db_file: Path | None) -> None:
+    global _worker
+    logging.config.dictConfig(LOGGER_CONFIG)
+    _worker = ShardWorker(db_file)
+
+
+def _evaluate_shard(conditions: list[Node], now: datetime,
+                    updated: dict[str, tuple[float, float] | None]) -> list[EvaluationOutcome]:
+    return _worker.evaluate(conditions, now, updated)
+
+
+# Conditions are sharded by the series they read across single-process pools,
+# so that a series is always loaded, cached and rolled by the same worker
+class ShardedEvaluator:
+    def __init__(self, workers: int, db_file: Path | None = None):
+        context = multiprocessing.get_context("spawn")
+        self.pools = [ProcessPoolExecutor(1, mp_context=context, initializer=_init_worker,
+                                          initargs=(db_file,)) for _ in range(workers)]
+        # Live tail ranges of series written by the bot process since the last evaluation of a shard, by storing name
+        self.updated: list[dict[str, tuple[float, float] | None]] = [dict() for _ in range(workers)]
+
+    def __len__(self) -> int:
+        return len(self.pools)
+
+    # crc32 is stable across processes unlike hash of str
+    def shard(self, condition: Node) -> int:
+        series = min(FetchPlanner.series_key(term.naming) for term in condition.terms())
+        return zlib.crc32(repr(series).encode()) % len(self.pools)
+
+    def invalidate(self, updates: dict[str, tuple[float, float] | None]) -> None:
+        for updated in self.updated:
+            updated |= updates
+
+    async def evaluate(self, conditions: list[Node], now: datetime) -> dict[Node, EvaluationOutcome]:
+        shards: dict[int, list[Node]] = defaultdict(list)
+        for condition in conditions:
+            shards[self.shard(condition)].append(condition)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        updates = dict()
+        for shard, items in shards.items():
+            updates[shard], self.updated[shard] = self.updated[shard], dict()
+            futures.append(loop.run_in_executor(self.pools[shard], _evaluate_shard, items, now, updates[shard]))
+        outcomes = dict()
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for (shard, items), result in zip(shards.items(), results):
+            if isinstance(result, Exception):
+                logger.error(f"Evaluation of shard {shard} failed", exc_info=result)
+                self.updated[shard] = updates[shard] | self.updated[shard]
+                result = [EvaluationOutcome.errored] * len(items)
+            outcomes.update(zip(items, result))
+        return outcomes
+
+    def close(self) -> None:
+        for pool in self.pools:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -1,32 +1,78 @@
 import logging
+import threading
+import time
+from dataclasses import replace
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Awaitable
+from typing import Awaitable, Iterable
 
 import pandas as pd
-from sqlalchemy import text, select
+from sqlalchemy import select, delete
 
 from src import db_session
 from src.aggregators import MOEX, MOEXAnalytical, Aggregator
-from src.enums import AggregatorShortName, AggregatorName, Column, ToMinutes
+from src.async_storage import AsyncStorage, CoverageRanges
+from src.candle_cache import CandleCache
+from src.candle_storage import CandleStorage, SQLiteStorage, ColumnarStorage
+from src.config import candle_cache_budget, candle_storage, columnar_storage_dir, moex_timezone, db_file_path, \
+    closed_skip_ttl
+from src.coverage import Coverage
+from src.enums import AggregatorShortName, AggregatorName, Column, ColumnAggregation, DerivedFrom, ResampleRule, \
+    ToMinutes, DBInterval
 from src.exceptions import NonexistentNotification
+from src.fetch_planner import snap_to_candle, moex_now, MOEX_TIMEZONE
 from src.notifications import Notification
+from src.request_scheduler import RequestScheduler
 from src.tickers import Ticker
 from src.tickers_naming import TickerNaming
+from src.trading_calendar import TradingCalendar, market_of
 
 logger = logging.getLogger("submodule")
 
 
 class StoreKeeper:
-    def __init__(self):
-        self.aggregators: dict[str, Aggregator] = {
+    def __init__(self, db_file: Path | None = None, request_scheduler: RequestScheduler | None = None,
+                 aggregators: dict[str, Aggregator] | None = None, read_only: bool = False):
+        # Shared, so that limits of a host hold for all aggregators requesting it
+        self.request_scheduler = request_scheduler or RequestScheduler()
+        self.aggregators: dict[str, Aggregator] = aggregators or {
             # AggregatorName.polygon.value: Polygon(),
             # AggregatorName.yfinance.value: YahooFinance(),
-            AggregatorName.moex.value: MOEX(),
-            AggregatorName.moex_analytic.value: MOEXAnalytical(),
+            AggregatorName.moex.value: MOEX(self.request_scheduler),
+            AggregatorName.moex_analytic.value: MOEXAnalytical(self.request_scheduler),
         }
+        # Stored time ranges by storing name, sorted and disjoint
+        self.coverage: dict[str, list[tuple[float, float]]] = dict()
+        self.candle_cache = CandleCache(candle_cache_budget)
+        # Bumped on every write of a column of a series, by storing name and column
+        self.versions: dict[tuple[str, str], int] = dict()
+        # Range of timestamps downloaded by the last live tail poll of a series, by storing name
+        self.tailed: dict[str, tuple[float, float]] = dict()
+        # Storing names of series registered in the ticker catalog
+        self.tickers: set[str] = set()
+        self.register_lock = threading.Lock()
+        self.calendar = TradingCalendar()
+        # Start of the range a download found closed and when that stops being trusted, by storing name
+        self.closed: dict[str, tuple[float, float]] = dict()
+        self.closed_ttl = closed_skip_ttl
+        # Downloads skipped because the market was closed over the whole range
+        self.closed_skips = 0
+        # Only stored candles are read, another process downloads and stores them
+        self.read_only = read_only
+        # Storing names of series written or covered since they were last taken
+        self.changed: set[str] = set()
 
-        db_session.global_init(Path().resolve() / "res/db/athena_data.sqlite")
+        db_session.global_init(db_file or Path().resolve() / db_file_path)
+        self.storage: CandleStorage = ColumnarStorage(Path().resolve() / columnar_storage_dir) \
+            if candle_storage == "columnar" else SQLiteStorage()
+        self.load_tickers()
+        self.storage.migrate(sorted(self.tickers))
+        self.async_storage = AsyncStorage(self.storage, self.save_coverage)
+
+    async def close(self) -> None:
+        for aggregator in self.aggregators.values():
+            await aggregator.close()
+        await self.async_storage.close()
 
     # Universal storing name
     # Example: poly_gold, yfin_silver, etc.
@@ -34,105 +80,362 @@ class StoreKeeper:
     def get_storing_name(naming: TickerNaming) -> str:
         return f"{AggregatorShortName[naming.aggregator.name].value}_{naming.name}_{naming.db_interval()}"
 
+    def load_tickers(self) -> None:
+        with db_session.create_session() as session:
+            tickers = session.execute(select(Ticker)).scalars().all()
+        for ticker in tickers:
+            short_name = AggregatorShortName[AggregatorName(ticker.aggregator).name].value
+            self.tickers.add(f"{short_name}_{ticker.name}_{ticker.timespan}")
+
+    # Series of the ticker catalog
+    @staticmethod
+    def get_registered_namings() -> list[TickerNaming]:
+        with db_session.create_session() as session:
+            tickers = session.execute(select(Ticker)).scalars().all()
+        return [TickerNaming(ticker.name, AggregatorName(ticker.aggregator), DBInterval(ticker.timespan).name)
+                for ticker in tickers]
+
+    # Add series to the ticker catalog if it isn't there yet. Safe to call from database threads
+    def register_ticker(self, naming: TickerNaming) -> None:
+        storing_name = self.get_storing_name(naming)
+        if storing_name in self.tickers:
+            return
+        with self.register_lock, db_session.create_session() as session:
+            ticker = session.execute(select(Ticker).where((Ticker.name == naming.name) &
+                                                          (Ticker.aggregator == naming.aggregator.value) &
+                                                          (Ticker.timespan == naming.db_interval()))).scalar()
+            if ticker is None:
+                ticker = Ticker()
+                ticker.name = naming.name
+                ticker.aggregator = naming.aggregator.value
+                ticker.timespan = naming.db_interval()
+                session.add(ticker)
+                session.commit()
+        self.tickers.add(storing_name)
+
     # Save ticker data to db
-    def add_ticker_to_db(self, naming: TickerNaming, df: pd.DataFrame) -> None:
+    def add_ticker_to_db(self, naming: TickerNaming, df: pd.DataFrame, changed: list[str] | None = None) -> None:
         if df is None or df.empty:
             return
-        session = db_session.create_session()
-        ticker = session.execute(select(Ticker).where((Ticker.name == naming.name) &
-                                                      (Ticker.aggregator == naming.aggregator.value) &
-                                                      (Ticker.timespan == naming.db_interval()))).scalar()
-        if ticker is None:
-            ticker = Ticker()
-            ticker.name = naming.name
-            ticker.aggregator = naming.aggregator.value
-            ticker.timespan = naming.db_interval()
-            session.add(ticker)
-            session.commit()
-        session.commit()
+        self.register_ticker(naming)
+
+        storing_name = self.get_storing_name(naming)
+        self.storage.write(storing_name, df)
+        self.bump_versions(storing_name, df.columns if changed is None else changed)
+
+    # Same as add_ticker_to_db without blocking the event loop. Concurrent writes are grouped into one transaction
+    async def async_add_ticker_to_db(self, naming: TickerNaming, df: pd.DataFrame,
+                                     changed: list[str] | None = None) -> None:
+        if df is None or df.empty:
+            return
+        storing_name = self.get_storing_name(naming)
+        if storing_name not in self.tickers:
+            await self.async_storage.run(self.register_ticker, naming)
+        await self.async_storage.write(storing_name, df)
+        self.bump_versions(storing_name, df.columns if changed is None else changed)
 
-        df.to_sql(self.get_storing_name(naming), session.bind, if_exists='append')
-        session.close()
+    def bump_versions(self, storing_name: str, columns: Iterable[str]) -> None:
+        self.changed.add(storing_name)
+        for column in columns:
+            self.versions[storing_name, column] = self.versions.get((storing_name, column), 0) + 1
+
+    # Changes whenever candles the series is built from change
+    def get_version(self, naming: TickerNaming, column: Column) -> tuple[int, ...]:
+        bases = DerivedFrom[naming.timespan].value if naming.timespan in DerivedFrom.__members__ else ()
+        namings = [naming] + [replace(naming, timespan=timespan) for timespan in bases]
+        return tuple(self.versions.get((self.get_storing_name(item), column.value), 0) for item in namings)
 
     # Download ticker data from db
     def get_ticker_from_db(self, naming: TickerNaming, start: float,
                            end: float) -> pd.DataFrame | None:
-        session = db_session.create_session()
-        ticker = session.execute(select(Ticker).where((Ticker.name == naming.name) &
-                                                      (Ticker.aggregator == naming.aggregator.value) &
-                                                      (Ticker.timespan == naming.db_interval()))).scalar()
-        if ticker is None:
+        return self.storage.read(self.get_storing_name(naming), start, end)
+
+    async def async_get_ticker_from_db(self, naming: TickerNaming, start: float,
+                                       end: float) -> pd.DataFrame | None:
+        return await self.async_storage.read(self.get_storing_name(naming), start, end)
+
+    # Window of candles [start, end] relative to the moment now
+    @staticmethod
+    def get_window(naming: TickerNaming, start: int, end: int, now: datetime) -> tuple[datetime, datetime]:
+        start_time = now + timedelta(minutes=start * ToMinutes[naming.timespan].value)
+        end_time = now + timedelta(minutes=end * ToMinutes[naming.timespan].value)
+        return start_time, end_time
+
+    def get_coverage(self, naming: TickerNaming) -> list[tuple[float, float]]:
+        storing_name = self.get_storing_name(naming)
+        if storing_name not in self.coverage:
+            with db_session.create_session() as session:
+                ranges = session.execute(select(Coverage).where(Coverage.series == storing_name)
+                                         .order_by(Coverage.start)).scalars().all()
+            self.coverage[storing_name] = [(item.start, item.end) for item in ranges]
+        return self.coverage[storing_name]
+
+    # Mark [start, end) of the series as stored
+    def add_coverage(self, naming: TickerNaming, start: float, end: float) -> None:
+        if start < end:
+            storing_name = self.get_storing_name(naming)
+            self.save_coverage({storing_name: self.merge_coverage(naming, start, end)})
+
+    async def async_add_coverage(self, naming: TickerNaming, start: float, end: float) -> None:
+        if start < end:
+            storing_name = self.get_storing_name(naming)
+            await self.async_storage.cover(storing_name, self.merge_coverage(naming, start, end))
+
+    # Forget candles of the series starting before end, once they are deleted
+    async def async_remove_coverage(self, naming: TickerNaming, end: float) -> None:
+        coverage = self.get_coverage(naming)
+        ranges = [(max(start, end), covered_end) for start, covered_end in coverage if covered_end > end]
+        if ranges != coverage:
+            storing_name = self.get_storing_name(naming)
+            self.coverage[storing_name] = ranges
+            self.changed.add(storing_name)
+            await self.async_storage.cover(storing_name, ranges)
+
+    # Merge [start, end) into the coverage kept in memory
+    def merge_coverage(self, naming: TickerNaming, start: float, end: float) -> list[tuple[float, float]]:
+        ranges = []
+        for covered_start, covered_end in self.get_coverage(naming):
+            if covered_end < start or end < covered_start:
+                ranges.append((covered_start, covered_end))
+            else:
+                start, end = min(start, covered_start), max(end, covered_end)
+        ranges.append((start, end))
+        ranges.sort()
+        self.coverage[self.get_storing_name(naming)] = ranges
+        self.changed.add(self.get_storing_name(naming))
+        return ranges
+
+    # Storing names of series written or covered since the last call
+    def take_changed(self) -> set[str]:
+        changed, self.changed = self.changed, set()
+        return changed
+
+    # Another process wrote the series, state kept of it is read again
+    def forget(self, storing_name: str, tailed: tuple[float, float] | None = None) -> None:
+        self.coverage.pop(storing_name, None)
+        self.candle_cache.invalidate(storing_name)
+        self.storage.forget(storing_name)
+        if tailed is not None:
+            self.tailed[storing_name] = tailed
+
+    @staticmethod
+    def save_coverage(coverage: CoverageRanges) -> None:
+        with db_session.create_session() as session:
+            for storing_name, ranges in coverage.items():
+                session.execute(delete(Coverage).where(Coverage.series == storing_name))
+                session.add_all(Coverage(series=storing_name, start=start, end=end) for start, end in ranges)
+            session.commit()
+
+    # Parts of [start, end] which are not stored yet
+    @staticmethod
+    def get_missing_intervals(coverage: list[tuple[float, float]], start: float,
+                              end: float) -> list[tuple[float, float]]:
+        missing = []
+        for covered_start, covered_end in coverage:
+            if covered_end <= start:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > start:
+                missing.append((start, covered_start))
+            start = covered_end
+        if start <= end:
+            missing.append((start, end))
+        return missing
+
+    # Final candles are closed and published, so they won't change anymore
+    def get_final_timestamp(self, naming: TickerNaming) -> float:
+        aggregator = self.aggregators[naming.aggregator.value]
+        return snap_to_candle(moex_now() - aggregator.delay, naming.timespan).timestamp()
+
+    def get_missing_final_intervals(self, naming: TickerNaming, start: float, end: float) -> list[tuple[float, float]]:
+        return self.get_missing_intervals(self.get_coverage(naming), start,
+                                          min(end, self.get_final_timestamp(naming) - 1))
+
+    # Aggregate candles into candles of a longer time span
+    @staticmethod
+    def resample_candles(df: pd.DataFrame, timespan: str) -> pd.DataFrame:
+        epoch = pd.Timestamp(0, tz="UTC")
+        index = pd.to_datetime(df.index, unit="s", utc=True).tz_convert(moex_timezone)
+        aggregations = {column: ColumnAggregation[Column(column).name].value for column in df.columns}
+        resampler = df.set_axis(index).resample(ResampleRule[timespan].value, label="left", closed="left")
+        resampled = resampler.agg(aggregations)[resampler.size() > 0]
+        resampled.index = pd.Index((resampled.index - epoch) // pd.Timedelta(seconds=1), name=Column.index.value)
+        return resampled
+
+    # No candle starting in [start, end] can exist if the market doesn't trade till the last of them closes
+    def is_closed(self, naming: TickerNaming, start: float, end: float) -> bool:
+        candle_end = end + ToMinutes[naming.timespan].value * 60
+        return not self.calendar.has_trading(datetime.fromtimestamp(start, MOEX_TIMEZONE),
+                                             datetime.fromtimestamp(candle_end, MOEX_TIMEZONE), market_of(naming))
+
+    # Seconds the last download finding the market of the series closed is trusted for
+    def closed_for(self, naming: TickerNaming) -> float:
+        checked = self.closed.get(self.get_storing_name(naming))
+        return max(0., checked[1] - time.monotonic()) if checked is not None else 0.
+
+    # Remember that a download over a range closed by the calendar found no candles
+    def check_closed(self, naming: TickerNaming, start: float, end: float, df: pd.DataFrame | None) -> None:
+        if (df is None or df.empty) and self.is_closed(naming, start, end):
+            self.closed[self.get_storing_name(naming)] = (start, time.monotonic() + self.closed_ttl)
+
+    # Ranges closed by the calendar are skipped once a download confirmed it, till the confirmation expires.
+    # Nothing is stored for them, so a wrong calendar hides candles for a while at most
+    def skip_closed(self, naming: TickerNaming, start: float, end: float) -> bool:
+        checked = self.closed.get(self.get_storing_name(naming))
+        if checked is None or start < checked[0] or not self.closed_for(naming) or \
+                not self.is_closed(naming, start, end):
+            return False
+        self.closed_skips += 1
+        return True
+
+    # Build candles from stored shorter candles if the window isn't stored but they are
+    async def _derive_range(self, naming: TickerNaming, start: float, end: float) -> pd.DataFrame | None:
+        if naming.timespan not in DerivedFrom.__members__ or \
+                not self.get_missing_final_intervals(naming, start, end):
             return None
+        for timespan in DerivedFrom[naming.timespan].value:
+            base_naming = replace(naming, timespan=timespan)
+            if self.get_missing_final_intervals(base_naming, start, end):
+                continue
+            logger.debug(f"Deriving {self.get_storing_name(naming)} from {self.get_storing_name(base_naming)}")
+            # The last candle of the window lasts till the start of the next one
+            base_end = end + ToMinutes[naming.timespan].value * 60 - 1
+            df = await self.async_get_range(base_naming, start, base_end)
+            if df is None or df.empty:
+                return df
+            return self.resample_candles(df, naming.timespan)
+        return None
+
+    # Series downloads of which bring new candles of the series: derived series follow their stored base series
+    def get_source_naming(self, naming: TickerNaming) -> TickerNaming:
+        if self.get_coverage(naming) or naming.timespan not in DerivedFrom.__members__:
+            return naming
+        for timespan in DerivedFrom[naming.timespan].value:
+            base_naming = replace(naming, timespan=timespan)
+            if self.get_coverage(base_naming):
+                return base_naming
+        return naming
+
+    # Download candles after the stored final ones and store those which are new or changed since the last poll.
+    # A series which isn't stored yet, say because its first download failed, starts with the last final candle
+    async def tail(self, naming: TickerNaming) -> pd.DataFrame | None:
+        coverage = self.get_coverage(naming)
         storing_name = self.get_storing_name(naming)
-        request = text(f"SELECT * FROM {storing_name} WHERE {Column.index.value} >= {start} AND "
-                       f"{Column.index.value} <= {end}")
-        df = pd.read_sql(request, db_session.create_connection())
-        df = df.set_index(Column.index.value).sort_index()
-        df = df[~df.index.duplicated(keep='last')]
+        end = moex_now().timestamp()
+        if coverage:
+            start = coverage[-1][1]
+        else:
+            final = datetime.fromtimestamp(self.get_final_timestamp(naming) - 1, MOEX_TIMEZONE)
+            start = snap_to_candle(final, naming.timespan).timestamp()
+        if self.skip_closed(naming, start, end):
+            self.tailed[storing_name] = (start, end)
+            return pd.DataFrame(columns=[Column.index.value]).set_index(Column.index.value)
+        final_timestamp = self.get_final_timestamp(naming)
+        aggregator = self.aggregators[naming.aggregator.value]
+        df = await aggregator.download_data(naming.name, datetime.fromtimestamp(start, MOEX_TIMEZONE),
+                                            datetime.fromtimestamp(end, MOEX_TIMEZONE), naming.timespan,
+                                            market=naming.moex_market, engine=naming.moex_engine)
+        if df is None:
+            df = pd.DataFrame(columns=[Column.index.value]).set_index(Column.index.value)
+        df = df.loc[(start <= df.index) & (df.index <= end)]
+        self.check_closed(naming, start, end, df)
+        self.candle_cache.write(storing_name, df, start, end)
+
+        stored = await self.async_get_ticker_from_db(naming, start, end)
+        changed = list(df.columns)
+        if stored is not None and not df.empty:
+            stored = stored.reindex(index=df.index, columns=df.columns)
+            unchanged = df.eq(stored) | df.isna() & stored.isna()
+            df = df[~unchanged.all(axis=1)]
+            changed = list(df.columns[~unchanged.all(axis=0)])
+        if not df.empty:
+            await self.async_add_ticker_to_db(naming, df, changed)
+        await self.async_add_coverage(naming, start, final_timestamp)
+        self.tailed[storing_name] = (start, end)
         return df
 
-    async def async_get_ticker(self, naming: TickerNaming, start: int, end: int) -> Awaitable[pd.DataFrame]:
+    async def async_get_ticker(self, naming: TickerNaming, start: int, end: int,
+                               now: datetime | None = None) -> Awaitable[pd.DataFrame]:
         if start >= end:
             raise ValueError("Start time is greater than end time")
         if naming.aggregator.value not in self.aggregators:
             raise ValueError("Unknown aggregator")
 
-        now = datetime.now()
-        start_time = now + timedelta(minutes=start * ToMinutes[naming.timespan].value)
-        end_time = now + timedelta(minutes=end * ToMinutes[naming.timespan].value)
-        start_timestamp = datetime.timestamp(start_time)
-        end_timestamp = datetime.timestamp(end_time)
-
-        df = self.get_ticker_from_db(naming, start_timestamp, end_timestamp)
+        start_time, end_time = self.get_window(naming, start, end, now or moex_now())
+        return await self.async_get_range(naming, datetime.timestamp(start_time), datetime.timestamp(end_time))
 
-        if df is not None and not df.empty and len(df) >= -(start - end):
+    async def async_get_range(self, naming: TickerNaming, start_timestamp: float,
+                              end_timestamp: float) -> pd.DataFrame | None:
+        df = await self._derive_range(naming, start_timestamp, end_timestamp)
+        if df is not None:
             return df
 
-        df = await self.aggregators[naming.aggregator.value].download_data(naming.name, start_time, end_time,
-                                                                           naming.timespan,
-                                                                           market=naming.moex_market,
-                                                                           engine=naming.moex_engine)
-        logger.debug(df)
-        logger.debug((start_timestamp, end_timestamp))
-        df = df.loc[(start_timestamp <= df.index) & (df.index <= end_timestamp)]
-        logger.debug(df)
-        self.add_ticker_to_db(naming, df)
+        aggregator = self.aggregators[naming.aggregator.value]
+        missing = [] if self.read_only else self.get_missing_intervals(self.get_coverage(naming), start_timestamp,
+                                                                       end_timestamp)
+        for missing_start, missing_end in missing:
+            tailed_start, tailed_end = self.tailed.get(self.get_storing_name(naming), (0, 0))
+            if tailed_start <= missing_start and missing_end <= tailed_end or \
+                    self.skip_closed(naming, missing_start, missing_end):
+                continue
+            logger.debug(f"Downloading {self.get_storing_name(naming)} from {missing_start} to {missing_end}")
+            df = await aggregator.download_data(naming.name, datetime.fromtimestamp(missing_start, MOEX_TIMEZONE),
+                                                datetime.fromtimestamp(missing_end, MOEX_TIMEZONE), naming.timespan,
+                                                market=naming.moex_market, engine=naming.moex_engine)
+            self.check_closed(naming, missing_start, missing_end, df)
+            if df is not None:
+                df = df.loc[(missing_start <= df.index) & (df.index <= missing_end)]
+                await self.async_add_ticker_to_db(naming, df)
+                self.candle_cache.write(self.get_storing_name(naming), df, missing_start, missing_end)
+            # Candles which are still open or not published yet may change, so they stay missing
+            await self.async_add_coverage(naming, missing_start,
+                                          min(missing_end + 1, self.get_final_timestamp(naming)))
+
+        storing_name = self.get_storing_name(naming)
+        df = self.candle_cache.get(storing_name, start_timestamp, end_timestamp)
+        if df is None:
+            df = await self.async_get_ticker_from_db(naming, start_timestamp, end_timestamp)
+            if df is not None:
+                self.candle_cache.put(storing_name, df, start_timestamp, end_timestamp)
         return df
 
     @staticmethod
     def add_notification(chat_id: int, condition: str, origin_condition: str) -> Notification:
-        session = db_session.create_session()
-        notification = session.execute(select(Notification).where((Notification.chat_id == chat_id) &
-                                                                  (Notification.condition == condition))).scalar()
-        if not notification:
-            notification = Notification()
-            notification.chat_id = chat_id
-            notification.condition = condition
-            notification.origin_condition = origin_condition
-
-            session.add(notification)
-            session.commit()
-            session.close()
-            # session.expunge(notification)
+        with db_session.create_session() as session:
+            notification = session.execute(select(Notification).where((Notification.chat_id == chat_id) &
+                                                                      (Notification.condition == condition))).scalar()
+            if not notification:
+                notification = Notification()
+                notification.chat_id = chat_id
+                notification.condition = condition
+                notification.origin_condition = origin_condition
+
+                session.add(notification)
+                session.commit()
         return notification
 
     @staticmethod
     def get_notifications(chat_id: int = None) -> dict[int, Notification]:
-        session = db_session.create_session()
         selection = select(Notification)
         if chat_id is not None:
             selection = selection.where(Notification.chat_id == chat_id)
-        notifications = session.execute(selection).scalars().all()
-        session.close()
+        with db_session.create_session() as session:
+            notifications = session.execute(selection).scalars().all()
         notifications = {notification.id: notification for notification in notifications}
         return notifications
 
+    async def async_add_notification(self, chat_id: int, condition: str, origin_condition: str) -> Notification:
+        return await self.async_storage.execute(self.add_notification, chat_id, condition, origin_condition)
+
+    async def async_remove_notification(self, id: int) -> None:
+        await self.async_storage.execute(self.remove_notification, id)
+
     @staticmethod
     def remove_notification(id: int) -> None:
-        session = db_session.create_session()
-        notification = session.execute(select(Notification).where(Notification.id == id)).scalar()
-        if notification:
+        with db_session.create_session() as session:
+            notification = session.execute(select(Notification).where(Notification.id == id)).scalar()
+            if not notification:
+                raise NonexistentNotification()
             session.delete(notification)
             session.commit()
-        else:
-            raise NonexistentNotification()
@@ -1,16 +1,33 @@
+import re
 from dataclasses import dataclass
 
+from src.config import moex_aggregator_markets, moex_futures_code
 from src.enums import AggregatorName, DBInterval
 
 
+# Engine and market of a MOEX ticker, e.g. SiZ3 is a futures contract and SBER is a share
+def moex_market_of(ticker: str, aggregator: AggregatorName) -> tuple[str, str]:
+    if aggregator.value in moex_aggregator_markets:
+        return moex_aggregator_markets[aggregator.value]
+    if re.fullmatch(moex_futures_code, ticker):
+        return "futures", "forts"
+    return "stock", "shares"
+
+
 @dataclass
 class TickerNaming:
     name: str
     aggregator: AggregatorName
     timespan: str
 
-    moex_market: str | None = "shares"
-    moex_engine: str | None = "stock"
+    # Derived from the ticker unless given
+    moex_market: str | None = None
+    moex_engine: str | None = None
+
+    def __post_init__(self):
+        engine, market = moex_market_of(self.name, self.aggregator)
+        self.moex_market = self.moex_market or market
+        self.moex_engine = self.moex_engine or engine
 
     def db_interval(self) -> str:
         return DBInterval[self.timespan].value
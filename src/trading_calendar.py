@@ -0,0 +1,63 @@
+from datetime import date, datetime, time, timedelta
+
+from src.config import trading_sessions, trading_holidays
+from src.fetch_planner import MOEX_TIMEZONE
+from src.tickers_naming import TickerNaming
+
+# Engine and market of MOEX, None for every known market
+MarketKey = tuple[str | None, str | None] | None
+# Days searched for the next session before giving up
+HORIZON = 30
+
+
+def market_of(naming: TickerNaming) -> MarketKey:
+    return naming.moex_engine, naming.moex_market
+
+
+# Trading sessions of MOEX markets. Sessions of unknown markets are unknown, so they are treated as always open
+class TradingCalendar:
+    def __init__(self, sessions: dict[tuple[str, str], tuple[tuple[str, str], ...]] = trading_sessions,
+                 holidays: tuple[str, ...] = trading_holidays):
+        self.sessions = {market: [(time.fromisoformat(opening), time.fromisoformat(closing))
+                                  for opening, closing in hours] for market, hours in sessions.items()}
+        self.holidays = set(holidays)
+
+    def knows(self, market: MarketKey) -> bool:
+        return market is None or market in self.sessions
+
+    def is_holiday(self, day: date) -> bool:
+        return day.weekday() >= 5 or day.isoformat() in self.holidays or day.isoformat()[5:] in self.holidays
+
+    def day_sessions(self, day: date, market: MarketKey = None) -> list[tuple[datetime, datetime]]:
+        if self.is_holiday(day):
+            return []
+        hours = self.sessions[market] if market is not None else \
+            [session for sessions in self.sessions.values() for session in sessions]
+        return sorted((datetime.combine(day, opening, MOEX_TIMEZONE), datetime.combine(day, closing, MOEX_TIMEZONE))
+                      for opening, closing in hours)
+
+    # Whether any session of the market overlaps [start, end)
+    def has_trading(self, start: datetime, end: datetime, market: MarketKey = None) -> bool:
+        if not self.knows(market):
+            return True
+        start, end = start.astimezone(MOEX_TIMEZONE), end.astimezone(MOEX_TIMEZONE)
+        day = start.date()
+        while day <= end.date():
+            if any(opening < end and start < closing for opening, closing in self.day_sessions(day, market)):
+                return True
+            day += timedelta(days=1)
+        return False
+
+    def is_open(self, moment: datetime, market: MarketKey = None) -> bool:
+        return self.has_trading(moment, moment + timedelta(microseconds=1), market)
+
+    # Opening of the first session after the moment, None if the market isn't known or doesn't open soon
+    def next_opening(self, moment: datetime, market: MarketKey = None) -> datetime | None:
+        if not self.knows(market):
+            return None
+        moment = moment.astimezone(MOEX_TIMEZONE)
+        for days in range(HORIZON):
+            for opening, _ in self.day_sessions(moment.date() + timedelta(days=days), market):
+                if moment < opening:
+                    return opening
+        return None
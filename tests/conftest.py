@@ -0,0 +1,14 @@
+from pathlib import Path
+
+import pytest
+
+from src import db_session
+
+
+# Every test gets a database of its own instead of the one of the bot
+@pytest.fixture(autouse=True)
+def database(tmp_path: Path) -> Path:
+    db_file = tmp_path / "test.sqlite"
+    db_session.global_init(db_file)
+    yield db_file
+    db_session.global_reset()
@@ -0,0 +1,92 @@
+import asyncio
+import logging.config
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.async_storage import AsyncStorage
+from src.candle_storage import SQLiteStorage
+from src.config import LOGGER_CONFIG
+from src.enums import Column
+
+logging.config.dictConfig(LOGGER_CONFIG)
+
+SERIES = ("test_bulk_a", "test_bulk_b", "test_bulk_c", "test_bulk_d")
+
+
+def candles(rows: int, start: int = 0) -> pd.DataFrame:
+    index = pd.Index(np.arange(start, start + rows, dtype=np.int64) * 60, name=Column.index.value)
+    values = np.linspace(100, 200, rows)
+    return pd.DataFrame({"open": values, "close": values + 1, "high": values + 2, "low": values - 1,
+                         "value": values * 10, "volume": np.arange(rows, dtype=np.float64)}, index=index)
+
+
+@pytest.fixture
+def storage() -> SQLiteStorage:
+    return SQLiteStorage()
+
+
+# Longest delay of a timer ticking on the event loop while the work runs
+async def loop_lag(work) -> tuple[float, float]:
+    lag, done = 0., False
+
+    async def ticker() -> None:
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - start - 0.005)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await work()
+    duration = time.perf_counter() - start
+    done = True
+    await task
+    return lag, duration
+
+
+async def test_event_loop_lag_is_bounded_during_bulk_insert(storage: SQLiteStorage) -> None:
+    async_storage = AsyncStorage(storage, lambda coverage: None, threads=2)
+    df = candles(100_000)
+
+    async def write_blocking() -> None:
+        storage.write(SERIES[0], df)
+
+    async def write() -> None:
+        await asyncio.gather(*(async_storage.write(name, df) for name in SERIES[1:]))
+
+    blocking_lag, _ = await loop_lag(write_blocking)
+    lag, duration = await loop_lag(write)
+    await async_storage.close()
+
+    # The blocking insert stalls the loop for all of its duration, the offloaded ones leave it ticking
+    assert blocking_lag > 0.2
+    assert lag < min(0.25, blocking_lag / 4)
+    assert duration > 0.25
+    # Concurrent writes share a transaction
+    assert async_storage.transactions < len(SERIES) - 1
+    for name in SERIES[1:]:
+        assert len(storage.read(name, 0, 100_000 * 60)) == len(df)
+
+
+async def test_writes_are_grouped_in_order(storage: SQLiteStorage) -> None:
+    saved = []
+    async_storage = AsyncStorage(storage, saved.append, batch=8)
+    await asyncio.gather(async_storage.write(SERIES[0], candles(10)),
+                         async_storage.cover(SERIES[0], [(0, 300)]),
+                         async_storage.write(SERIES[0], candles(10, start=5) + 1),
+                         async_storage.cover(SERIES[0], [(0, 900)]),
+                         async_storage.execute(storage.read, SERIES[0], 0, 60))
+
+    df = await async_storage.read(SERIES[0], 0, 10_000)
+    await async_storage.close()
+    assert len(df) == 15
+    assert df["open"].iloc[5] == candles(10, start=5)["open"].iloc[0] + 1
+    # The latest coverage of a series is saved once
+    assert saved == [{SERIES[0]: [(0, 900)]}]
+    assert async_storage.transactions == 1
+    assert async_storage.writes == 2
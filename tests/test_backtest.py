@@ -0,0 +1,85 @@
+import math
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.backtest import term_values
+from src.condition_parser import parse_condition
+from src.fetch_planner import snap_to_candle, MOEX_TIMEZONE
+from src.store_keeper import StoreKeeper
+
+START = int(datetime(2023, 10, 2, 10, tzinfo=MOEX_TIMEZONE).timestamp())
+
+
+# Value of the term the live evaluation would load at the close of the candle starting at the moment
+def reference(term, df: pd.DataFrame, moment: int, close: int) -> float:
+    anchor = snap_to_candle(datetime.fromtimestamp(moment, MOEX_TIMEZONE), term.timespan)
+    start, end = StoreKeeper.get_window(term.naming, *term.window, anchor)
+    candle_start, candle_end = StoreKeeper.get_window(term.naming, 0, 1, anchor)
+    # Candles of longer time spans count once they are closed
+    span = (candle_end - candle_start).total_seconds()
+    index = df.index.to_numpy()
+    series = df[term.column.value][(start.timestamp() <= index) & (index <= end.timestamp()) &
+                                   (index <= close - span)]
+    if term.function is None:
+        return series.tail(1).item() if len(series) else math.nan
+    return getattr(series.tail(term.length), term.function)()
+
+
+def candles(seed: int, step: int, count: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # Trading breaks leave gaps, some values are missing
+    index = START + np.cumsum(rng.choice([1, 1, 1, 2, 7], count)) * step
+    mean = rng.normal(100, 10, count)
+    mean[rng.random(count) < 0.1] = np.nan
+    return pd.DataFrame({"mean_price": mean, "volume": rng.integers(0, 100, count).astype(float)},
+                        index=pd.Index(index, name="datetime"))
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize(
+    "condition",
+    [
+        "#A.mean[C] > 100",
+        "#A.mean[5T].mean() > 100",
+        "#A.vol[30T:-3].sum() > 100",
+        "#A.mean[17T].max() > 100",
+        "#A.mean[64T:-1].min() > 100",
+        "#A.mean[3H].max() > 100",
+        "#A.vol[2H:-1].sum() > 100",
+        "#A.mean[H] > 100",
+    ]
+)
+def test_term_values_match_live_windows(seed: int, condition: str) -> None:
+    term = next(parse_condition(condition).terms())
+    minutes = candles(seed, 60, 2000)
+    df = minutes if term.timespan == "minute" else StoreKeeper.resample_candles(minutes, term.timespan)
+    moments = minutes.index.to_numpy()
+    closes = moments + 60
+    values = term_values(term, df, moments, closes)
+    for value, moment, close in zip(values, moments, closes):
+        expected = reference(term, df, int(moment), int(close))
+        if math.isnan(expected):
+            assert math.isnan(value)
+        else:
+            assert value == pytest.approx(expected, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize(
+    "condition",
+    [
+        "#A.mean[C] > 100 and not #B.mean[C] < 95",
+        "#A.mean[C] * 2 - #B.mean[C] >= 100 or #A.mean[C] // 7 % 3 == 1",
+        "90 < #A.mean[C] <= #B.mean[C] < 110",
+        "-#A.mean[C] + 200 > #B.mean[C] ** 1",
+    ]
+)
+def test_evaluate_array_matches_evaluate(condition: str) -> None:
+    node = parse_condition(condition)
+    rng = np.random.default_rng(0)
+    values = {term: rng.normal(100, 10, 500).round() for term in node.terms()}
+    held = np.broadcast_to(node.evaluate_array(values), 500)
+    for i in range(500):
+        assert bool(held[i]) == bool(node.evaluate({term: array[i] for term, array in values.items()}))
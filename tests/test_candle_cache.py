@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.candle_cache import CandleCache, resident_size
+from src.candle_storage import ColumnarStorage
+from src.enums import Column
+
+
+def candles(start: int, rows: int, value: float = 1.) -> pd.DataFrame:
+    index = pd.Index(np.arange(start, start + rows, dtype=np.int64) * 60, name=Column.index.value)
+    return pd.DataFrame({Column.mean.value: np.full(rows, value)}, index=index)
+
+
+# 100 candles of an index and a column take 1600 bytes
+def test_least_recently_used_series_are_evicted() -> None:
+    cache = CandleCache(budget=4000)
+    cache.put("a", candles(0, 100), 0, 99 * 60)
+    cache.put("b", candles(0, 100), 0, 99 * 60)
+    assert cache.get("a", 0, 600) is not None
+    cache.put("c", candles(0, 100), 0, 99 * 60)
+
+    assert list(cache.series) == ["a", "c"] and cache.size == 3200
+    assert cache.get("b", 0, 600) is None
+    # Outside the cached range
+    assert cache.get("a", 0, 100 * 60) is None
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 2, 1)
+    # Series over the budget aren't cached
+    cache.put("d", candles(0, 1000), 0, 999 * 60)
+    assert "d" not in cache.series and cache.size == 3200
+
+
+def test_writes_are_merged_into_overlapping_ranges_only() -> None:
+    cache = CandleCache(budget=10 ** 6)
+    cache.put("a", candles(0, 10), 0, 9 * 60)
+    cache.write("a", candles(8, 4, value=2.), 8 * 60, 11 * 60)
+    df = cache.get("a", 0, 11 * 60)
+    assert len(df) == 12 and df[Column.mean.value].tolist() == [1.] * 8 + [2.] * 4
+
+    # Written candles after a gap or of series not cached are only in storage
+    cache.write("a", candles(20, 5), 20 * 60, 24 * 60)
+    cache.write("b", candles(0, 5), 0, 4 * 60)
+    assert cache.get("a", 0, 20 * 60) is None
+    assert "b" not in cache.series
+    assert cache.size == resident_size(cache.series["a"].df)
+
+
+def test_mapped_candles_only_count_their_index(tmp_path: Path) -> None:
+    storage = ColumnarStorage(tmp_path / "columnar")
+    storage.write("a", candles(0, 100))
+    df = storage.read("a", 0, 99 * 60)
+    assert resident_size(df) <= 800 < resident_size(candles(0, 100))
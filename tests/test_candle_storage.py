@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from src import db_session
+from src.candle_storage import ColumnarStorage, SQLiteStorage
+from src.enums import Column
+
+
+def candles(start: int, rows: int, value: float = 1.) -> pd.DataFrame:
+    index = pd.Index(np.arange(start, start + rows, dtype=np.int64) * 60, name=Column.index.value)
+    return pd.DataFrame({Column.mean.value: np.full(rows, value)}, index=index)
+
+
+def test_columnar_reader_sees_appends_and_rewrites(tmp_path: Path) -> None:
+    directory = tmp_path / "columnar"
+    writer, reader = ColumnarStorage(directory), ColumnarStorage(directory)
+    writer.write("series", candles(0, 10))
+    assert len(reader.read("series", 0, 10_000)) == 10
+
+    writer.write("series", candles(10, 5))
+    assert len(reader.read("series", 0, 10_000)) == 15
+    # Same size, other files
+    writer.write("series", candles(0, 5, value=2.))
+    df = reader.read("series", 0, 10_000)
+    assert len(df) == 15 and df[Column.mean.value].iloc[0] == 2.
+    assert writer.delete("series", 5 * 60, 100) == 5
+    assert len(reader.read("series", 0, 10_000)) == 10
+    assert sorted(path.name for path in directory.iterdir()) == ["series"]
+
+
+def test_legacy_sqlite_table_is_compacted_once() -> None:
+    with db_session.create_connection() as connection:
+        connection.execute(sa.text(f'CREATE TABLE legacy ("{Column.index.value}" INTEGER, '
+                                   f'"{Column.mean.value}" FLOAT)'))
+        connection.execute(sa.text('INSERT INTO legacy VALUES (0, 1.), (60, 1.), (0, 2.), (120, 1.), (60, 3.)'))
+        connection.commit()
+    storage = SQLiteStorage()
+    storage.migrate(["legacy", "missing"])
+    storage.migrate(["legacy"])
+
+    # The last written duplicate is kept
+    df = storage.read("legacy", 0, 10_000)
+    assert df.index.tolist() == [0, 60, 120]
+    assert df[Column.mean.value].tolist() == [2., 3., 1.]
+    with db_session.create_connection() as connection:
+        inspector = sa.inspect(connection)
+        assert inspector.get_pk_constraint("legacy")["constrained_columns"] == [Column.index.value]
+        assert not inspector.has_table("legacy_compacted")
+
+    # Overlapping candles are replaced
+    storage.write("legacy", candles(2, 3, value=5.))
+    df = storage.read("legacy", 0, 10_000)
+    assert df.index.tolist() == [0, 60, 120, 180, 240]
+    assert df[Column.mean.value].tolist() == [2., 3., 5., 5., 5.]
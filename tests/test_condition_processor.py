@@ -1,42 +1,164 @@
+import asyncio
 import logging.config
+from datetime import datetime
 
+import numpy as np
+import pandas as pd
 import pytest
 from telegram.ext import ApplicationBuilder, ContextTypes
 
+from src.aggregators import Aggregator
+from src.condition_parser import parse_condition
 from src.condition_processor import ConditionProcessor
 from src.config import telegram_key, LOGGER_CONFIG
+from src.dependency_index import DependencyIndex
+from src.enums import AggregatorName, Column
+from src.exceptions import WrongCondition
+from src.fetch_planner import FetchPlanner, MOEX_TIMEZONE
+from src.live_tail import SeriesUpdated
+from src.store_keeper import StoreKeeper
+from src.tickers_naming import TickerNaming
+from src.trading_calendar import TradingCalendar
 
 logging.config.dictConfig(LOGGER_CONFIG)
 
 
 CONDITION = "#YNDX.mean[C]>2000"
-REFORMATED_CONDITION = "async def __ex():\n return " \
-                       "(await gt(TN('YNDX', ANmoex, 'YNDX'), 'minute')).tail(1)['mean_price'].tail(1).item()>2000"
+PARSED_CONDITION = "(#MOEX:YNDX.mean[1T]>2000)"
+NOW = datetime(2023, 10, 20, 12, 0, 30, tzinfo=MOEX_TIMEZONE)
 
 
 async def notification(context: ContextTypes.DEFAULT_TYPE) -> None:
     return
 
 
+@pytest.mark.parametrize(
+    "condition, parsed_condition",
+    [
+        (CONDITION, PARSED_CONDITION),
+        ("#moex:YNDX.mean[1T] > 2000", PARSED_CONDITION),
+        ("#SBER.low[2H:-1].mean()*2<#MXNL:SiZ3.long[5T].max() and not #SBER.vol[D].sum()>10",
+         "(((#MOEX:SBER.low[2H:-1].mean()*2)<#MXNL:SiZ3.long[5T].max()) and (not (#MOEX:SBER.vol[1D].sum()>10)))"),
+    ]
+)
+def test_parse_condition(condition: str, parsed_condition: str) -> None:
+    assert str(parse_condition(condition)) == parsed_condition
+    assert parse_condition(condition) == parse_condition(parsed_condition)
+
+
 @pytest.mark.parametrize(
     "condition",
     [
-        CONDITION
+        "#YNDX.mean[C]>__import__('os')",
+        "#YNDX.unknown[C]>1",
+        "#YNDX.mean[C:1]>1",
+        "#YNDX.mean[C].median()>1",
+        "1>0",
     ]
 )
-def test_reformat_condition(condition: str) -> None:
-    application = ApplicationBuilder().token(telegram_key).build()
-    cond_processor = ConditionProcessor(application.job_queue, notification)
-    assert cond_processor._reformat_condition(condition) == REFORMATED_CONDITION
+def test_parse_wrong_condition(condition: str) -> None:
+    with pytest.raises(WrongCondition):
+        parse_condition(condition)
 
 
 @pytest.mark.parametrize(
     "condition",
     [
-        REFORMATED_CONDITION
+        CONDITION
     ]
 )
 async def test_check_condition(condition: str) -> None:
     application = ApplicationBuilder().token(telegram_key).build()
     cond_processor = ConditionProcessor(application.job_queue, notification)
-    assert await cond_processor._check_condition(condition)
+    assert await cond_processor._check_condition(parse_condition(condition))
+
+
+# Candles of mean price 10 every minute, downloads of HANG never end and downloads of FAIL fail
+class ScriptedAggregator(Aggregator):
+    def __init__(self):
+        super().__init__()
+        self.downloads = 0
+
+    async def download_data(self, symbol: str, start: datetime, end: datetime, interval: str,
+                            *args, **kwargs) -> pd.DataFrame | None:
+        self.downloads += 1
+        if symbol == "HANG":
+            await asyncio.Event().wait()
+        if symbol == "FAIL":
+            raise ConnectionError(symbol)
+        index = np.arange(int(start.timestamp()) // 60 * 60, end.timestamp() + 1, 60, dtype=np.int64)
+        return pd.DataFrame({Column.mean.value: np.full(len(index), 10.)},
+                            index=pd.Index(index, name=Column.index.value))
+
+
+@pytest.fixture
+async def processor(monkeypatch) -> ConditionProcessor:
+    monkeypatch.setattr("src.store_keeper.moex_now", lambda: NOW)
+    monkeypatch.setattr("src.fetch_planner.moex_now", lambda: NOW)
+    store_keeper = StoreKeeper(aggregators={AggregatorName.moex.value: ScriptedAggregator()})
+    store_keeper.calendar = TradingCalendar(sessions=dict())
+    processor = ConditionProcessor(None, store_keeper=store_keeper)
+    yield processor
+    await processor.close()
+
+
+async def add(processor: ConditionProcessor, condition: str) -> int:
+    await processor.save_notification(0, parse_condition(condition), condition)
+    return max(processor.notifications)
+
+
+def series(ticker: str) -> tuple:
+    return FetchPlanner.series_key(TickerNaming(ticker, AggregatorName.moex, "minute"))
+
+
+def test_dependency_index_follows_notifications() -> None:
+    index = DependencyIndex()
+    index.add(1, parse_condition("#SBER.mean[C] > #GAZP.mean[C]"))
+    index.add(2, parse_condition("#SBER.vol[C] > 1"))
+    assert index.dependents([series("SBER")]) == {1, 2}
+    assert index.dependents([series("GAZP")]) == {1}
+
+    index.remove(1)
+    assert index.dependents([series("SBER"), series("GAZP")]) == {2}
+    assert series("GAZP") not in index.namings
+    index.add(1, parse_condition("#GAZP.mean[C] > 1"))
+    index.add(1, parse_condition("#GAZP.mean[C] > 2"))
+    assert index.dependents([series("GAZP")]) == {1}
+    assert index.dependents([series("SBER")]) == {2}
+    assert len(index) == 2 and set(index.namings) == {series("SBER"), series("GAZP")}
+
+
+async def test_updates_select_readers_and_unchanged_inputs_are_skipped(processor: ConditionProcessor) -> None:
+    sber = await add(processor, "#SBER.mean[C] > 1")
+    both = await add(processor, "#SBER.mean[C] > #GAZP.mean[C]")
+    await add(processor, "#GAZP.mean[C] < 1")
+
+    processor.update_event, processor.updated = asyncio.Event(), set()
+    processor.series_updated(SeriesUpdated(series("SBER"), frozenset({series("SBER")}), 0, 0, 1))
+    assert processor.dependencies.dependents(processor.updated) == {sber, both}
+
+    summary = await processor.run_tick()
+    assert summary.evaluated == 3 and summary.skipped == 0
+    assert [notification.id for notification in summary.fired] == [sber]
+    # Nothing was stored since, so the results are reused
+    summary = await processor.run_tick([sber, both])
+    assert summary.evaluated == 2 and summary.skipped == 2
+    assert [notification.id for notification in summary.fired] == [sber]
+    assert processor.evaluations == 3 and processor.skipped == 2
+
+
+async def test_hanging_and_failing_conditions_dont_hold_others(processor: ConditionProcessor, monkeypatch) -> None:
+    monkeypatch.setattr("src.evaluation.condition_timeout", 0.2)
+    fired = await add(processor, "#SBER.mean[C] > 1")
+    quiet = await add(processor, "#SBER.mean[C] > 100")
+    hanging = await add(processor, "#SBER.mean[C] > 1 and #HANG.mean[C] > 1")
+    failing = await add(processor, "#FAIL.mean[C] > 1")
+
+    summary = await processor.run_tick()
+    assert [notification.id for notification in summary.fired] == [fired]
+    assert [notification.id for notification in summary.timed_out] == [hanging]
+    assert [notification.id for notification in summary.errored] == [failing]
+    assert summary.evaluated == 4 and processor.results[processor.conditions[quiet]][1] is False
+    # Failed conditions are evaluated again next time
+    assert processor.conditions[hanging] not in processor.results
+    assert processor.conditions[failing] not in processor.results
@@ -0,0 +1,151 @@
+import asyncio
+import logging.config
+import time
+from collections import defaultdict
+
+import pytest
+from telegram.error import RetryAfter, TimedOut, Forbidden
+
+from src.config import LOGGER_CONFIG
+from src.delivery import DeliveryQueue, split_message
+
+logging.config.dictConfig(LOGGER_CONFIG)
+
+
+# Records delivered messages. Errors queued for a chat are raised by its next sends
+class StubBot:
+    def __init__(self, latency: float = 0.005):
+        self.latency = latency
+        self.sent: dict[int, list[tuple[float, str]]] = defaultdict(list)
+        self.errors: dict[int, list[Exception]] = defaultdict(list)
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.errors[chat_id]:
+                raise self.errors[chat_id].pop(0)
+            self.sent[chat_id].append((time.monotonic(), text))
+        finally:
+            self.in_flight -= 1
+
+
+def make_queue(bot: StubBot, **kwargs) -> DeliveryQueue:
+    settings = dict(workers=16, rate=1000, chat_interval=0, retries=3, backoff=0.001)
+    return DeliveryQueue(bot, **settings | kwargs)
+
+
+@pytest.mark.parametrize(
+    "text, limit",
+    [
+        ("short", 10),
+        ("\n\n".join(["a" * 6] * 5), 15),
+        ("\n".join(["b" * 7] * 4) + "\n\n" + "c" * 30, 16),
+    ]
+)
+def test_split_message(text: str, limit: int) -> None:
+    parts = split_message(text, limit)
+    assert all(len(part) <= limit for part in parts)
+    assert "".join(parts).replace("\n", "") == text.replace("\n", "")
+
+
+async def test_concurrent_fan_out() -> None:
+    bot = StubBot()
+    queue = make_queue(bot)
+    await queue.start()
+    for chat_id in range(200):
+        queue.submit(chat_id, f"alert {chat_id}")
+    start = time.monotonic()
+    await queue.join()
+    await queue.close()
+    # Sequential delivery would take 200 * latency
+    assert time.monotonic() - start < 200 * bot.latency / 2
+    assert bot.max_in_flight > 1
+    assert queue.sent == 200
+    assert all(bot.sent[chat_id][0][1] == f"alert {chat_id}" for chat_id in range(200))
+    assert set(queue.percentiles()) == {50, 90, 99}
+
+
+async def test_order_and_interval_within_chat() -> None:
+    bot = StubBot(latency=0)
+    queue = make_queue(bot, chat_interval=0.02)
+    await queue.start()
+    for i in range(5):
+        queue.submit(1, f"message {i}")
+    queue.submit(1, "\n\n".join(["x" * 3000] * 2))
+    await queue.join()
+    await queue.close()
+    texts = [text for _, text in bot.sent[1]]
+    assert texts[:5] == [f"message {i}" for i in range(5)]
+    assert texts[5:] == ["x" * 3000] * 2
+    moments = [moment for moment, _ in bot.sent[1]]
+    assert all(later - earlier >= 0.02 * 0.9 for earlier, later in zip(moments, moments[1:]))
+
+
+async def test_global_rate() -> None:
+    bot = StubBot(latency=0)
+    queue = make_queue(bot, rate=100)
+    await queue.start()
+    for chat_id in range(150):
+        queue.submit(chat_id, "alert")
+    start = time.monotonic()
+    await queue.join()
+    await queue.close()
+    # The burst of rate messages goes at once, the rest at rate per second
+    assert time.monotonic() - start >= 50 / 100 * 0.9
+
+
+async def test_retry_after_and_network_errors() -> None:
+    bot = StubBot()
+    bot.errors[1] = [RetryAfter(0.05)]
+    bot.errors[2] = [TimedOut(), TimedOut()]
+    queue = make_queue(bot)
+    await queue.start()
+    start = time.monotonic()
+    for chat_id in range(1, 4):
+        queue.submit(chat_id, "alert")
+    await queue.join()
+    await queue.close()
+    assert time.monotonic() - start >= 0.05
+    assert all(len(bot.sent[chat_id]) == 1 for chat_id in range(1, 4))
+    assert queue.retried == 3
+    assert queue.failed == 0
+
+
+async def test_give_up() -> None:
+    bot = StubBot()
+    bot.errors[1] = [TimedOut()] * 10
+    bot.errors[2] = [Forbidden("bot was blocked by the user")]
+    queue = make_queue(bot, retries=2)
+    await queue.start()
+    queue.submit(1, "alert")
+    queue.submit(2, "alert")
+    queue.submit(3, "alert")
+    await queue.join()
+    await queue.close()
+    assert not bot.sent[1] and not bot.sent[2]
+    assert len(bot.sent[3]) == 1
+    # The first attempt and two retries
+    assert bot.calls == 3 + 1 + 1
+    assert queue.failed == 2
+
+
+async def test_idle_chats_are_forgotten() -> None:
+    bot = StubBot(latency=0)
+    queue = make_queue(bot, chat_interval=0.02)
+    await queue.start()
+    for chat_id in range(50):
+        queue.submit(chat_id, "first")
+    await queue.join()
+    assert 0 < len(queue.last_sent) <= 50
+
+    await asyncio.sleep(0.03)
+    queue.submit(50, "second")
+    await queue.join()
+    await queue.close()
+    assert list(queue.last_sent) == [50]
@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.condition_parser import parse_condition
+from src.enums import AggregatorName, Column
+from src.evaluation import evaluate_conditions
+from src.fetch_planner import FetchPlanner, MOEX_TIMEZONE
+from src.store_keeper import StoreKeeper
+from src.tickers_naming import TickerNaming
+
+NOW = datetime(2023, 10, 20, 12, tzinfo=MOEX_TIMEZONE)
+NAMING = TickerNaming("SBER", AggregatorName.moex, "minute")
+
+
+# Candles of every minute of the window, loads wait till they are released
+class StubStoreKeeper:
+    get_window = staticmethod(StoreKeeper.get_window)
+
+    def __init__(self):
+        self.loads = []
+        self.released = asyncio.Event()
+        self.released.set()
+
+    async def async_get_ticker(self, naming: TickerNaming, start: int, end: int, now: datetime) -> pd.DataFrame:
+        self.loads.append((naming.name, start, end))
+        await self.released.wait()
+        start_time, end_time = self.get_window(naming, start, end, now)
+        index = np.arange(start_time.timestamp(), end_time.timestamp() + 1, 60, dtype=np.int64)
+        return pd.DataFrame({Column.mean.value: np.arange(len(index), dtype=float)},
+                            index=pd.Index(index, name=Column.index.value))
+
+
+async def test_overlapping_windows_are_loaded_once() -> None:
+    store_keeper = StubStoreKeeper()
+    conditions = [parse_condition("#SBER.mean[5C].max() > 1"), parse_condition("#SBER.mean[3C:-1].min() < 1")]
+    planner = FetchPlanner(store_keeper, NOW)
+    await evaluate_conditions(conditions, planner)
+    # The superset of both windows
+    assert store_keeper.loads == [("SBER", -5, 0)]
+    assert planner.fetches == 1
+
+
+async def test_concurrent_requests_share_the_load() -> None:
+    store_keeper = StubStoreKeeper()
+    store_keeper.released.clear()
+    planner = FetchPlanner(store_keeper, NOW)
+    planner.plan(NAMING, -10, 0)
+    requests = [asyncio.create_task(planner.get_ticker(NAMING, *window)) for window in [(-10, 0), (-3, 0), (-5, -2)]]
+    await asyncio.sleep(0.01)
+    # Every request waits for the single load in flight
+    assert len(store_keeper.loads) == 1 and not any(request.done() for request in requests)
+    store_keeper.released.set()
+    first, second, third = await asyncio.gather(*requests)
+
+    assert store_keeper.loads == [("SBER", -10, 0)]
+    assert len(first) == 11 and len(second) == 4 and len(third) == 4
+    assert second.index[-1] == NOW.timestamp() and third.index[-1] == NOW.timestamp() - 120
+    # Windows beyond the loaded one are loaded again
+    await planner.get_ticker(NAMING, -20, 0)
+    assert store_keeper.loads[-1] == ("SBER", -20, 0)
@@ -0,0 +1,47 @@
+import json
+import math
+from pathlib import Path
+
+import pytest
+
+from src.enums import Column
+from src.iss import candles_frame, futoi_frame
+
+DATA = Path(__file__).parent / "data"
+# 2023-10-20 10:00 in Moscow
+TEN = 1697785200
+
+
+def payload(name: str, key: str) -> list[dict]:
+    return [json.loads((DATA / name).read_text())[key]]
+
+
+def test_candles_frame() -> None:
+    df = candles_frame(payload("iss_candles.json", "candles"))
+    assert df.index.name == Column.index.value
+    assert df.index.tolist() == [TEN, TEN + 60, TEN + 120, TEN + 180]
+    assert df[Column.mean.value].iloc[0] == pytest.approx((265.5 + 265.9) / 2)
+    assert df[Column.high.value].tolist()[:2] == [266.1, 266.0]
+    assert df[Column.vol.value].tolist() == [200130, 80150, 0, 120100]
+    # Candles without trades have no prices
+    assert math.isnan(df[Column.mean.value].iloc[2]) and math.isnan(df[Column.low.value].iloc[2])
+    assert candles_frame([{"columns": [], "data": []}]) is None
+
+
+@pytest.mark.parametrize(
+    "timespan, index, long, short, long_numb",
+    [
+        # Records a few seconds off are put on the 5 minute grid
+        ("minute", [TEN, TEN + 300, TEN + 13 * 3600 + 50 * 60], [1150000., 1300000., 1000000.],
+         [1150950., 1301200., 1000800.], [295., 310., 280.]),
+        ("hour", [TEN, TEN + 13 * 3600], [1200000., 1000000.], [3603100. / 3, 1000800.], [300., 280.]),
+        ("day", [TEN - 10 * 3600], [1150000.], [1150975.], [295.]),
+    ]
+)
+def test_futoi_frame(timespan: str, index: list, long: list, short: list, long_numb: list) -> None:
+    df = futoi_frame(payload("iss_futoi.json", "futoi"), timespan)
+    # Only legal entities, records of individuals are dropped. Short positions are positive
+    assert df.index.tolist() == index
+    assert df[Column.long.value].tolist() == long
+    assert df[Column.short.value].tolist() == pytest.approx(short)
+    assert df[Column.long_numb.value].tolist() == long_numb
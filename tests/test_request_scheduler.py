@@ -0,0 +1,257 @@
+import asyncio
+import logging.config
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.aggregators import MOEX, MOEXAnalytical, MOEX_PASSPORT_COOKIE
+from src.config import LOGGER_CONFIG
+from src.enums import Column
+from src.exceptions import CircuitOpen
+from src.fetch_planner import MOEX_TIMEZONE
+from src.request_scheduler import RequestScheduler
+
+logging.config.dictConfig(LOGGER_CONFIG)
+
+
+CANDLES = 1200
+PAGE = 500
+CANDLES_PATH = "/iss/engines/stock/markets/shares/securities/SBER/candles.json"
+FUTOI_PATH = "/iss/analyticalproducts/futoi/securities/si.json"
+
+
+# Local stand-in of ISS. Failing endpoints fail the number of times set in failures, then succeed
+class FakeISS:
+    def __init__(self):
+        self.hits: Counter[str] = Counter()
+        self.failures: Counter[str] = Counter()
+        self.status = 503
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.app = web.Application()
+        self.app.router.add_get(CANDLES_PATH, self.candles)
+        self.app.router.add_get("/flaky", self.flaky)
+        self.app.router.add_get("/limited", self.limited)
+        self.app.router.add_get("/slow", self.slow)
+        self.app.router.add_get("/missing", self.missing)
+        self.app.router.add_get("/passport", self.passport)
+        self.app.router.add_get(FUTOI_PATH, self.futoi)
+        self.certificates: set[str] = set()
+
+    def fail(self, path: str) -> web.Response | None:
+        self.hits[path] += 1
+        if self.failures[path] > 0:
+            self.failures[path] -= 1
+            return web.Response(status=self.status)
+        return None
+
+    async def candles(self, request: web.Request) -> web.Response:
+        failed = self.fail(CANDLES_PATH)
+        if failed is not None:
+            return failed
+        begin = datetime.strptime(request.query["from"], "%Y-%m-%d %H:%M:%S")
+        offset = int(request.query.get("start", 0))
+        rows = [[(begin + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"), 100., 102., 103., 99., 10.]
+                for i in range(offset, min(offset + PAGE, CANDLES))]
+        return web.json_response({"candles": {"columns": ["begin", "open", "close", "high", "low", "volume"],
+                                              "data": rows}})
+
+    async def flaky(self, request: web.Request) -> web.Response:
+        return self.fail("/flaky") or web.json_response({"ok": True})
+
+    async def limited(self, request: web.Request) -> web.Response:
+        self.hits["/limited"] += 1
+        if self.failures["/limited"] > 0:
+            self.failures["/limited"] -= 1
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        return web.json_response({"ok": True})
+
+    async def slow(self, request: web.Request) -> web.Response:
+        self.hits["/slow"] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.02)
+        self.in_flight -= 1
+        return web.json_response({"ok": True})
+
+    async def missing(self, request: web.Request) -> web.Response:
+        self.hits["/missing"] += 1
+        return web.Response(status=404)
+
+    async def passport(self, request: web.Request) -> web.Response:
+        self.hits["/passport"] += 1
+        if request.headers.get("Authorization") is None:
+            return web.Response(status=401)
+        certificate = str(self.hits["/passport"])
+        self.certificates.add(certificate)
+        response = web.json_response({"ok": True})
+        response.set_cookie(MOEX_PASSPORT_COOKIE, certificate)
+        return response
+
+    # Open interest is only given to holders of a valid passport certificate
+    async def futoi(self, request: web.Request) -> web.Response:
+        self.hits[FUTOI_PATH] += 1
+        if request.cookies.get(MOEX_PASSPORT_COOKIE) not in self.certificates:
+            return web.Response(status=403)
+        return web.json_response({"futoi": {
+            "columns": ["tradedate", "tradetime", "clgroup", "pos_long", "pos_short", "pos_long_num", "pos_short_num"],
+            "data": [[request.query["from"], "10:00:00", "YUR", 100., -50., 10., 5.]]}})
+
+
+@pytest.fixture
+async def iss():
+    fake = FakeISS()
+    # Cookies of IP addresses are rejected by the client
+    server = TestServer(fake.app, host="localhost")
+    await server.start_server()
+    fake.url = str(server.make_url(""))
+    async with aiohttp.ClientSession() as session:
+        fake.session = session
+        yield fake
+    await server.close()
+
+
+def make_scheduler(**kwargs) -> RequestScheduler:
+    settings = dict(rate=1000, burst=1000, in_flight=8, timeout=5, retries=3, backoff=0.001, backoff_max=0.01,
+                    failure_threshold=5, reset_timeout=60)
+    return RequestScheduler(**settings | kwargs)
+
+
+async def test_retry_server_errors(iss: FakeISS) -> None:
+    scheduler = make_scheduler()
+    iss.failures["/flaky"] = 2
+    assert await scheduler.get_json(iss.session, iss.url + "/flaky") == {"ok": True}
+    assert iss.hits["/flaky"] == 3
+    assert scheduler.host(iss.url).retries == 2
+    assert scheduler.host(iss.url).breaker.state == "closed"
+
+
+async def test_retries_exhausted(iss: FakeISS) -> None:
+    scheduler = make_scheduler(retries=2)
+    iss.failures["/flaky"] = 10
+    with pytest.raises(aiohttp.ClientResponseError) as error:
+        await scheduler.get_json(iss.session, iss.url + "/flaky")
+    assert error.value.status == 503
+    assert iss.hits["/flaky"] == 3
+
+
+async def test_retry_after(iss: FakeISS) -> None:
+    scheduler = make_scheduler(backoff=10, backoff_max=10)
+    iss.failures["/limited"] = 2
+    start = time.monotonic()
+    assert await scheduler.get_json(iss.session, iss.url + "/limited") == {"ok": True}
+    # Retry-After: 0 of the server overrides the local backoff
+    assert time.monotonic() - start < 1
+    assert iss.hits["/limited"] == 3
+
+
+async def test_client_errors_are_not_retried(iss: FakeISS) -> None:
+    scheduler = make_scheduler()
+    with pytest.raises(aiohttp.ClientResponseError) as error:
+        await scheduler.request(iss.session, "GET", iss.url + "/missing")
+    assert error.value.status == 404
+    assert iss.hits["/missing"] == 1
+    assert scheduler.host(iss.url).breaker.state == "closed"
+
+
+async def test_bounded_in_flight(iss: FakeISS) -> None:
+    scheduler = make_scheduler(in_flight=3)
+    await asyncio.gather(*(scheduler.get_json(iss.session, iss.url + "/slow") for _ in range(12)))
+    assert iss.hits["/slow"] == 12
+    assert iss.max_in_flight <= 3
+
+
+async def test_rate_limit(iss: FakeISS) -> None:
+    scheduler = make_scheduler(rate=50, burst=1)
+    start = time.monotonic()
+    await asyncio.gather(*(scheduler.get_json(iss.session, iss.url + "/flaky") for _ in range(6)))
+    # The first request takes the burst token, every next one waits 1 / rate
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+async def test_circuit_breaker(iss: FakeISS) -> None:
+    scheduler = make_scheduler(retries=0, failure_threshold=3, reset_timeout=0.1)
+    iss.failures["/flaky"] = 3
+    for _ in range(3):
+        with pytest.raises(aiohttp.ClientResponseError):
+            await scheduler.get_json(iss.session, iss.url + "/flaky")
+    assert scheduler.host(iss.url).breaker.state == "open"
+
+    # Outage fails fast without reaching the host
+    with pytest.raises(CircuitOpen):
+        await scheduler.get_json(iss.session, iss.url + "/flaky")
+    assert iss.hits["/flaky"] == 3
+    assert scheduler.host(iss.url).rejected == 1
+
+    # A single probe passes after reset timeout and closes the circuit
+    await asyncio.sleep(0.1)
+    assert await scheduler.get_json(iss.session, iss.url + "/flaky") == {"ok": True}
+    assert scheduler.host(iss.url).breaker.state == "closed"
+
+
+async def test_failed_probe_reopens_circuit(iss: FakeISS) -> None:
+    scheduler = make_scheduler(retries=0, failure_threshold=1, reset_timeout=0.05)
+    iss.failures["/flaky"] = 2
+    with pytest.raises(aiohttp.ClientResponseError):
+        await scheduler.get_json(iss.session, iss.url + "/flaky")
+    await asyncio.sleep(0.05)
+    with pytest.raises(aiohttp.ClientResponseError):
+        await scheduler.get_json(iss.session, iss.url + "/flaky")
+    with pytest.raises(CircuitOpen):
+        await scheduler.get_json(iss.session, iss.url + "/flaky")
+    assert iss.hits["/flaky"] == 2
+
+
+async def test_moex_download_through_scheduler(iss: FakeISS) -> None:
+    scheduler = make_scheduler()
+    aggregator = MOEX(scheduler, iss_url=iss.url + "/iss")
+    iss.failures[CANDLES_PATH] = 1
+    start = datetime(2023, 10, 2, 10, tzinfo=MOEX_TIMEZONE)
+    try:
+        df = await aggregator.download_data("SBER", start, start + timedelta(days=1), "minute")
+    finally:
+        await aggregator.close()
+    assert len(df) == CANDLES
+    assert df.index.is_monotonic_increasing
+    assert df.index[0] == int(start.timestamp())
+    assert (df[Column.mean.value] == 101.).all()
+    # One retry and a request per page, the last page is empty
+    assert iss.hits[CANDLES_PATH] == 1 + CANDLES // PAGE + 2
+
+
+async def test_moex_passport_is_reused_till_rejected(iss: FakeISS) -> None:
+    aggregator = MOEXAnalytical(make_scheduler(), iss_url=iss.url + "/iss", passport_url=iss.url + "/passport")
+    start = datetime(2023, 10, 2, tzinfo=MOEX_TIMEZONE)
+    try:
+        for _ in range(3):
+            df = await aggregator.download_data("si", start, start, "hour")
+            assert df[Column.long.value].tolist() == [100.]
+        assert iss.hits["/passport"] == 1
+        assert iss.hits[FUTOI_PATH] == 3
+
+        # Passport revoked before it was expected to expire
+        iss.certificates.clear()
+        df = await aggregator.download_data("si", start, start, "hour")
+        assert df[Column.short.value].tolist() == [50.]
+        assert iss.hits["/passport"] == 2
+        assert iss.hits[FUTOI_PATH] == 5
+    finally:
+        await aggregator.close()
+
+
+def test_session_of_previous_loop_is_closed() -> None:
+    aggregator = MOEX()
+
+    async def session() -> aiohttp.ClientSession:
+        return aggregator.get_session()
+
+    first = asyncio.run(session())
+    second = asyncio.run(session())
+    assert first.closed and not second.closed
+    asyncio.run(aggregator.close())
+    assert second.closed
@@ -0,0 +1,59 @@
+import logging.config
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.config import LOGGER_CONFIG
+from src.enums import AggregatorName, Column
+from src.fetch_planner import MOEX_TIMEZONE
+from src.retention import Compactor
+from src.store_keeper import StoreKeeper
+from src.tickers_naming import TickerNaming
+
+logging.config.dictConfig(LOGGER_CONFIG)
+
+NOW = datetime(2023, 10, 20, 12, tzinfo=MOEX_TIMEZONE)
+MINUTES = TickerNaming("RETENTIONTEST", AggregatorName.moex, "minute")
+HOURS = TickerNaming("RETENTIONTEST", AggregatorName.moex, "hour")
+
+
+def minute_candles(days: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    # Trading hours of every day, the first hour starts in the middle
+    index = np.array([int((NOW - timedelta(days=day, hours=hour, minutes=minute)).timestamp())
+                      for day in range(1, days + 1) for hour in range(10) for minute in range(60)])
+    index = np.sort(index)[30:]
+    mean = 100 + np.cumsum(rng.normal(0, 0.1, len(index)))
+    return pd.DataFrame({Column.mean.value: mean, Column.vol.value: rng.integers(1, 100, len(index)).astype(float),
+                         Column.high.value: mean + 0.5, Column.low.value: mean - 0.5},
+                        index=pd.Index(index, name=Column.index.value))
+
+
+async def test_old_minutes_are_rolled_up_and_deleted(database: Path) -> None:
+    store_keeper = StoreKeeper(database)
+    df = minute_candles(12)
+    store_keeper.add_ticker_to_db(MINUTES, df)
+    store_keeper.add_coverage(MINUTES, float(df.index[0]), NOW.timestamp())
+    cutoff = (NOW - timedelta(days=7)).timestamp()
+
+    compactor = Compactor(store_keeper, retention={"minute": (7, "hour")}, chunk=1000)
+    report = await compactor.run(NOW, [MINUTES])
+
+    old = df[df.index < cutoff]
+    assert report.rows_deleted == len(old)
+    assert report.bytes_reclaimed > 0 and report.bytes_returned > 0
+    assert store_keeper.get_ticker_from_db(MINUTES, 0, NOW.timestamp()).index.min() >= cutoff
+    assert store_keeper.get_coverage(MINUTES) == [(cutoff, NOW.timestamp())]
+
+    # Hours are rolled up from complete minutes only, the half stored first hour is skipped
+    expected = StoreKeeper.resample_candles(old, "hour").iloc[1:]
+    hours = store_keeper.get_ticker_from_db(HOURS, 0, NOW.timestamp())
+    assert report.rows_rolled_up == len(expected) == len(hours)
+    pd.testing.assert_frame_equal(hours[expected.columns], expected, check_dtype=False)
+    assert store_keeper.get_coverage(HOURS) == [(float(expected.index[0]), cutoff)]
+
+    # Nothing is left to compact
+    assert (await compactor.run(NOW, [MINUTES])).rows_deleted == 0
+    await store_keeper.close()
@@ -0,0 +1,61 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.rolling import RollingWindow, FUNCTIONS
+
+
+def expected(series: pd.Series, length: int, function: str) -> float:
+    return getattr(series.tail(length), function)()
+
+
+def assert_same(actual: float, reference: float) -> None:
+    if math.isnan(reference):
+        assert math.isnan(actual)
+    else:
+        assert actual == pytest.approx(reference, rel=1e-9, abs=1e-9)
+
+
+# Candles arrive with gaps, some values are missing and candles after final are revised until they become final
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("function", FUNCTIONS)
+def test_rolling_window_matches_pandas(seed: int, function: str) -> None:
+    rng = np.random.default_rng(seed)
+    count = 600
+    timestamps = np.cumsum(rng.integers(1, 4, count)) * 60
+    values = rng.normal(100, 10, count)
+    values[rng.random(count) < 0.1] = np.nan
+    length = int(rng.integers(1, 50))
+    # Candles of the last delay seconds may change
+    delay = int(rng.integers(0, 5)) * 60
+    window = RollingWindow(length, function)
+
+    moment = timestamps[0]
+    while moment < timestamps[-1]:
+        moment += int(rng.integers(1, 5)) * 60
+        final = moment - delay
+        open_candles = (final <= timestamps) & (timestamps <= moment)
+        values[open_candles] += rng.normal(0, 1, open_candles.sum())
+        visible = (moment - length * 180 <= timestamps) & (timestamps <= moment)
+        series = pd.Series(values[visible], index=pd.Index(timestamps[visible], name="datetime"))
+        assert_same(window.update(series, final), expected(series, length, function))
+
+
+@pytest.mark.parametrize("function", FUNCTIONS)
+def test_rolling_window_rebuilds_on_changed_history(function: str) -> None:
+    series = pd.Series(np.arange(10, dtype=float), index=pd.Index(np.arange(10) * 60))
+    window = RollingWindow(5, function)
+    assert_same(window.update(series, 600), expected(series, 5, function))
+
+    # The last final candle disappeared
+    series = pd.concat([series.drop(540), pd.Series([3.], index=[600])])
+    assert_same(window.update(series, 660), expected(series, 5, function))
+    assert window.rebuilds == 1
+
+
+def test_rolling_window_empty() -> None:
+    series = pd.Series([], dtype=float, index=pd.Index([], dtype=np.int64))
+    for function in FUNCTIONS:
+        assert_same(RollingWindow(3, function).update(series, 0), expected(series, 3, function))
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.condition_parser import parse_condition
+from src.fetch_planner import MOEX_TIMEZONE
+from src.scheduler import EvaluationScheduler, next_boundary
+from src.trading_calendar import TradingCalendar
+
+
+def moscow(*args) -> datetime:
+    return datetime(*args, tzinfo=MOEX_TIMEZONE)
+
+
+@pytest.mark.parametrize(
+    "moment, timespan, boundary",
+    [
+        # Friday 2023-10-20
+        (moscow(2023, 10, 20, 12, 0, 30), "minute", moscow(2023, 10, 20, 12, 1)),
+        (moscow(2023, 10, 20, 12, 0, 30), "hour", moscow(2023, 10, 20, 13)),
+        (moscow(2023, 10, 20, 23, 49, 10), "minute", moscow(2023, 10, 20, 23, 50)),
+        # Night and weekend are skipped
+        (moscow(2023, 10, 20, 23, 50), "minute", moscow(2023, 10, 23, 6, 51)),
+        (moscow(2023, 10, 20, 23, 50), "hour", moscow(2023, 10, 21)),
+        (moscow(2023, 10, 21, 0, 10), "hour", moscow(2023, 10, 23, 7)),
+        (moscow(2023, 10, 20, 12), "day", moscow(2023, 10, 21)),
+        (moscow(2023, 10, 21, 12), "day", moscow(2023, 10, 24)),
+        (moscow(2023, 10, 21, 12), "week", moscow(2023, 10, 23)),
+        (moscow(2023, 11, 15), "month", moscow(2023, 12, 1)),
+        (moscow(2023, 11, 15), "quarter", moscow(2024, 1, 1)),
+    ]
+)
+def test_next_boundary(moment: datetime, timespan: str, boundary: datetime) -> None:
+    assert next_boundary(moment, timespan, TradingCalendar()) == boundary
+
+
+def test_groups_are_due_after_their_candles_close() -> None:
+    scheduler = EvaluationScheduler(interval=30, grace=5)
+    scheduler.add(1, parse_condition("#SBER.mean[C] > 1"))
+    scheduler.add(2, parse_condition("#SBER.mean[3H].max() > 1"), delay=timedelta(minutes=15))
+    scheduler.add(3, parse_condition("#GAZP.mean[D] > #GAZP.mean[2D].min()"))
+    now = moscow(2023, 10, 20, 12, 3)
+
+    # New notifications are evaluated at once, updates of hour and day series wait for their candles
+    assert scheduler.select([1, 2, 3], now) == {1, 2, 3}
+    assert scheduler.select([1, 2, 3], now + timedelta(minutes=1)) == {1}
+    # The hour candle closed at 12:00 is published at 12:15
+    assert scheduler.seconds_until_due(now) == (timedelta(minutes=12) + timedelta(seconds=5)).total_seconds()
+    assert scheduler.select([], moscow(2023, 10, 20, 12, 15, 5)) == {2}
+    assert scheduler.select([], moscow(2023, 10, 20, 12, 16)) == set()
+    assert scheduler.select([], moscow(2023, 10, 20, 13, 15, 5)) == {2}
+    # Missed candles are caught up by a single evaluation
+    assert scheduler.select([], moscow(2023, 10, 21, 0, 0, 5)) == {2, 3}
+    assert scheduler.select(None, now) == {1, 2, 3}
+
+    scheduler.remove(2)
+    assert scheduler.select([1, 2], moscow(2023, 10, 20, 15)) == {1}
+    assert scheduler.evaluated == 3 + 1 + 1 + 1 + 2 + 3 + 1
+
+
+@pytest.mark.parametrize(
+    "now, upcoming",
+    [
+        (moscow(2023, 10, 20, 12, 3), (moscow(2023, 10, 20, 13, 0, 5), {2, 3})),
+        (moscow(2023, 10, 20, 23, 55), (moscow(2023, 10, 21, 0, 0, 5), {2, 3, 4})),
+    ]
+)
+def test_upcoming_groups(now: datetime, upcoming: tuple) -> None:
+    scheduler = EvaluationScheduler(interval=30, grace=5)
+    assert scheduler.upcoming(now) is None
+    scheduler.add(1, parse_condition("#SBER.mean[C] > 1"))
+    scheduler.add(2, parse_condition("#SBER.mean[H] > 1"))
+    scheduler.add(3, parse_condition("#GAZP.mean[2H].max() > 1"))
+    scheduler.add(4, parse_condition("#GAZP.mean[D] > 1"))
+    # Groups following updates are never due
+    assert scheduler.upcoming(now) == upcoming
+
+
+def test_group_is_due_again_once_its_delay_changes() -> None:
+    scheduler = EvaluationScheduler(interval=30, grace=5)
+    now = moscow(2023, 10, 20, 12, 3)
+    scheduler.add(1, parse_condition("#SBER.mean[H] > 1"))
+    assert scheduler.upcoming(now)[0] == moscow(2023, 10, 20, 13, 0, 5)
+    scheduler.add(2, parse_condition("#GAZP.mean[H] > 1"), delay=timedelta(minutes=15))
+    assert scheduler.upcoming(now)[0] == moscow(2023, 10, 20, 12, 15, 5)
+    scheduler.remove(2)
+    assert scheduler.upcoming(now)[0] == moscow(2023, 10, 20, 13, 0, 5)
@@ -1,9 +1,18 @@
 import logging.config
+from dataclasses import replace
+from datetime import datetime
 
+import numpy as np
+import pandas as pd
 import pytest
 
+from src.aggregators import Aggregator
 from src.config import LOGGER_CONFIG
+from src.enums import AggregatorName, Column
+from src.fetch_planner import MOEX_TIMEZONE
 from src.store_keeper import StoreKeeper
+from src.tickers_naming import TickerNaming
+from src.trading_calendar import TradingCalendar
 
 logging.config.dictConfig(LOGGER_CONFIG)
 
@@ -11,6 +20,7 @@ logging.config.dictConfig(LOGGER_CONFIG)
 CHAT_ID = 0
 CONDITION = "async def __ex():\n return False"
 ORIGIN_CONDITION = "False"
+NOW = datetime(2023, 10, 20, 12, 0, 30, tzinfo=MOEX_TIMEZONE)
 
 
 @pytest.mark.parametrize(
@@ -34,6 +44,7 @@ def test_add_notification(chat_id: int, condition: str, origin_condition: str) -
 )
 def test_get_notifications(chat_id: int, condition: str, origin_condition: str) -> None:
     store_keeper = StoreKeeper()
+    store_keeper.add_notification(chat_id, condition, origin_condition)
     notifications = store_keeper.get_notifications(chat_id)
     assert notifications
     notification = [val for val in notifications.values()][0]
@@ -50,9 +61,214 @@ def test_get_notifications(chat_id: int, condition: str, origin_condition: str)
 )
 def test_remove_notification(chat_id: int) -> None:
     store_keeper = StoreKeeper()
+    store_keeper.add_notification(chat_id, CONDITION, ORIGIN_CONDITION)
     notifications = store_keeper.get_notifications(chat_id)
     assert notifications
     notification = [val for val in notifications.values()][0]
     store_keeper.remove_notification(notification.id)
     notifications = store_keeper.get_notifications(chat_id)
     assert not notifications
+
+
+# Fails the given number of first downloads, then returns a candle at the start of every requested minute
+class FlakyAggregator(Aggregator):
+    def __init__(self, failures: int = 1):
+        super().__init__()
+        self.failures = failures
+        self.requests = []
+
+    async def download_data(self, symbol: str, start: datetime, end: datetime, interval: str,
+                            *args, **kwargs) -> pd.DataFrame | None:
+        self.requests.append((start, end))
+        if len(self.requests) <= self.failures:
+            raise TimeoutError()
+        return self.candles(start.timestamp(), end.timestamp())
+
+    @staticmethod
+    def candles(start: float, end: float) -> pd.DataFrame:
+        index = np.arange(int(start) // 60 * 60, end + 1, 60, dtype=np.int64)
+        return pd.DataFrame({Column.mean.value: np.ones(len(index))}, index=pd.Index(index, name=Column.index.value))
+
+
+async def test_tail_of_series_not_stored_yet(monkeypatch) -> None:
+    monkeypatch.setattr("src.store_keeper.moex_now", lambda: NOW)
+    aggregator = FlakyAggregator()
+    store_keeper = StoreKeeper(aggregators={AggregatorName.moex.value: aggregator})
+    store_keeper.calendar = TradingCalendar(sessions=dict())
+    naming = TickerNaming("TAILTEST", AggregatorName.moex, "minute")
+
+    with pytest.raises(TimeoutError):
+        await store_keeper.tail(naming)
+    # The last final candle and the open ones are downloaded, and the series is tailed from then on
+    df = await store_keeper.tail(naming)
+    final = NOW.replace(second=0).timestamp()
+    assert df.index[0] == final - 60
+    assert store_keeper.get_coverage(naming) == [(final - 60, final)]
+    await store_keeper.tail(naming)
+    assert aggregator.requests[-1][0].timestamp() == final
+    await store_keeper.close()
+
+
+async def test_read_only_store_keeper_reads_what_another_one_stored(monkeypatch) -> None:
+    monkeypatch.setattr("src.store_keeper.moex_now", lambda: NOW)
+    naming = TickerNaming("READTEST", AggregatorName.moex, "minute")
+    writer = StoreKeeper(aggregators={AggregatorName.moex.value: FlakyAggregator()})
+    aggregator = FlakyAggregator()
+    reader = StoreKeeper(aggregators={AggregatorName.moex.value: aggregator}, read_only=True)
+    start, end = NOW.replace(second=0).timestamp() - 600, NOW.replace(second=0).timestamp()
+
+    assert await reader.async_get_range(naming, start, end) is None
+    writer.add_ticker_to_db(naming, FlakyAggregator.candles(start, end - 300))
+    assert len(await reader.async_get_range(naming, start, end)) == 6
+    # Cached candles of the series are dropped once the writer reports it
+    writer.add_ticker_to_db(naming, FlakyAggregator.candles(end - 240, end))
+    assert len(await reader.async_get_range(naming, start, end)) == 6
+    reader.forget(writer.get_storing_name(naming))
+    assert len(await reader.async_get_range(naming, start, end)) == 11
+    assert not aggregator.requests
+    await writer.close()
+    await reader.close()
+
+
+# Records requests, nothing is traded
+class ClosedAggregator(Aggregator):
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    async def download_data(self, symbol: str, start: datetime, end: datetime, interval: str,
+                            *args, **kwargs) -> pd.DataFrame | None:
+        self.requests.append((start, end, kwargs["engine"], kwargs["market"]))
+        return None
+
+
+async def test_closed_market_is_skipped_once_a_download_confirms_it(monkeypatch) -> None:
+    monkeypatch.setattr("src.store_keeper.moex_now", lambda: datetime(2023, 10, 21, 12, tzinfo=MOEX_TIMEZONE))
+    aggregator = ClosedAggregator()
+    store_keeper = StoreKeeper(aggregators={AggregatorName.moex.value: aggregator})
+    naming = TickerNaming("SiZ3", AggregatorName.moex, "minute")
+
+    # Confirmations which expire at once don't skip anything
+    store_keeper.closed_ttl = 0
+    await store_keeper.tail(naming)
+    await store_keeper.tail(naming)
+    assert len(aggregator.requests) == 2
+    store_keeper.closed_ttl = 60
+    await store_keeper.tail(naming)
+    await store_keeper.tail(naming)
+    assert len(aggregator.requests) == 3
+    assert store_keeper.closed_skips == 1
+    assert store_keeper.closed_for(naming) > 0
+    # Futures are downloaded from their market
+    assert aggregator.requests[-1][2:] == ("futures", "forts")
+    await store_keeper.close()
+
+
+@pytest.mark.parametrize(
+    "coverage, start, end, missing",
+    [
+        ([], 0, 100, [(0, 100)]),
+        ([(0, 100)], 10, 90, []),
+        ([(0, 60), (100, 120)], 30, 150, [(60, 100), (120, 150)]),
+        ([(0, 60), (60, 120)], 0, 100, []),
+        # Coverage ends before its end, the candle starting at the end is missing
+        ([(0, 100)], 50, 100, [(100, 100)]),
+        ([(0, 100)], 50, 99, []),
+        ([(50, 100)], 0, 40, [(0, 40)]),
+    ]
+)
+def test_get_missing_intervals(coverage: list, start: float, end: float, missing: list) -> None:
+    assert StoreKeeper.get_missing_intervals(coverage, start, end) == missing
+
+
+@pytest.mark.parametrize(
+    "added, coverage",
+    [
+        ([(0, 60)], [(0, 60)]),
+        ([(0, 60), (100, 120)], [(0, 60), (100, 120)]),
+        # Touching and overlapping ranges are merged
+        ([(0, 60), (60, 120)], [(0, 120)]),
+        ([(100, 120), (0, 60), (50, 110)], [(0, 120)]),
+        ([(0, 60), (100, 120), (200, 210), (30, 150)], [(0, 150), (200, 210)]),
+        ([(0, 100), (10, 20)], [(0, 100)]),
+    ]
+)
+def test_merge_coverage(added: list, coverage: list) -> None:
+    store_keeper = StoreKeeper()
+    naming = TickerNaming("MERGETEST", AggregatorName.moex, "minute")
+    for start, end in added:
+        store_keeper.merge_coverage(naming, start, end)
+    assert store_keeper.get_coverage(naming) == coverage
+
+
+async def test_covered_window_is_not_downloaded_again(monkeypatch) -> None:
+    monkeypatch.setattr("src.store_keeper.moex_now", lambda: NOW)
+    aggregator = FlakyAggregator(failures=0)
+    store_keeper = StoreKeeper(aggregators={AggregatorName.moex.value: aggregator})
+    naming = TickerNaming("COVERTEST", AggregatorName.moex, "minute")
+    final = NOW.replace(second=0).timestamp()
+    start, end = final - 600, final - 1
+
+    assert len(await store_keeper.async_get_range(naming, start, end)) == 10
+    assert store_keeper.get_coverage(naming) == [(start, final)]
+    store_keeper.candle_cache.invalidate(store_keeper.get_storing_name(naming))
+    assert len(await store_keeper.async_get_range(naming, start, end)) == 10
+    assert len(aggregator.requests) == 1
+    # Only candles before the covered ones are downloaded
+    assert len(await store_keeper.async_get_range(naming, start - 300, end)) == 15
+    assert [(request[0].timestamp(), request[1].timestamp()) for request in aggregator.requests] == \
+        [(start, end), (start - 300, start)]
+    await store_keeper.close()
+
+
+def moscow_timestamp(*args) -> int:
+    return int(datetime(*args, tzinfo=MOEX_TIMEZONE).timestamp())
+
+
+# Minutes of a Friday morning and late evening, after midnight in UTC, and of the next Monday morning
+MINUTES = pd.DataFrame(
+    {Column.mean.value: [1., 3., 5., 7.], Column.vol.value: [1., 2., 3., 4.],
+     Column.high.value: [2., 5., 6., 8.], Column.low.value: [0., 1., 4., 6.]},
+    index=pd.Index([moscow_timestamp(2023, 10, 20, 10), moscow_timestamp(2023, 10, 20, 10, 1),
+                    moscow_timestamp(2023, 10, 20, 22, 30), moscow_timestamp(2023, 10, 23, 9)],
+                   name=Column.index.value))
+
+
+@pytest.mark.parametrize(
+    "timespan, index, rows",
+    [
+        ("hour", [moscow_timestamp(2023, 10, 20, 10), moscow_timestamp(2023, 10, 20, 22),
+                  moscow_timestamp(2023, 10, 23, 9)],
+         [[2., 3., 5., 0.], [5., 3., 6., 4.], [7., 4., 8., 6.]]),
+        # Days start at midnight in Moscow, days without candles are dropped
+        ("day", [moscow_timestamp(2023, 10, 20), moscow_timestamp(2023, 10, 23)],
+         [[3., 6., 6., 0.], [7., 4., 8., 6.]]),
+        # Weeks start on Monday
+        ("week", [moscow_timestamp(2023, 10, 16), moscow_timestamp(2023, 10, 23)],
+         [[3., 6., 6., 0.], [7., 4., 8., 6.]]),
+    ]
+)
+def test_resample_candles(timespan: str, index: list, rows: list) -> None:
+    expected = pd.DataFrame(rows, columns=MINUTES.columns, index=pd.Index(index, name=Column.index.value))
+    pd.testing.assert_frame_equal(StoreKeeper.resample_candles(MINUTES, timespan), expected, check_dtype=False)
+
+
+async def test_hours_are_derived_from_stored_minutes_or_downloaded(monkeypatch) -> None:
+    monkeypatch.setattr("src.store_keeper.moex_now", lambda: NOW)
+    aggregator = FlakyAggregator(failures=0)
+    store_keeper = StoreKeeper(aggregators={AggregatorName.moex.value: aggregator})
+    start, end = moscow_timestamp(2023, 10, 20, 10), moscow_timestamp(2023, 10, 20, 11)
+
+    minutes = TickerNaming("DERIVETEST", AggregatorName.moex, "minute")
+    store_keeper.add_ticker_to_db(minutes, FlakyAggregator.candles(start, end + 3599))
+    store_keeper.add_coverage(minutes, start, end + 3600)
+    df = await store_keeper.async_get_range(replace(minutes, timespan="hour"), start, end)
+    assert df.index.tolist() == [start, end]
+    assert df[Column.mean.value].tolist() == [1., 1.]
+    assert not aggregator.requests
+
+    # Hours of a series without stored minutes are downloaded
+    hours = TickerNaming("NATIVETEST", AggregatorName.moex, "hour")
+    await store_keeper.async_get_range(hours, start, end)
+    assert len(aggregator.requests) == 1
+    await store_keeper.close()
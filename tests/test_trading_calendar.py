@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+
+from src.fetch_planner import MOEX_TIMEZONE
+from src.trading_calendar import TradingCalendar
+
+SHARES = ("stock", "shares")
+FUTURES = ("futures", "forts")
+
+
+def moscow(*args) -> datetime:
+    return datetime(*args, tzinfo=MOEX_TIMEZONE)
+
+
+@pytest.mark.parametrize(
+    "start, end, market, expected",
+    [
+        (moscow(2023, 10, 20, 12), moscow(2023, 10, 20, 12, 1), SHARES, True),
+        # Night, weekend and holiday
+        (moscow(2023, 10, 20, 23, 50), moscow(2023, 10, 21, 6, 50), SHARES, False),
+        (moscow(2023, 10, 21), moscow(2023, 10, 23), SHARES, False),
+        (moscow(2023, 10, 21), moscow(2023, 10, 23, 6, 51), SHARES, True),
+        (moscow(2023, 11, 4, 10), moscow(2023, 11, 4, 12), FUTURES, False),
+        (moscow(2024, 5, 9), moscow(2024, 5, 10), SHARES, False),
+        # Clearing of futures
+        (moscow(2023, 10, 20, 14), moscow(2023, 10, 20, 14, 5), FUTURES, False),
+        (moscow(2023, 10, 20, 7), moscow(2023, 10, 20, 8), FUTURES, False),
+        (moscow(2023, 10, 20, 7), moscow(2023, 10, 20, 8), SHARES, True),
+        (moscow(2023, 10, 20, 7), moscow(2023, 10, 20, 8), None, True),
+        # Sessions of unknown markets are unknown
+        (moscow(2023, 10, 21), moscow(2023, 10, 22), ("currency", "selt"), True),
+    ]
+)
+def test_has_trading(start: datetime, end: datetime, market, expected: bool) -> None:
+    assert TradingCalendar().has_trading(start, end, market) == expected
+
+
+def test_next_opening() -> None:
+    calendar = TradingCalendar()
+    assert calendar.next_opening(moscow(2023, 10, 20, 23, 55), SHARES) == moscow(2023, 10, 23, 6, 50)
+    assert calendar.next_opening(moscow(2023, 10, 20, 14, 1), FUTURES) == moscow(2023, 10, 20, 14, 5)
+    assert calendar.next_opening(moscow(2023, 10, 20, 14, 1), ("currency", "selt")) is None
+    assert not calendar.is_open(moscow(2023, 10, 20, 18, 55), SHARES)
+    assert calendar.is_open(moscow(2023, 10, 20, 19, 5), SHARES)